@@ -72,6 +72,18 @@ setup(
     },
     tests_require=TESTS_REQUIRE,
     extras_require={
-        "tests": TESTS_REQUIRE
+        "tests": TESTS_REQUIRE,
+        "aiohttp": [
+            'aiohttp>=3.8; python_version >= "3.6"',
+        ],
+        "orjson": [
+            'orjson; python_version >= "3.6"',
+        ],
+        "fastjsonschema": [
+            'fastjsonschema>=2.19; python_version >= "3.7"',
+        ],
+        "stream": [
+            'ijson>=3.1; python_version >= "3.5"',
+        ],
     }
 )
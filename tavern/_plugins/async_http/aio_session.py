@@ -0,0 +1,370 @@
+"""Session for the aiohttp backend
+
+This module needs Python 3.6+ and aiohttp 3.8+, so it is only imported when
+a session is actually created - see tavernhook.py.
+
+Requests are sent on one event loop, whichever thread they come from. Test
+blocks run at the same time with tavern-aiohttp-concurrency (see
+testutils/concurrency.py), 'parallel' stage groups and
+tavern-setup-concurrency each wait in their own thread, but all of their
+requests are in flight on the loop at once rather than each thread blocking
+on a socket.
+"""
+
+import asyncio
+import atexit
+import datetime
+import logging
+import os
+import ssl
+import threading
+
+import aiohttp
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+
+class _EventLoopThread(object):
+    """Event loop running in a background thread
+
+    Every session sends its requests on this loop using the same connector,
+    so connections to each host are kept open and shared between test
+    blocks, and requests sent from different threads (parallel stage groups,
+    setup tests being run at the same time) are all handled by one thread
+    instead of each blocking its own.
+
+    The loop is started again in a forked process, because the thread running
+    it isn't copied into the child.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._connector = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name="tavern-aiohttp")
+        thread.daemon = True
+        thread.start()
+        started.wait()
+
+        async def create_connector():
+            return aiohttp.TCPConnector()
+
+        self._connector = asyncio.run_coroutine_threadsafe(create_connector(), loop).result()
+        self._loop = loop
+        self._pid = os.getpid()
+
+        logger.debug("Started event loop for aiohttp")
+
+    @property
+    def connector(self):
+        self._get_loop()
+        return self._connector
+
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for the result
+
+        Args:
+            coro (coroutine): coroutine to run
+
+        Returns:
+            object: whatever the coroutine returned
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def close(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+
+            loop = self._loop
+            connector = self._connector
+
+            async def close_connector():
+                await connector.close()
+
+            try:
+                asyncio.run_coroutine_threadsafe(close_connector(), loop).result()
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                self._pid = None
+
+
+event_loop_thread = _EventLoopThread()
+atexit.register(event_loop_thread.close)
+
+
+class _SessionCookies(object):
+    """Wraps the aiohttp cookie jar for clear_session_cookies in 'meta'"""
+
+    def __init__(self, jar):
+        self._jar = jar
+
+    def __iter__(self):
+        return iter(self._jar)
+
+    def __len__(self):
+        return len(self._jar)
+
+    def clear(self):
+        self._jar.clear()
+
+    def clear_session_cookies(self):
+        """Remove cookies without an expiry time"""
+        self._jar.clear(lambda morsel: not (morsel["expires"] or morsel["max-age"]))
+
+
+def _get_timeout(timeout):
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+def _get_ssl(verify):
+    if verify is False:
+        return False
+    elif isinstance(verify, str):
+        # Path to a CA bundle, like requests
+        if os.path.isdir(verify):
+            return ssl.create_default_context(capath=verify)
+        return ssl.create_default_context(cafile=verify)
+
+    return None
+
+
+def _get_params(params):
+    # aiohttp only takes strings, requests converts anything
+    query = []
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for v in values:
+            if v is not None:
+                query.append((str(key), str(v)))
+    return query
+
+
+def _get_form_data(files, data):
+    form = aiohttp.FormData()
+
+    for key, value in (data or {}).items():
+        form.add_field(key, str(value))
+
+    for key, spec in files.items():
+        if isinstance(spec, (tuple, list)):
+            filename, fileobj = spec[:2]
+            content_type = spec[2] if len(spec) > 2 else None
+        else:
+            filename, fileobj, content_type = None, spec, None
+
+        form.add_field(key, fileobj, filename=filename, content_type=content_type)
+
+    return form
+
+
+class _StreamedBody(object):
+    """Body of a response to a request with 'stream: true', which is read
+    from aiohttp as requests.Response.iter_content asks for it
+
+    The connection is released back to the pool once all of the body has been
+    read or the response is closed.
+    """
+
+    def __init__(self, resp):
+        self._resp = resp
+        self.closed = False
+
+    def read(self, size=-1):
+        if self.closed:
+            return b""
+
+        try:
+            data = event_loop_thread.run(self._resp.content.read(size))
+        except asyncio.TimeoutError as e:
+            self.close()
+            raise requests.exceptions.Timeout(e)
+        except aiohttp.ClientError as e:
+            self.close()
+            raise requests.exceptions.ConnectionError(e)
+
+        if not data:
+            self.close()
+        return data
+
+    def close(self):
+        # resp.closed is set once the whole body has been received, which
+        # might be before it has all been read from resp.content
+        if self.closed:
+            return
+        self.closed = True
+
+        async def release():
+            self._resp.release()
+
+        event_loop_thread.run(release())
+
+    def release_conn(self):
+        self.close()
+
+
+def _convert_response(resp, content, elapsed):
+    """Turn an aiohttp response into a requests.Response so that RestResponse
+    can check it in the same way as one from the requests backend
+
+    Args:
+        resp (aiohttp.ClientResponse): response from aiohttp
+        content (bytes): the whole body, or None if it should be read as it
+            is used from resp instead
+        elapsed (datetime.timedelta): time until the response was received
+    """
+    # pylint: disable=protected-access
+    response = requests.Response()
+    response.status_code = resp.status
+    response.reason = resp.reason
+    response.url = str(resp.url)
+    response.encoding = resp.charset
+    response.elapsed = elapsed
+
+    if content is None:
+        response.raw = _StreamedBody(resp)
+    else:
+        response._content = content
+        response._content_consumed = True
+
+    headers = CaseInsensitiveDict()
+    for key in resp.headers:
+        if key not in headers:
+            # Same as requests for headers which are sent more than once
+            headers[key] = ", ".join(resp.headers.getall(key))
+    response.headers = headers
+
+    cookies = RequestsCookieJar()
+    for name, morsel in resp.cookies.items():
+        cookies.set(
+            name,
+            morsel.value,
+            domain=morsel["domain"] or resp.url.host,
+            path=morsel["path"] or "/",
+        )
+    response.cookies = cookies
+
+    return response
+
+
+class AsyncHttpSession(object):
+    """Sends requests with aiohttp
+
+    Has the same request() method as requests.Session, so it can be used with
+    RestRequest.
+
+    Args:
+        kwargs: passed to aiohttp.ClientSession
+    """
+
+    def __init__(self, **kwargs):
+        connector = event_loop_thread.connector
+
+        async def create_session():
+            # Keep cookies set by servers which are only referred to by IP
+            # address, like requests does
+            kwargs.setdefault("cookie_jar", aiohttp.CookieJar(unsafe=True))
+            return aiohttp.ClientSession(
+                connector=connector,
+                connector_owner=False,
+                **kwargs
+            )
+
+        self._session = event_loop_thread.run(create_session())
+        self.cookies = _SessionCookies(self._session.cookie_jar)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if not self._session.closed:
+            event_loop_thread.run(self._session.close())
+
+    async def _request(self, method, url, stream=False, **kwargs):
+        start = datetime.datetime.now()
+
+        if stream:
+            # Left open until the body has been read - see _StreamedBody
+            resp = await self._session.request(method, url, **kwargs)
+            return _convert_response(resp, None, datetime.datetime.now() - start)
+
+        async with self._session.request(method, url, **kwargs) as resp:
+            content = await resp.read()
+            return _convert_response(resp, content, datetime.datetime.now() - start)
+
+    def request(self, method, url, params=None, data=None, headers=None, files=None,
+                auth=None, timeout=None, allow_redirects=True, verify=True, json=None,
+                stream=None):
+        """Send a request and wait for the response
+
+        Arguments are the same as requests.Session.request. If stream is
+        True, the body is read from the connection as it is used, like with
+        requests.
+
+        Returns:
+            requests.Response: the response
+
+        Raises:
+            requests.exceptions.RequestException: if the request couldn't be
+                sent, so that RestRequest handles it the same as the requests
+                backend
+        """
+        # pylint: disable=too-many-arguments
+        kwargs = {
+            "allow_redirects": allow_redirects,
+            "stream": bool(stream),
+        }
+
+        if params:
+            kwargs["params"] = _get_params(params)
+        if headers:
+            kwargs["headers"] = {k: str(v) for k, v in headers.items()}
+        if auth:
+            kwargs["auth"] = aiohttp.BasicAuth(*auth)
+        if timeout is not None:
+            kwargs["timeout"] = _get_timeout(timeout)
+
+        ssl_context = _get_ssl(verify)
+        if ssl_context is not None:
+            kwargs["ssl"] = ssl_context
+
+        if files:
+            kwargs["data"] = _get_form_data(files, data)
+        elif data is not None:
+            kwargs["data"] = data
+        if json is not None:
+            kwargs["json"] = json
+
+        try:
+            return event_loop_thread.run(self._request(method, url, **kwargs))
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(e)
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(e)
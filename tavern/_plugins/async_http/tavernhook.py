@@ -0,0 +1,38 @@
+import logging
+
+from future.utils import raise_from
+
+from tavern._plugins.rest.tavernhook import TavernRestPlugin
+from tavern.util import exceptions
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(**kwargs):
+    """Create a session which sends requests using aiohttp
+
+    aiohttp is only imported here, because every plugin for tavern_http is
+    imported when loading plugins even if a different one is being used.
+    """
+    try:
+        from .aio_session import AsyncHttpSession
+    except (ImportError, SyntaxError) as e:
+        logger.exception("Error importing aiohttp session")
+        raise_from(exceptions.PluginLoadError(
+            "The aiohttp http backend needs Python 3.6+ and aiohttp to be installed (pip install tavern[aiohttp])"), e)
+
+    return AsyncHttpSession(**kwargs)
+
+
+class TavernAsyncHttpPlugin(TavernRestPlugin):
+    """Same as the requests backend, but requests are sent with aiohttp on an
+    event loop shared by all sessions
+
+    Several test blocks can be run at once with --tavern-aiohttp-concurrency -
+    see testutils/concurrency.py
+    """
+
+    session_type = staticmethod(create_session)
+    # Connections are always shared between sessions
+    pooled_session_type = None
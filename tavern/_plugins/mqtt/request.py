@@ -21,7 +21,8 @@ def get_publish_args(rspec, test_block_config):
         Anything else to do here?
     """
 
-    fspec = format_keys(rspec, test_block_config["variables"])
+    # Copied because the formatted spec can share objects with rspec
+    fspec = dict(format_keys(rspec, test_block_config["variables"]))
 
     if "json" in rspec:
         if "payload" in rspec:
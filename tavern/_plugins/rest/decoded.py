@@ -0,0 +1,108 @@
+"""Response wrapper which only decodes the body once
+
+A stage can look at the body of a response several times - logging it,
+putting it into the variables, and in each $ext function used in 'validate'
+and 'save'. Decoding a large JSON body takes much longer than anything else
+done with it, so it is decoded the first time something asks for it and the
+result is shared.
+
+If orjson is installed it is used to decode UTF-8 bodies, falling back to
+requests for anything it can't handle (other encodings, NaN, very big
+integers) so that the result is always the same as response.json().
+"""
+
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+_not_decoded = object()
+
+_utf8_names = {None, "utf-8", "utf8", "UTF-8", "UTF8"}
+
+
+def _decode_json(response):
+    if orjson is not None and getattr(response, "encoding", False) in _utf8_names:
+        try:
+            return orjson.loads(response.content)
+        except ValueError:
+            logger.debug("orjson couldn't decode response, falling back to requests")
+
+    return response.json()
+
+
+class DecodedResponse(object):
+    """Wraps a requests.Response, caching the decoded JSON body and the text
+
+    Anything else is passed through to the wrapped response, so this can be
+    used anywhere the response could be.
+
+    Args:
+        response (requests.Response): response to wrap
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._json = _not_decoded
+        self._json_error = None
+        self._text = None
+
+    @property
+    def response(self):
+        """The wrapped response"""
+        return self._response
+
+    def json(self, **kwargs):
+        """Get the decoded body
+
+        Args:
+            kwargs: passed to json.loads. The result is only cached if
+                there are none.
+
+        Returns:
+            object: decoded body
+
+        Raises:
+            ValueError: if the body isn't valid JSON, every time this is
+                called
+        """
+        if kwargs:
+            return self._response.json(**kwargs)
+
+        if self._json is _not_decoded:
+            try:
+                self._json = _decode_json(self._response)
+            except ValueError as e:
+                self._json = None
+                self._json_error = e
+
+        if self._json_error is not None:
+            raise self._json_error
+
+        return self._json
+
+    @property
+    def text(self):
+        # Working out the encoding can mean running chardet over the body
+        if self._text is None:
+            self._text = self._response.text
+        return self._text
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __bool__(self):
+        return bool(self._response)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return repr(self._response)
+
+    def __str__(self):
+        return str(self._response)
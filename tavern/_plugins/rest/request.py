@@ -16,10 +16,13 @@ from box import Box
 
 from tavern.util import exceptions
 from tavern.util.dict_util import format_keys, check_expected_keys
+from tavern.util.log_utils import Truncated
 from tavern.schemas.extensions import get_wrapped_create_function
 
 from tavern.request.base import BaseRequest
 
+from .streamed import StreamedResponse
+
 logger = logging.getLogger(__name__)
 
 
@@ -134,9 +137,11 @@ def get_request_args(rspec, test_block_config):
     # eg https://openid.net/specs/openid-connect-core-1_0.html#ClaimsParameter
     # > ...represented in an OAuth 2.0 request as UTF-8 encoded JSON (which ends
     # > up being form-urlencoded when passed as an OAuth parameter)
-    for key, value in request_args.get("params", {}).items():
-        if isinstance(value, dict):
-            request_args["params"][key] = quote_plus(json.dumps(value))
+    if "params" in request_args:
+        request_args["params"] = {
+            key: quote_plus(json.dumps(value)) if isinstance(value, dict) else value
+            for key, value in request_args["params"].items()
+        }
 
     for key, val in optional_with_default.items():
         request_args[key] = fspec.get(key, val)
@@ -196,7 +201,7 @@ class RestRequest(BaseRequest):
 
         request_args = get_request_args(rspec, test_block_config)
 
-        logger.info("Request args: %s", request_args)
+        logger.info("Request args: %s", Truncated(request_args))
 
         request_args.update(allow_redirects=False)
 
@@ -267,21 +272,26 @@ class RestRequest(BaseRequest):
             return {}
 
     def run(self):
-        """ Runs the prepared request and times it
+        """ Runs the prepared request
 
-        Todo:
-            time it
+        How long this takes is recorded by run_stage if timing is on
 
         Returns:
-            requests.Response: response object
+            requests.Response: response object. If the request was sent with
+                'stream: true' it is wrapped in a StreamedResponse, so the
+                body can be verified as it is read.
         """
 
         try:
-            return self._prepared()
+            response = self._prepared()
         except requests.exceptions.RequestException as e:
             logger.exception("Error running prepared request")
             raise_from(exceptions.RestRequestException, e)
 
+        if self._request_args.get("stream"):
+            return StreamedResponse(response)
+        return response
+
     @property
     def request_vars(self):
         return Box(self._request_args)
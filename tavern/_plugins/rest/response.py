@@ -10,9 +10,15 @@ except ImportError:
 from tavern.schemas.extensions import get_wrapped_response_function
 from tavern.util.dict_util import deep_dict_merge, format_keys, recurse_set_value
 from tavern.util.exceptions import TestFailError
+from tavern.util.log_utils import log_settings, preview_bytes
 from tavern.util.comparator_util import comparators
+from tavern.util.built_in import clear_list_indexes
+from tavern.util.timing import stage_timings
 from tavern.response.base import BaseResponse, indent_err_text
 
+from .decoded import DecodedResponse
+from .streamed import StreamedResponse, get_body_paths
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,33 +63,43 @@ class RestResponse(BaseResponse):
         else:
             return "<Not run yet>"
 
-    def _verbose_log_response(self, response):
-        """Verbosely log the response object, with query params etc."""
+    def _verbose_log_response(self, response, redirect_query_params, log_body=True):
+        """Verbosely log the response object, with query params etc.
+
+        Nothing is built unless INFO logging is on. A body bigger than
+        log_settings.body_limit is logged as the start of the raw body instead
+        of being decoded and formatted. If log_body is False (because the body
+        is going to be streamed) it isn't logged at all.
+        """
+        if not logger.isEnabledFor(logging.INFO):
+            return
 
         logger.info("Response: '%s'", response)
 
         def log_dict_block(block, name):
             if block:
-                to_log = name + ":"
-
                 if isinstance(block, list):
-                    for v in block:
-                        to_log += "\n  - {}".format(v)
+                    lines = ["  - {}".format(v) for v in block]
                 elif isinstance(block, dict):
-                    for k, v in block.items():
-                        to_log += "\n  {}: {}".format(k, v)
+                    lines = ["  {}: {}".format(k, v) for k, v in block.items()]
                 else:
-                    to_log += "\n {}".format(block)
-                logger.info(to_log)
+                    lines = [" {}".format(block)]
+                logger.info("%s:\n%s", name, "\n".join(lines))
 
         log_dict_block(response.headers, "Headers")
 
-        try:
-            log_dict_block(response.json(), "Body")
-        except ValueError:
-            pass
+        if not log_body:
+            logger.info("Body: <streamed>")
+        else:
+            content = getattr(response, "content", None) or b""
+            if log_settings.body_limit and len(content) > log_settings.body_limit:
+                logger.info("Body:\n %s", preview_bytes(content, getattr(response, "encoding", None)))
+            else:
+                try:
+                    log_dict_block(response.json(), "Body")
+                except ValueError:
+                    pass
 
-        redirect_query_params = self._get_redirect_query_params(response)
         if redirect_query_params:
             parsed_url = urlparse(response.headers["location"])
             to_path = "{0}://{1}{2}".format(*parsed_url)
@@ -109,11 +125,16 @@ class RestResponse(BaseResponse):
 
         return redirect_query_params
 
+    def _is_expected_status_code(self, status_code):
+        expected_code = self.expected["status_code"]
+
+        return (isinstance(expected_code, int) and status_code == expected_code) or \
+            (isinstance(expected_code, list) and (status_code in expected_code))
+
     def _check_status_code(self, status_code, body):
         expected_code = self.expected["status_code"]
 
-        if (isinstance(expected_code, int) and status_code == expected_code) or \
-                (isinstance(expected_code, list) and (status_code in expected_code)):
+        if self._is_expected_status_code(status_code):
             logger.debug("Status code '%s' matched expected '%s'",
                          status_code, expected_code)
             return True
@@ -150,18 +171,35 @@ class RestResponse(BaseResponse):
         """
         # pylint: disable=too-many-statements
 
-        self._verbose_log_response(response)
+        # Everything which looks at the body from here on, including $ext
+        # functions, shares one decoded copy of it
+        if not isinstance(response, DecodedResponse):
+            response = DecodedResponse(response)
+
+        # Lists in the last response won't be looked in again
+        clear_list_indexes()
+
+        # With 'stream: true', only decode the parts of the body which are used
+        body_paths = None
+        if isinstance(response, StreamedResponse) and self._is_expected_status_code(response.status_code):
+            body_paths = get_body_paths(self.expected)
+
+        redirect_query_params = self._get_redirect_query_params(response)
+
+        self._verbose_log_response(response, redirect_query_params, log_body=body_paths is None)
 
         self.response = response
         self.status_code = response.status_code
 
         try:
-            body = response.json()
+            with stage_timings.phase("decode"):
+                if body_paths is not None:
+                    body = response.stream_json(body_paths)
+                else:
+                    body = response.json()
         except ValueError:
             body = None
 
-        redirect_query_params = self._get_redirect_query_params(response)
-
         # 添加 body, headers, redirect_query_params 进入 variables 中，以保证被 format_keys 正常解析
         self.test_block_config["variables"].update(body=body)
         self.test_block_config["variables"].update(
@@ -195,13 +233,16 @@ class RestResponse(BaseResponse):
 
         if is_status_code_expected:
             if "save" in self.expected:
-                saved = self._save_value(self.expected["save"])
+                with stage_timings.phase("save"):
+                    saved = self._save_value(self.expected["save"])
 
             # Do Validation
             if "validate" in self.expected:
                 self._validate_block(self.expected["validate"])
 
         if self.errors:
+            if log_settings.full_body_on_failure:
+                logger.error("Body of response which failed verification:\n%s", response.text)
             raise TestFailError("Test '{:s}' failed:\n{:s}".format(
                 self.name, self._str_errors()), failures=self.errors)
 
@@ -248,11 +289,13 @@ class RestResponse(BaseResponse):
                                          e=e
                                          )
                         else:
+                            args = formatted_validate_args
                             kwargs = {}
                             if len(formatted_validate_args) > 2:
-                                kwargs = formatted_validate_args.pop()
+                                args = formatted_validate_args[:-1]
+                                kwargs = formatted_validate_args[-1]
                             try:
-                                comparator(*formatted_validate_args, **kwargs)
+                                comparator(*args, **kwargs)
                             except Exception as e:  # pylint: disable=broad-except
                                 self._adderr("Error calling comparator function '%s':\n%s",
                                              key,
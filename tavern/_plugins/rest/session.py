@@ -0,0 +1,40 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession(requests.Session):
+    """Session which is reused by several test blocks, keeping connections to
+    each host open between them
+
+    Args:
+        pool_connections (int): number of hosts to keep connections to
+        pool_maxsize (int): maximum number of connections to keep open to
+            each host
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOLSIZE, pool_maxsize=DEFAULT_POOLSIZE):
+        super(PooledSession, self).__init__()
+
+        for prefix in ["http://", "https://"]:
+            self.mount(prefix, HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+            ))
+
+        # Set by SessionPool
+        self.pool = None
+        self.pool_key = None
+
+    def __exit__(self, *args):
+        # Cookies are the only thing that requests keeps in the session
+        # between requests
+        self.cookies.clear()
+
+        if self.pool is None:
+            self.close()
+        else:
+            self.pool.release(self)
@@ -0,0 +1,408 @@
+"""Verify responses to requests with 'stream: true' without loading the body
+
+Normally the whole body is decoded before 'save' and 'validate' look at it.
+For a request with 'stream: true', if ijson is installed and everything that
+'save', 'validate' and 'cookies' use from the body is a key path like
+"{body.items.0.id}", the body is instead parsed as it is downloaded and only
+the values at those paths are kept, so memory use doesn't grow with the size
+of the body.
+
+Lists on the way to those values are replaced by StreamedList, which only has
+the items that were asked for but has the length of the whole list. A key
+path used as the first argument of a length comparator, like
+'len_eq: ["{body.items}", 100000]', only keeps the length of the list.
+
+Anything which could look at the rest of the body - "{body}" itself,
+"{jmes:...}" placeholders and $ext functions - means that the whole body is
+decoded as usual, as does a status code which wasn't expected (so that the
+error in the body can be shown).
+"""
+
+import collections
+import logging
+import numbers
+
+from future.utils import raise_from
+
+from tavern.util import built_in
+from tavern.util.comparator_util import comparators
+from tavern.util.dict_util import placeholder_paths, single_placeholder_path
+from tavern.util.exceptions import InvalidBuildInComparatorError
+
+from .decoded import DecodedResponse
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes read from the response at a time
+CHUNK_SIZE = 64 * 1024
+
+_length_comparators = frozenset([
+    built_in.length_equals,
+    built_in.length_greater_than,
+    built_in.length_greater_than_or_equals,
+    built_in.length_less_than,
+    built_in.length_less_than_or_equals,
+])
+
+
+class StreamedList(object):
+    """A list in a streamed body, which only has the items that were kept
+
+    Args:
+        items (dict): index: item for each item which was kept
+        length (int): length of the whole list
+    """
+
+    def __init__(self, items, length):
+        self._items = items
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if not isinstance(index, numbers.Integral):
+            raise TypeError("list indices must be integers, not {}".format(type(index).__name__))
+
+        if index < 0:
+            index += self._length
+
+        try:
+            return self._items[index]
+        except KeyError:
+            pass
+
+        if 0 <= index < self._length:
+            raise IndexError("item {} of streamed list was not kept".format(index))
+        raise IndexError("list index out of range")
+
+    def __repr__(self):
+        return "<StreamedList of {} items, kept {}>".format(self._length, self._items)
+
+
+class _PathNode(object):
+    """Which parts of a value in the body to keep
+
+    Attributes:
+        whole (bool): keep all of it
+        length (bool): keep the length of it, if it is a list
+        children (dict): key or list index: _PathNode for each part of it to
+            keep
+        tail (_PathNode): what to keep from the items counted from the end
+            of a list by negative indexes, which is only known once the list
+            has been read
+        tail_size (int): how many items from the end of a list to keep
+    """
+
+    def __init__(self):
+        self.whole = False
+        self.length = False
+        self.children = {}
+        self.tail = None
+        self.tail_size = 0
+        self._item_nodes = {}
+
+    def add(self, path, length=False):
+        node = self
+        for key in path:
+            node = node.children.setdefault(key, _PathNode())
+
+        if length:
+            node.length = True
+        else:
+            node.whole = True
+
+    def prepare(self):
+        """Work out what to keep from the end of lists, once all the paths
+        have been added"""
+        tail_nodes = []
+        for key, child in self.children.items():
+            child.prepare()
+            if isinstance(key, numbers.Integral) and key < 0:
+                tail_nodes.append(child)
+                self.tail_size = max(self.tail_size, -key)
+
+        for node in tail_nodes:
+            self.tail = _merge_nodes(self.tail, node)
+
+    def child(self, key):
+        if self.whole:
+            return self
+        return self.children.get(key)
+
+    def item(self, index):
+        """What to keep from an item in a list"""
+        if self.whole:
+            return self
+
+        node = self.children.get(index)
+        if self.tail is None or node is None:
+            return node or self.tail
+
+        # Might be one of the last items too
+        try:
+            return self._item_nodes[index]
+        except KeyError:
+            merged = self._item_nodes[index] = _merge_nodes(node, self.tail)
+            return merged
+
+
+def _merge_nodes(first, second):
+    if first is None:
+        return second
+    elif second is None:
+        return first
+    elif first.whole or second.whole:
+        return first if first.whole else second
+
+    merged = _PathNode()
+    merged.length = first.length or second.length
+    for key in set(first.children) | set(second.children):
+        merged.children[key] = _merge_nodes(first.children.get(key), second.children.get(key))
+    merged.prepare()
+    return merged
+
+
+_skipped = object()
+
+_start_events = frozenset(["start_map", "start_array"])
+_end_events = frozenset(["end_map", "end_array"])
+
+
+class _MapFrame(object):
+
+    def __init__(self, node):
+        if node.length:
+            # Objects aren't usually big, so just keep the whole thing
+            node = _PathNode()
+            node.whole = True
+
+        self.node = node
+        self.value = {}
+        self.key = None
+
+    def child(self):
+        return self.node.child(self.key)
+
+    def add(self, value):
+        if value is not _skipped:
+            self.value[self.key] = value
+
+    def finish(self):
+        return self.value
+
+
+class _ListFrame(object):
+
+    def __init__(self, node):
+        self.node = node
+        self.index = 0
+
+        if node.whole:
+            self.items = []
+            self.tail = None
+        else:
+            self.items = {}
+            self.tail = collections.deque(maxlen=node.tail_size) if node.tail_size else None
+
+    def child(self):
+        return self.node.item(self.index)
+
+    def add(self, value):
+        if value is not _skipped:
+            if self.node.whole:
+                self.items.append(value)
+            else:
+                if self.index in self.node.children:
+                    self.items[self.index] = value
+                if self.tail is not None:
+                    self.tail.append((self.index, value))
+
+        self.index += 1
+
+    def finish(self):
+        if self.node.whole:
+            return self.items
+
+        if self.tail is not None:
+            self.items.update(self.tail)
+        return StreamedList(self.items, self.index)
+
+
+class _BodyBuilder(object):
+    """Builds the parts of the body to keep from ijson.basic_parse events
+
+    Values which aren't kept are skipped by counting how deeply nested the
+    events in them are, without building anything.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.result = _skipped
+        self._stack = []
+        self._skip_depth = 0
+
+    def _add(self, value):
+        if self._stack:
+            self._stack[-1].add(value)
+        else:
+            self.result = value
+
+    def event(self, event, value):
+        if self._skip_depth:
+            if event in _start_events:
+                self._skip_depth += 1
+            elif event in _end_events:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._add(_skipped)
+        elif event == "map_key":
+            self._stack[-1].key = value
+        elif event in _end_events:
+            self._add(self._stack.pop().finish())
+        else:
+            node = self._stack[-1].child() if self._stack else self.root
+
+            if node is None:
+                if event in _start_events:
+                    self._skip_depth = 1
+                else:
+                    self._add(_skipped)
+            elif event == "start_map":
+                self._stack.append(_MapFrame(node))
+            elif event == "start_array":
+                self._stack.append(_ListFrame(node))
+            else:
+                self._add(value)
+
+
+def _is_length_comparator(alias):
+    try:
+        return comparators.get_comparator(alias) in _length_comparators
+    except InvalidBuildInComparatorError:
+        return False
+
+
+def get_body_paths(expected):
+    """Get which parts of the body verifying a response needs
+
+    Args:
+        expected (dict): expected response block
+
+    Returns:
+        _PathNode: paths to keep from the body, or None if the whole body
+            could be needed
+    """
+    if ijson is None:
+        logger.warning("ijson is not installed, decoding the whole body of streamed response")
+        return None
+
+    root = _PathNode()
+
+    def add(paths, length=False):
+        if paths is None:
+            return False
+
+        for path in paths:
+            if path and path[0] == "body":
+                root.add(path[1:], length)
+        return True
+
+    if not add(placeholder_paths(expected.get("cookies", []))):
+        return None
+
+    for save_as, joined_key in expected.get("save", {}).items():
+        if save_as == "$ext" or not add(placeholder_paths(joined_key)):
+            return None
+
+    for validator in expected.get("validate", []):
+        for key, validator_args in validator.items():
+            if key == "$ext":
+                return None
+
+            if _is_length_comparator(key) and isinstance(validator_args, list) and validator_args:
+                length_path = single_placeholder_path(validator_args[0])
+                if length_path is not None:
+                    add([length_path], length=True)
+                    validator_args = validator_args[1:]
+
+            if not add(placeholder_paths(validator_args)):
+                return None
+
+    if root.whole:
+        return None
+
+    root.prepare()
+    return root
+
+
+class StreamedResponse(DecodedResponse):
+    """Response to a request with 'stream: true', which can have its body
+    decoded as it is read with stream_json instead of all at once
+
+    Args:
+        response (requests.Response): response to wrap, which usually hasn't
+            had its body read yet. If it has, like with sessions that always
+            read the whole body, stream_json still only keeps the values
+            that are needed, but it reads them from the body in memory.
+    """
+
+    def __init__(self, response):
+        super(StreamedResponse, self).__init__(response)
+        self._streamed = False
+
+    @property
+    def streamed(self):
+        """Whether the body has been read by stream_json"""
+        return self._streamed
+
+    def stream_json(self, paths):
+        """Decode the body as it is read, only keeping some parts of it
+
+        Args:
+            paths (_PathNode): what to keep, from get_body_paths
+
+        Returns:
+            object: decoded body, with only the parts in paths
+
+        Raises:
+            ValueError: if the body isn't valid JSON
+        """
+        self._streamed = True
+
+        builder = _BodyBuilder(paths)
+        events = ijson.sendable_list()
+        parser = ijson.basic_parse_coro(events, use_float=True)
+
+        try:
+            for chunk in self._response.iter_content(CHUNK_SIZE):
+                parser.send(chunk)
+                for event, value in events:
+                    builder.event(event, value)
+                del events[:]
+
+            parser.close()
+        except ijson.JSONError as e:
+            raise_from(ValueError("Error decoding streamed body: {}".format(e)), e)
+
+        for event, value in events:
+            builder.event(event, value)
+
+        return builder.result
+
+    def json(self, **kwargs):
+        if self._streamed:
+            raise ValueError("Body was streamed and not kept")
+        return super(StreamedResponse, self).json(**kwargs)
+
+    @property
+    def text(self):
+        if self._streamed:
+            return "<streamed body, not kept>"
+        return super(StreamedResponse, self).text
@@ -9,6 +9,7 @@ from tavern.util import exceptions
 
 from .request import RestRequest
 from .response import RestResponse
+from .session import PooledSession
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +17,8 @@ logger = logging.getLogger(__name__)
 
 class TavernRestPlugin(PluginHelperBase):
     session_type = requests.Session
+    # Used instead of session_type if --tavern-http-session-pool is passed
+    pooled_session_type = PooledSession
 
     request_type = RestRequest
     request_block_name = "request"
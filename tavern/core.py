@@ -7,9 +7,12 @@ from contextlib2 import ExitStack
 
 from .util import exceptions
 from .util.dict_util import deep_dict_merge
+from .util.log_utils import Truncated
 from .util.delay import delay
 from .util.retry import retry
 from .util.run_with_times import run_with_times
+from .util.stage_group import iter_stages, run_parallel_group
+from .util.timing import stage_timings
 
 from .plugins import get_extra_sessions, get_request_type, get_verifiers, get_expected
 from .schemas.files import wrapfile
@@ -90,12 +93,12 @@ def run_test(in_file, test_spec, global_cfg):
     # Strict on body by default
     default_strictness = test_block_config["strict"]
 
-    logger.info("Running %s with variables: %s",
-                test_block_name, test_block_config)
+    logger.info("Running %s", test_block_name)
+    logger.debug("Config for %s: %s", test_block_name, Truncated(test_block_config))
 
     with ExitStack() as stack:
         final_stages = resolve_spec(test_spec)
-        for stage in test_spec["stages"]:
+        for stage in iter_stages(test_spec["stages"]):
             if "ref" in stage:
                 new_stage = _resolve_reference_stage(stage, final_stages)
                 stage.update(new_stage)
@@ -105,51 +108,74 @@ def run_test(in_file, test_spec, global_cfg):
         for name, session in sessions.items():
             logger.debug("Entering context for %s", name)
             stack.enter_context(session)
+
+        def run_block_stage(stage, stage_config):
+            _run_block_stage(sessions, stage, test_spec, stage_config, default_strictness)
+
         # Run tests in a path in order
         for stage in test_spec["stages"]:
             if stage.get('skip'):
                 continue
 
-            test_block_config["strict"] = default_strictness
-
-            # Can be overridden per stage
-            # NOTE
-            # this is hardcoded to check for the 'response' block. In the far
-            # future there might not be a response block, but at the moment it
-            # is the hardcoded value for any HTTP request.
-            if stage.get("response", {}):
-                if stage.get("response").get("strict", None) is not None:
-                    stage_strictness = stage.get(
-                        "response").get("strict", None)
-                elif test_spec.get("strict", None) is not None:
-                    stage_strictness = test_spec.get("strict", None)
-                else:
-                    stage_strictness = default_strictness
-
-                logger.debug(
-                    "Strict key checking for this stage is '%s'", stage_strictness)
-
-                test_block_config["strict"] = stage_strictness
-            elif default_strictness:
-                logger.debug(
-                    "Default strictness '%s' ignored for this stage", default_strictness)
-
-            # Wrap run_stage with retry helpe
-            run_stage_with_retries = retry(stage)(run_stage)
-            run_stage_with_times = run_with_times(
-                stage)(run_stage_with_retries)
-            try:
-                run_stage_with_times(
-                    sessions, stage, test_block_config)
-            except exceptions.TavernException as e:
-                e.stage = stage
-                e.test_block_config = test_block_config
-                raise
+            if "parallel" in stage:
+                run_parallel_group(stage, run_block_stage, test_block_config)
+            else:
+                run_block_stage(stage, test_block_config)
 
             if stage.get('only'):
                 break
 
 
+def _run_block_stage(sessions, stage, test_spec, test_block_config, default_strictness):
+    """Run one stage of a test block, with the right strictness and retrying
+    it if needed
+
+    Args:
+        sessions (dict): sessions used for this test block
+        stage (dict): specification of stage to be run
+        test_spec (dict): the whole test block
+        test_block_config (dict): available variables for test
+        default_strictness (list): strictness to use if the stage and test
+            block don't say
+    """
+    test_block_config["strict"] = default_strictness
+
+    # Can be overridden per stage
+    # NOTE
+    # this is hardcoded to check for the 'response' block. In the far
+    # future there might not be a response block, but at the moment it
+    # is the hardcoded value for any HTTP request.
+    if stage.get("response", {}):
+        if stage.get("response").get("strict", None) is not None:
+            stage_strictness = stage.get(
+                "response").get("strict", None)
+        elif test_spec.get("strict", None) is not None:
+            stage_strictness = test_spec.get("strict", None)
+        else:
+            stage_strictness = default_strictness
+
+        logger.debug(
+            "Strict key checking for this stage is '%s'", stage_strictness)
+
+        test_block_config["strict"] = stage_strictness
+    elif default_strictness:
+        logger.debug(
+            "Default strictness '%s' ignored for this stage", default_strictness)
+
+    # Wrap run_stage with retry helpe
+    timed_run_stage = stage_timings.wrap_stage(test_spec["name"], run_stage)
+    run_stage_with_retries = retry(stage)(timed_run_stage)
+    run_stage_with_times = run_with_times(
+        stage)(run_stage_with_retries)
+    try:
+        run_stage_with_times(
+            sessions, stage, test_block_config)
+    except exceptions.TavernException as e:
+        e.stage = stage
+        e.test_block_config = test_block_config
+        raise
+
+
 def run_stage(sessions, stage, test_block_config):
     """Run one stage from the test
 
@@ -162,30 +188,36 @@ def run_stage(sessions, stage, test_block_config):
     """
     name = stage["name"]
 
-    r = get_request_type(stage, test_block_config, sessions)
+    with stage_timings.phase("format"):
+        r = get_request_type(stage, test_block_config, sessions)
 
-    test_block_config["variables"].update(request=r.request_vars)
+        request_vars = r.request_vars
+        test_block_config["variables"].update(request=request_vars)
+        stage_timings.set_request(request_vars)
 
-    expected = get_expected(stage, test_block_config, sessions)
+        expected = get_expected(stage, test_block_config, sessions)
 
     delay(stage, "before")
 
     logger.info("Running stage : %s", name)
-    response = r.run()
-    verifiers = get_verifiers(stage, test_block_config, sessions, expected)
-    for v in verifiers:
-        try:
-            saved = v.verify(response)
-            test_block_config["variables"].update(saved)
-        except Exception as e:
-            e.response = response.text
-            raise
+    with stage_timings.phase("request"):
+        response = r.run()
+
+    with stage_timings.phase("verify"):
+        verifiers = get_verifiers(stage, test_block_config, sessions, expected)
+        for v in verifiers:
+            try:
+                saved = v.verify(response)
+                test_block_config["variables"].update(saved)
+            except Exception as e:
+                e.response = response.text
+                raise
 
     test_block_config["variables"].pop("request")
     delay(stage, "after")
 
 
-def _run_pytest(in_file, tavern_global_cfg, tavern_mqtt_backend=None, tavern_http_backend=None, tavern_strict=None, tavern_function_arg=None, pytest_args=None, **kwargs):  # pylint: disable=too-many-arguments
+def _run_pytest(in_file, tavern_global_cfg, tavern_mqtt_backend=None, tavern_http_backend=None, tavern_strict=None, tavern_function_arg=None, tavern_workers=None, pytest_args=None, **kwargs):  # pylint: disable=too-many-arguments
     """Run all tests contained in a file using pytest.main()
 
     Args:
@@ -197,6 +229,9 @@ def _run_pytest(in_file, tavern_global_cfg, tavern_mqtt_backend=None, tavern_htt
             specified, use tavern-http
         tavern_strict (bool, optional): Strictness of checking for responses.
             See documentation for details
+        tavern_workers (int, optional): Number of processes to run tests in,
+            or 'auto' for one per CPU. Tests are run in one process if not
+            specified
         pytest_args (list, optional): List of extra arguments to pass directly
             to Pytest as if they were command line arguments
         **kwargs (dict): ignored
@@ -227,6 +262,8 @@ def _run_pytest(in_file, tavern_global_cfg, tavern_mqtt_backend=None, tavern_htt
             pytest_args += ["--tavern-http-backend", tavern_http_backend]
         if tavern_strict:
             pytest_args += ["--tavern-strict", tavern_strict]
+        if tavern_workers:
+            pytest_args += ["--tavern-workers", str(tavern_workers)]
 
         return pytest.main(args=pytest_args)
 
@@ -3,12 +3,15 @@
 This is here mainly to make MQTT easier, this will almost defintiely change
 significantly if/when a proper plugin system is implemented!
 """
+import json
 import logging
+import threading
 
 import stevedore
 from future.utils import raise_from
 
 from .util import exceptions
+from .util.stage_group import iter_stages
 
 logger = logging.getLogger(__name__)
 
@@ -127,6 +130,89 @@ class _PluginCache(object):
 load_plugins = _PluginCache()
 
 
+class SessionPool(object):
+    """Sessions kept open between test blocks so that they can reuse
+    connections
+
+    Only used for plugins which have a 'pooled_session_type' as well as a
+    'session_type'. It is created with the same arguments as session_type plus
+    any in session_options, and has to call SessionPool.release with itself
+    instead of closing when its context exits, after clearing anything (like
+    cookies) which the next test block shouldn't see.
+
+    Each session is only used by one test block at a time. Sessions are
+    grouped by the plugin and the arguments used to create them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # Extra arguments for pooled_session_type
+        self.session_options = {}
+        # key: idle sessions
+        self._idle = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(plugin_name, kwargs):
+        return (plugin_name, json.dumps(kwargs, sort_keys=True, default=repr))
+
+    def acquire(self, ext, kwargs):
+        """Get an idle session for a plugin, or create a new one
+
+        Args:
+            ext (stevedore.extension.Extension): loaded plugin
+            kwargs (dict): arguments to create session with
+
+        Returns:
+            object: pooled session
+        """
+        key = self._key(ext.name, kwargs)
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                session = idle.pop()
+                logger.debug("Reusing pooled session for %s", ext.name)
+                return session
+
+            self.created += 1
+
+        logger.debug("Creating pooled session for %s", ext.name)
+
+        session_kwargs = dict(kwargs)
+        session_kwargs.update(self.session_options)
+        session = ext.plugin.pooled_session_type(**session_kwargs)
+        session.pool = self
+        session.pool_key = key
+
+        return session
+
+    def release(self, session):
+        """Put a session back to be used by another test block"""
+        with self._lock:
+            self._idle.setdefault(session.pool_key, []).append(session)
+
+    def close(self):
+        """Close all idle sessions"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        if self.created:
+            logger.debug("Closing session pool (%d created, %d reused)", self.created, self.reused)
+
+        for sessions in idle.values():
+            for session in sessions:
+                session.pool = None
+                session.close()
+
+
+session_pool = SessionPool()
+
+
 def get_extra_sessions(test_spec, test_block_config):
     """Get extra 'sessions' for any extra test types
 
@@ -143,9 +229,13 @@ def get_extra_sessions(test_spec, test_block_config):
     plugins = load_plugins(test_block_config)
 
     for p in plugins:
-        if any((p.plugin.request_block_name in i or p.plugin.response_block_name in i) for i in test_spec["stages"]):
-            logger.debug("Initialising session for %s (%s)", p.name, p.plugin.session_type)
-            sessions[p.name] = p.plugin.session_type(**test_spec.get(p.name, {}))
+        if any((p.plugin.request_block_name in i or p.plugin.response_block_name in i) for i in iter_stages(test_spec["stages"])):
+            kwargs = test_spec.get(p.name, {})
+            if session_pool.enabled and getattr(p.plugin, "pooled_session_type", None):
+                sessions[p.name] = session_pool.acquire(p, kwargs)
+            else:
+                logger.debug("Initialising session for %s (%s)", p.name, p.plugin.session_type)
+                sessions[p.name] = p.plugin.session_type(**kwargs)
 
     return sessions
 
@@ -0,0 +1,506 @@
+"""Validation of test specs without going through pykwalify
+
+pykwalify rebuilds its rule objects from the schema dictionary, reloads the
+extension module and creates a new validator for every item in every list each
+time a test is verified. Instead, the schema is turned into a tree of plain
+Python check functions once and then called directly on each test.
+
+This only handles the parts of the pykwalify schema language used by
+tests.schema.yaml and the plugin schemas. It follows the same rules as
+pykwalify 1.7 (including some of the less obvious ones, like 'include' taking
+precedence over every other keyword in a rule and regex keys being matched with
+re.search) so that it accepts and rejects exactly the same tests.
+"""
+
+import re
+import logging
+
+from tavern.util.exceptions import BadSchemaError, UnsupportedSchemaError
+from tavern.util.compat import basestring, bytes as bytes_type
+
+from . import extensions
+
+logger = logging.getLogger(__name__)
+
+
+def _is_str(value):
+    return isinstance(value, basestring) or isinstance(value, bytes_type)
+
+
+def _is_bool(value):
+    return isinstance(value, bool)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_float(value):
+    if not isinstance(value, float):
+        try:
+            float(value)
+        except (ValueError, TypeError):
+            return False
+    return not isinstance(value, bool)
+
+
+def _is_number(value):
+    return _is_int(value) or _is_float(value)
+
+
+def _is_text(value):
+    return (_is_str(value) or _is_number(value)) and not isinstance(value, bool)
+
+
+def _is_scalar(value):
+    return not isinstance(value, (dict, list)) and value is not None
+
+
+_type_checks = {
+    "str": _is_str,
+    "int": _is_int,
+    "bool": _is_bool,
+    "float": _is_float,
+    "number": _is_number,
+    "text": _is_text,
+    "any": lambda value: True,
+    "none": lambda value: value is None,
+    "scalar": _is_scalar,
+}
+
+_collection_types = {"map", "seq"}
+
+# Keywords that are accepted but don't affect validation
+_ignored_keywords = {"desc", "name", "example", "version", "class", "type"}
+
+_supported_keywords = _ignored_keywords | {
+    "required", "req",
+    "nullable", "nul",
+    "mapping", "map",
+    "sequence", "seq",
+    "func",
+    "enum",
+    "range",
+    "unique",
+    "matching",
+    "matching-rule",
+}
+
+
+def _check_range(spec, value, path, prefix, errors):
+    if not isinstance(value, (int, float)):
+        raise BadSchemaError("Value must be a integer type")
+
+    max_ = spec.get("max")
+    min_ = spec.get("min")
+    max_ex = spec.get("max-ex")
+    min_ex = spec.get("min-ex")
+
+    if max_ is not None and max_ < value:
+        errors.append("Type '{}' has size of '{}', greater than max limit '{}'. Path: '{}'".format(prefix, value, max_, path))
+    if min_ is not None and min_ > value:
+        errors.append("Type '{}' has size of '{}', less than min limit '{}'. Path: '{}'".format(prefix, value, min_, path))
+    if max_ex is not None and max_ex <= value:
+        errors.append("Type '{}' has size of '{}', greater than or equals to max limit(exclusive) '{}'. Path: '{}'".format(prefix, value, max_ex, path))
+    if min_ex is not None and min_ex >= value:
+        errors.append("Type '{}' has size of '{}', less than or equals to min limit(exclusive) '{}'. Path: '{}'".format(prefix, value, min_ex, path))
+
+
+class _Rule(object):
+    """One rule from the schema
+
+    After the whole schema has been read, ``compile`` sets ``check`` to a
+    function taking (value, path, errors) which appends a message to errors
+    for everything that doesn't match and raises an exception in the same
+    places that pykwalify would.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, schema, path):
+        if schema is None:
+            schema = {}
+
+        self.path = path
+        self.include = schema.get("include")
+
+        self.type = None
+        self.required = False
+        self.nullable = True
+        self.unique = False
+        self.func = None
+        self.enum = None
+        self.range = None
+        self.mapping = None
+        self.regex_mappings = []
+        self.sequence = None
+        self.matching = "any"
+        self.matching_rule = "any"
+        self.map_regex = None
+        # Set by compile()
+        self.check = None
+
+        if self.include:
+            # Everything else is ignored
+            return
+
+        unsupported = set(schema) - _supported_keywords
+        if unsupported:
+            raise UnsupportedSchemaError("Unsupported keywords {} at '{}'".format(sorted(unsupported), path))
+
+        if "type" in schema:
+            self.type = schema["type"]
+        elif "sequence" in schema or "seq" in schema:
+            self.type = "seq"
+        elif "mapping" in schema or "map" in schema:
+            self.type = "map"
+        else:
+            self.type = "str"
+
+        if self.type not in _type_checks and self.type not in _collection_types:
+            raise UnsupportedSchemaError("Unsupported type '{}' at '{}'".format(self.type, path))
+
+        self.required = schema.get("required", schema.get("req", False))
+        self.nullable = schema.get("nullable", schema.get("nul", True))
+        self.unique = schema.get("unique", False)
+        self.enum = schema.get("enum")
+        self.range = schema.get("range")
+        self.matching = str(schema.get("matching", "any"))
+        self.matching_rule = schema.get("matching-rule", "any")
+
+        func_name = schema.get("func")
+        if func_name is not None:
+            self.func = getattr(extensions, func_name, None)
+            if self.func is None:
+                raise UnsupportedSchemaError("No extension function called '{}' at '{}'".format(func_name, path))
+
+        sequence = schema.get("sequence", schema.get("seq"))
+        mapping = schema.get("mapping", schema.get("map"))
+
+        if self.type == "seq" and not sequence:
+            raise UnsupportedSchemaError("Sequence without items at '{}'".format(path))
+        if self.type == "map" and not mapping:
+            raise UnsupportedSchemaError("Mapping without keys at '{}'".format(path))
+        if self.type not in _collection_types and (sequence or mapping):
+            raise UnsupportedSchemaError("Scalar with sequence or mapping at '{}'".format(path))
+
+        if sequence:
+            self.sequence = [
+                _Rule(item, "{}/sequence/{}".format(path, i))
+                for i, item in enumerate(sequence)
+            ]
+
+        if mapping:
+            self.mapping = {}
+            for key, value in mapping.items():
+                if key.startswith("regex;") or key.startswith("re;"):
+                    # Like pykwalify, assume the regex is surrounded by
+                    # brackets and strip them
+                    regex = key.split(";", 1)[1][1:-1]
+                    rule = _Rule(value, "{}/mapping;regex/{}".format(path, regex))
+                    rule.map_regex = regex
+                    self.regex_mappings.append(rule)
+                else:
+                    rule = _Rule(value, "{}/mapping/{}".format(path, key))
+
+                self.mapping[key] = rule
+
+    def children(self):
+        for rule in self.sequence or []:
+            yield rule
+        if self.mapping:
+            for rule in self.mapping.values():
+                yield rule
+
+    def compile(self, partials):
+        """Set up ``check`` for this rule and all the rules under it
+
+        Args:
+            partials (dict): all the 'schema;' rules from the schema, by name
+        """
+        if self.include:
+            inner = self._compile_include(partials)
+        elif self.sequence is not None:
+            inner = self._compile_sequence()
+        elif self.mapping is not None:
+            inner = self._compile_mapping(partials)
+        else:
+            inner = self._compile_scalar()
+
+        for rule in self.children():
+            rule.compile(partials)
+
+        required = self.required
+        nullable = self.nullable
+
+        if self.type == "none" or (not required and nullable):
+            self.check = inner
+            return
+
+        def check(value, path, errors):
+            if value is None:
+                if required:
+                    errors.append("required.novalue : '{}'".format(path))
+                else:
+                    errors.append("nullable.novalue : '{}'".format(path))
+                return
+
+            inner(value, path, errors)
+
+        self.check = check
+
+    def _resolve(self, partials):
+        """Get the rule this one refers to, if it's an 'include'"""
+        if not self.include:
+            return self
+
+        try:
+            return partials[self.include]
+        except KeyError:
+            raise UnsupportedSchemaError("No partial schema called '{}' at '{}'".format(self.include, self.path))
+
+    def _call_func(self, value, path):
+        if not self.func(value, self, path):
+            raise BadSchemaError("Error when running extension function : {}".format(self.func.__name__))
+
+    def _compile_include(self, partials):
+        target = self._resolve(partials)
+
+        def check(value, path, errors):
+            target.check(value, path, errors)
+
+        return check
+
+    def _compile_scalar(self):
+        type_check = _type_checks[self.type]
+        type_name = self.type
+        enum = self.enum
+        range_spec = self.range
+        has_func = self.func is not None
+        call_func = self._call_func
+
+        def check(value, path, errors):
+            if has_func:
+                call_func(value, path)
+
+            if value is None:
+                return
+
+            if enum is not None and value not in enum:
+                errors.append("Enum '{}' does not exist. Path: '{}'".format(value, path))
+
+            if not type_check(value):
+                errors.append("Value '{}' is not of type '{}'. Path: '{}'".format(value, type_name, path))
+                return
+
+            if range_spec is not None:
+                if not _is_scalar(value):
+                    raise BadSchemaError("value is not a valid scalar")
+
+                try:
+                    value = len(value)
+                except Exception:  # pylint: disable=broad-except
+                    pass
+
+                _check_range(range_spec, value, path, "scalar", errors)
+
+        return check
+
+    def _compile_sequence(self):
+        items = self.sequence
+        matching = self.matching
+        range_spec = self.range
+        has_func = self.func is not None
+        call_func = self._call_func
+
+        unique_items = any(r.unique for r in items if r.type != "map")
+        unique_keys = []
+        for r in items:
+            if r.type == "map":
+                unique_keys.extend(k for k, kr in r.mapping.items() if kr.unique)
+
+        def check_unique(value, path, errors):
+            if unique_items:
+                seen = {}
+                for j, val in enumerate(value):
+                    if val is None:
+                        continue
+                    if val in seen:
+                        errors.append("Value '{}' is not unique. Previous path: '{}/{}'. Path: '{}/{}'".format(val, path, seen[val], path, j))
+                    else:
+                        seen[val] = j
+
+            for key in unique_keys:
+                seen = {}
+                for j, item in enumerate(value):
+                    val = item.get(key, None)
+                    if val is None:
+                        continue
+                    if val in seen:
+                        errors.append("Value '{}' is not unique. Previous path: '{}/{}/{}'. Path: '{}/{}/{}'".format(val, path, seen[val], key, path, j, key))
+                    else:
+                        seen[val] = j
+
+        def check(value, path, errors):
+            if value is None:
+                return
+
+            if not isinstance(value, list):
+                errors.append("Value '{}' is not a list. Value path: '{}'".format(value, path))
+                return
+
+            if has_func:
+                call_func(value, path)
+
+            for i, item in enumerate(value):
+                item_path = "{}/{}".format(path, i)
+
+                item_errors = []
+                n_ok = 0
+                for r in items:
+                    alternative_errors = []
+                    r.check(item, item_path, alternative_errors)
+                    if alternative_errors:
+                        item_errors.extend(alternative_errors)
+                    else:
+                        n_ok += 1
+
+                if matching == "any":
+                    ok = n_ok > 0
+                elif matching == "all":
+                    ok = n_ok == len(items)
+                else:
+                    ok = True
+
+                if not ok:
+                    errors.extend(item_errors)
+
+            if value:
+                check_unique(value, path, errors)
+
+            if range_spec is not None:
+                _check_range(range_spec, len(value), path, "seq", errors)
+
+        return check
+
+    def _compile_mapping(self, partials):
+        mapping = self.mapping
+        default = mapping.get("=")
+        regexes = [(re.compile(r.map_regex), r) for r in self.regex_mappings]
+        matching_rule = self.matching_rule
+        range_spec = self.range
+        has_func = self.func is not None
+        call_func = self._call_func
+
+        # (key, regex or None) for each key that has to be present
+        required_keys = []
+        for key, rule in mapping.items():
+            if key == "=" or not self._resolve_required(rule, partials):
+                continue
+
+            regex = None
+            for r in self.regex_mappings:
+                if key in ("regex;({})".format(r.map_regex), "re;({})".format(r.map_regex)):
+                    regex = r.map_regex
+            required_keys.append((key, regex))
+
+        def check(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append("Value '{}' is not a dict. Value path: '{}'".format(value, path))
+                return
+
+            if has_func:
+                call_func(value, path)
+
+            if range_spec is not None:
+                _check_range(range_spec, len(value), path, "map", errors)
+
+            for key, regex in required_keys:
+                if regex is None:
+                    present = key in value
+                else:
+                    present = any(re.search(regex, k) for k in value)
+
+                if not present:
+                    errors.append("Cannot find required key '{}'. Path: '{}'".format(key, path))
+
+            for key, item in value.items():
+                rule = mapping.get(key, default)
+                item_path = u"{0}/{1}".format(path, key)
+
+                if rule is not None:
+                    rule.check(item, item_path, errors)
+                elif regexes:
+                    matched = 0
+                    for regex, regex_rule in regexes:
+                        if regex.search(str(key)):
+                            regex_rule.check(item, item_path, errors)
+                            matched += 1
+
+                    if matching_rule == "any" and not matched:
+                        errors.append("Key '{}' does not match any regex. Path: '{}'".format(key, path))
+                    elif matching_rule == "all" and matched != len(regexes):
+                        errors.append("Key '{}' does not match all regex. Path: '{}'".format(key, path))
+                else:
+                    errors.append("Key '{}' was not defined. Path: '{}'".format(key, path))
+
+        return check
+
+    @staticmethod
+    def _resolve_required(rule, partials):
+        # If a key in a mapping is an include, pykwalify uses whether the
+        # included rule is required rather than the key
+        # pylint: disable=protected-access
+        return rule._resolve(partials).required
+
+
+class CompiledSchema(object):
+    """A schema which has been turned into a tree of check functions
+
+    Args:
+        schema (dict): pykwalify schema, including any 'schema;' partial
+            schemas at the top level
+
+    Raises:
+        UnsupportedSchemaError: The schema uses something that this can't
+            validate, and pykwalify should be used instead
+    """
+
+    def __init__(self, schema):
+        partials = {}
+        root = {}
+
+        for key, value in schema.items():
+            if key.startswith("schema;"):
+                name = key.split(";", 1)[1]
+                partials[name] = _Rule(value, "")
+            elif key == "extensions":
+                raise UnsupportedSchemaError("Extensions listed in schema")
+            else:
+                root[key] = value
+
+        self._root = _Rule(root, "")
+
+        for rule in partials.values():
+            rule.compile(partials)
+        self._root.compile(partials)
+
+    def validate(self, to_verify):
+        """Check some data against this schema
+
+        Args:
+            to_verify (dict): data to check
+
+        Raises:
+            BadSchemaError: Schema did not match
+        """
+        if to_verify is None:
+            raise BadSchemaError("No data to validate")
+
+        errors = []
+        self._root.check(to_verify, "", errors)
+
+        if errors:
+            msg = "Schema validation failed:\n - {}.".format(".\n - ".join(errors))
+            logger.error(msg)
+            raise BadSchemaError(msg)
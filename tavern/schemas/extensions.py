@@ -1,5 +1,6 @@
 import logging
 import re
+import copy
 import functools
 
 from future.utils import raise_from
@@ -8,6 +9,7 @@ from tavern.util.exceptions import BadSchemaError
 from tavern.util.exceptions import InvalidBuildInComparatorError
 from tavern.util.comparator_util import comparators
 from tavern.util.import_util import import_ext_function
+from tavern.util.cache import LRUCache
 from tavern.util.loader import ApproxScalar
 
 
@@ -59,23 +61,44 @@ def validate_block(value, rule_obj, path):
     return True
 
 
-def get_wrapped_response_function(ext):
-    """Wraps a ext function with arguments given in the test file
+# Wrapped functions for $ext blocks, keyed on the function and its arguments
+wrapped_function_cache = LRUCache(maxsize=512, name="wrapped ext functions")
 
-    This is similar to functools.wrap, but this makes sure that 'response' is
-    always the first argument passed to the function
 
-    Args:
-        ext (dict): $ext function dict with function, extra_args, and
-            extra_kwargs to pass
+def _freeze(value):
+    """Turn extra_args/extra_kwargs into something hashable to use as a cache
+    key, including the types so that eg 1 and True are different
 
-    Returns:
-        function: Wrapped function
+    Raises:
+        TypeError: value contains something unhashable
     """
+    if isinstance(value, dict):
+        return (dict, frozenset((_freeze(k), _freeze(v)) for k, v in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(v) for v in value))
+
+    hash(value)
+    return (type(value), value)
+
+
+def _get_wrapped_function(ext, wrap):
     args = ext.get("extra_args") or ()
     kwargs = ext.get("extra_kwargs") or {}
     func = import_ext_function(ext["function"])
 
+    try:
+        key = (wrap, func, _freeze(args), _freeze(kwargs))
+    except TypeError:
+        # Can't cache it
+        return wrap(func, args, kwargs)
+
+    # The cached function keeps a copy of the arguments, in case they get
+    # changed after this
+    return wrapped_function_cache.get_or_create(
+        key, lambda: wrap(func, copy.deepcopy(args), copy.deepcopy(kwargs)))
+
+
+def _wrap_response_function(func, args, kwargs):
     @functools.wraps(func)
     def inner(response):
         return func(response, *args, **kwargs)
@@ -85,13 +108,7 @@ def get_wrapped_response_function(ext):
     return inner
 
 
-def get_wrapped_create_function(ext):
-    """Same as above, but don't require a response
-    """
-    args = ext.get("extra_args") or ()
-    kwargs = ext.get("extra_kwargs") or {}
-    func = import_ext_function(ext["function"])
-
+def _wrap_create_function(func, args, kwargs):
     @functools.wraps(func)
     def inner():
         return func(*args, **kwargs)
@@ -101,6 +118,28 @@ def get_wrapped_create_function(ext):
     return inner
 
 
+def get_wrapped_response_function(ext):
+    """Wraps a ext function with arguments given in the test file
+
+    This is similar to functools.wrap, but this makes sure that 'response' is
+    always the first argument passed to the function
+
+    Args:
+        ext (dict): $ext function dict with function, extra_args, and
+            extra_kwargs to pass
+
+    Returns:
+        function: Wrapped function
+    """
+    return _get_wrapped_function(ext, _wrap_response_function)
+
+
+def get_wrapped_create_function(ext):
+    """Same as above, but don't require a response
+    """
+    return _get_wrapped_function(ext, _wrap_create_function)
+
+
 def validate_extensions(value, rule_obj, path):
     """Given a specification for calling a validation function, make sure that
     the arguments are valid (ie, function is valid, arguments are of the
@@ -1,5 +1,6 @@
 import os
 import copy
+import hashlib
 import tempfile
 import functools
 import logging
@@ -10,10 +11,12 @@ from future.utils import raise_from
 import yaml
 from pykwalify import core
 import pykwalify
-from tavern.util.exceptions import BadSchemaError
+from tavern.util.exceptions import BadSchemaError, UnsupportedSchemaError
+from tavern.util.compat import basestring, numeric_types
 from tavern.plugins import load_plugins
 
 from tavern.util.loader import IncludeLoader
+from .compiled import CompiledSchema
 core.yaml.safe_load = functools.partial(yaml.load, Loader=IncludeLoader)
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,7 @@ class SchemaCache(object):
 
     def __init__(self):
         self._loaded = {}
+        self._compiled = {}
 
     def _load_base_schema(self, schema_filename):
         try:
@@ -79,10 +83,165 @@ class SchemaCache(object):
 
         return schema
 
+    def compiled(self, schema_filename, with_plugins):
+        """Load the schema file and compile it into a validator
+
+        Args:
+            schema_filename (str): filename of schema
+            with_plugins (bool): Whether to load plugin schema into this schema as well
+
+        Returns:
+            CompiledSchema: validator for the schema, or None if it can't be
+                compiled and pykwalify has to be used instead
+        """
+        key = (schema_filename, with_plugins)
+
+        try:
+            return self._compiled[key]
+        except KeyError:
+            schema = self(schema_filename, with_plugins)
+
+            try:
+                compiled = CompiledSchema(schema)
+            except UnsupportedSchemaError as e:
+                logger.warning("Unable to compile schema from %s, falling back to pykwalify: %s",
+                               schema_filename, e)
+                compiled = None
+
+            self._compiled[key] = compiled
+            return compiled
+
 
 load_schema_file = SchemaCache()
 
 
+def _update_fingerprint(hasher, value):
+    if isinstance(value, dict):
+        hasher.update(b"{")
+        for key in sorted(value, key=repr):
+            _update_fingerprint(hasher, key)
+            hasher.update(b":")
+            _update_fingerprint(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"[")
+        for item in value:
+            _update_fingerprint(hasher, item)
+            hasher.update(b",")
+        hasher.update(b"]")
+    elif value is None or isinstance(value, (basestring,) + numeric_types):
+        hasher.update(repr((type(value).__name__, value)).encode("utf8"))
+    elif hasattr(value, "__dict__"):
+        # Type tokens, sentinels, etc. - the default repr has the id in it
+        hasher.update(type(value).__name__.encode("utf8"))
+        _update_fingerprint(hasher, vars(value))
+    else:
+        hasher.update(repr(value).encode("utf8"))
+
+
+def _update_spec_fingerprint(hasher, test_spec):
+    """Like _update_fingerprint, but for a test or an included test
+
+    Parametrized tests differ in their names and the values of their
+    variables. The schema only checks that the name is a string, so only the
+    type of the name is added. Variables can have any value at all, so only
+    their names are added. This means that parametrized tests all have the
+    same fingerprint unless one of them has a name which isn't a string.
+    """
+    hasher.update(b"spec{")
+    for key in sorted(test_spec, key=repr):
+        value = test_spec[key]
+        _update_fingerprint(hasher, key)
+        hasher.update(b":")
+
+        if key == "name":
+            # str and unicode are both strings to the schema on Python 2
+            type_name = "str" if isinstance(value, basestring) else type(value).__name__
+            hasher.update(type_name.encode("utf8"))
+        elif key == "variables" and isinstance(value, dict):
+            # The schema accepts any type of value
+            _update_fingerprint(hasher, sorted(value, key=repr))
+        elif key == "includes" and isinstance(value, list):
+            hasher.update(b"[")
+            for included in value:
+                if isinstance(included, dict):
+                    _update_spec_fingerprint(hasher, included)
+                else:
+                    _update_fingerprint(hasher, included)
+                hasher.update(b",")
+            hasher.update(b"]")
+        else:
+            _update_fingerprint(hasher, value)
+    hasher.update(b"}")
+
+
+def spec_fingerprint(test_spec):
+    """Get a hash of the parts of a test spec that affect schema validation
+
+    Args:
+        test_spec (dict): Test in dictionary form
+
+    Returns:
+        str: hex digest
+    """
+    hasher = hashlib.sha1()
+    _update_spec_fingerprint(hasher, test_spec)
+    return hasher.hexdigest()
+
+
+class ValidationCache(object):
+    """Remembers which test specs have already passed validation
+
+    Only successful validations are remembered, so a spec which fails will
+    still raise an error every time.
+    """
+
+    def __init__(self):
+        self._validated = set()
+        # Number of validations avoided/done, shown at the end of the run by
+        # pytest_terminal_summary
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._validated.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Get how many validations were skipped
+
+        Returns:
+            dict: hits (validations skipped) and misses (tests validated)
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def add_stats(self, stats):
+        """Add counts from stats() in a worker process to this cache's"""
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+
+    def is_validated(self, key):
+        if key in self._validated:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, key):
+        self._validated.add(key)
+
+
+validated_specs = ValidationCache()
+
+
 def verify_generic(to_verify, schema):
     """Verify a generic file against a given schema
 
@@ -137,8 +296,9 @@ def wrapfile(to_wrap):
 def verify_tests(test_spec, with_plugins=True):
     """Verify that a specific test block is correct
 
-    Todo:
-        Load schema file once. Requires some caching of the file
+    Tests which have the same structure as one that has already been verified
+    (for example, other parametrized versions of the same test) are not
+    verified again.
 
     Args:
         test_spec (dict): Test in dictionary form
@@ -149,6 +309,18 @@ def verify_tests(test_spec, with_plugins=True):
     here = os.path.dirname(os.path.abspath(__file__))
 
     schema_filename = os.path.join(here, "tests.schema.yaml")
-    schema = load_schema_file(schema_filename, with_plugins)
 
-    verify_generic(test_spec, schema)
+    key = (schema_filename, with_plugins, spec_fingerprint(test_spec))
+    if validated_specs.is_validated(key):
+        logger.debug("Already validated a test with the same structure as '%s' (%d validations skipped)",
+                     test_spec.get("name"), validated_specs.hits)
+        return
+
+    validator = load_schema_file.compiled(schema_filename, with_plugins)
+    if validator is not None:
+        validator.validate(test_spec)
+    else:
+        schema = load_schema_file(schema_filename, with_plugins)
+        verify_generic(test_spec, schema)
+
+    validated_specs.add(key)
@@ -0,0 +1,135 @@
+"""Run test blocks which use the aiohttp backend several at a time
+
+pytest runs and reports one item after another. With the aiohttp backend, the
+runner here starts test blocks ahead of pytest - up to the concurrency limit at
+once - and when pytest gets to an item which has been started, it just waits for
+the result. Reports are still made in order, by the normal pytest protocol.
+
+The stages in each test block are run in a thread, but all of the requests are
+sent on the one aiohttp event loop (see aio_session.py), so the threads are
+only ever waiting for it and a few of them can keep a lot of requests in
+flight.
+
+Only test blocks which pytest doesn't need to do anything for first can be run
+ahead - ones which use fixtures or have skip, skipif or xfail marks are run in
+the normal way when pytest gets to them.
+"""
+
+import logging
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from tavern.util.timing import stage_timings
+
+logger = logging.getLogger(__name__)
+
+
+def get_aiohttp_concurrency(config):
+    """Get how many test blocks using the aiohttp backend can be run at once
+
+    Args:
+        config (pytest.Config): pytest config
+
+    Returns:
+        int: maximum number of test blocks to run at once. 1 means run them
+            one after the other.
+    """
+    concurrency = config.getoption("tavern_aiohttp_concurrency")
+    if concurrency is None:
+        concurrency = config.getini("tavern-aiohttp-concurrency")
+
+    if not concurrency:
+        return 1
+
+    try:
+        concurrency = int(concurrency)
+    except ValueError:
+        raise pytest.UsageError("aiohttp concurrency must be an integer, got '{}'".format(concurrency))
+
+    if concurrency < 1:
+        raise pytest.UsageError("aiohttp concurrency must be at least 1")
+
+    return concurrency
+
+
+def can_run_ahead(item):
+    """Whether an item can be run before pytest gets to it
+
+    Args:
+        item (pytest.Item): collected item
+
+    Returns:
+        bool: True if it is a tavern test using the aiohttp backend which
+            doesn't need any fixtures and isn't skipped or xfailed
+    """
+    if not hasattr(item, "run_in"):
+        return False
+
+    if item.global_cfg.get("backends", {}).get("http") != "aiohttp":
+        return False
+
+    if item.fixturenames:
+        return False
+
+    return not any(item.get_closest_marker(name) for name in ("skip", "skipif", "xfail"))
+
+
+class ConcurrentRunner(object):
+    """Runs all the items in a session, running test blocks which can be run
+    ahead several at a time
+
+    Args:
+        session (pytest.Session): session with collected items
+        concurrency (int): maximum number of test blocks to run at once
+    """
+
+    def __init__(self, session, concurrency):
+        self.session = session
+        self.concurrency = concurrency
+
+        # Indexes of items which can be run ahead, and which have been started
+        # but not reported yet
+        self._waiting = deque(
+            i for i, item in enumerate(session.items) if can_run_ahead(item))
+        self._started = deque()
+
+    def _start_more(self, pool, current):
+        while self._waiting and len(self._started) < self.concurrency:
+            index = self._waiting.popleft()
+            if index < current:
+                continue
+            self.session.items[index].run_in(pool)
+            self._started.append(index)
+
+    def run(self):
+        session = self.session
+        items = session.items
+
+        if stage_timings.enabled:
+            # Records for test blocks running at the same time would be mixed
+            # up
+            logger.warning("Not running test blocks at the same time because stage timings are being recorded")
+            self._waiting.clear()
+
+        logger.debug("Running %d test blocks ahead, %d at a time", len(self._waiting), self.concurrency)
+
+        pool = ThreadPool(self.concurrency)
+        try:
+            for i, item in enumerate(items):
+                while self._started and self._started[0] < i:
+                    self._started.popleft()
+                self._start_more(pool, i)
+
+                nextitem = items[i + 1] if i + 1 < len(items) else None
+                item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+
+                if session.shouldfail:
+                    raise session.Failed(session.shouldfail)
+                if session.shouldstop:
+                    raise session.Interrupted(session.shouldstop)
+        finally:
+            # Let test blocks which have already been started finish
+            pool.close()
+            pool.join()
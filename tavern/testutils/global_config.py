@@ -0,0 +1,85 @@
+"""Loading the global configuration once per session instead of per test"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+class GlobalConfigCache(object):
+    """Loads the global configuration once per session
+
+    Loading the global config means reading and formatting all of the global
+    config files and running all the config hooks, which is far too slow to
+    do for every single test item. It is only reloaded if the files, the
+    options, or the environment it was loaded with change.
+    """
+
+    # (ini name, command line option name) which affect the global config
+    options = [
+        ("tavern-global-cfg", "tavern_global_cfg"),
+        ("tavern-function-cfg", "tavern_function_cfg"),
+        ("tavern-strict", "tavern_strict"),
+        ("tavern-http-backend", "tavern_http_backend"),
+        ("tavern-mqtt-backend", "tavern_mqtt_backend"),
+    ]
+
+    def __init__(self):
+        self._key = None
+        self._global_cfg = None
+
+    def _cache_key(self, config):
+        option_values = tuple(
+            (_hashable(config.getini(ini_name)), _hashable(config.getoption(opt_name)))
+            for ini_name, opt_name in self.options
+        )
+
+        paths = (config.getini("tavern-global-cfg") or []) + \
+            (config.getoption("tavern_global_cfg") or [])
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                # Will raise an error when actually loading it
+                mtimes.append(None)
+
+        return (
+            id(config),
+            option_values,
+            tuple(mtimes),
+            frozenset(os.environ.items()),
+        )
+
+    def __call__(self, item):
+        """Get the global config for this item
+
+        Args:
+            item (YamlItem): item being initialised
+
+        Returns:
+            dict: global config. Only the top level and the 'variables' dict
+                are copied - anything else is shared between items and should
+                be replaced rather than modified in place.
+        """
+        key = self._cache_key(item.config)
+
+        if key != self._key:
+            logger.debug("Loading global config")
+            # pylint: disable=protected-access
+            self._global_cfg = item._load_global_cfg()
+            self._key = key
+
+        global_cfg = dict(self._global_cfg)
+        global_cfg["variables"] = dict(self._global_cfg["variables"])
+
+        return global_cfg
+
+
+load_session_global_cfg = GlobalConfigCache()
@@ -3,15 +3,15 @@ import importlib
 import logging
 import re
 import jwt
-import jmespath
 
 from future.utils import raise_from
 from box import Box
 
-from tavern.util import exceptions
+from tavern.util import exceptions, jmes_util
 from tavern.testutils.jmesutils import validate_comparison, actual_validation
 from tavern.schemas.files import verify_generic
 from tavern.util.dict_util import check_keys_match_recursive
+from tavern.util.log_utils import Truncated
 
 logger = logging.getLogger(__name__)
 
@@ -128,10 +128,12 @@ def validate_content(response, comparisons):
                 2. operator : Operator to use to compare data.
                 3. expected : The expected value to match for
     """
+    body = response.json()
+
     for each_comparison in comparisons:
         path, _operator, expected = validate_comparison(each_comparison)
-        logger.debug("Searching for '%s' in '%s'", path, response.json())
-        actual = jmespath.search(path, response.json())
+        logger.debug("Searching for '%s' in '%s'", path, Truncated(body))
+        actual = jmes_util.search(path, body)
 
         if actual is None:
             raise exceptions.JMESError("JMES path '{}' not found in response".format(path))
@@ -0,0 +1,245 @@
+"""Command line and ini file options"""
+
+
+def add_parser_options(parser_addoption, with_defaults=True):
+    """Add argparse options
+
+    This is shared between the CLI and pytest (for now)
+    """
+    parser_addoption(
+        "--tavern-global-cfg",
+        help="One or more global configuration files to include in every test",
+        required=False,
+        nargs="+",
+    )
+    parser_addoption(
+        "--tavern-http-backend",
+        help="Which http backend to use",
+        default='requests' if with_defaults else None,
+    )
+    parser_addoption(
+        "--tavern-mqtt-backend",
+        help="Which mqtt backend to use",
+        default='paho-mqtt' if with_defaults else None,
+    )
+    parser_addoption(
+        "--tavern-strict",
+        help="Default response matching strictness",
+        default=None,
+        nargs="+",
+        choices=["body", "headers", "redirect_query_params"],
+    )
+    parser_addoption(
+        "--tavern-beta-new-traceback",
+        help="Use new traceback style (beta)",
+        default=False,
+        action="store_true",
+    )
+    parser_addoption(
+        "--tavern-function-cfg",
+        help="One or more functions to get configuration to include in every test",
+        required=False,
+        nargs="+"
+    )
+    parser_addoption(
+        "--tavern-base-dir",
+        help="Base dir for tavern test case to include test case",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-setup-functions",
+        help="Initialize Tavern with config and loader",
+        required=False,
+        nargs="+"
+    )
+    parser_addoption(
+        "--tavern-cache-dir",
+        help="Directory to cache loaded test files in, eg .tavern_cache",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-workers",
+        help="Number of processes to run tests in, or 'auto' for one per CPU",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-setup-concurrency",
+        help="Number of setup tests which don't depend on each other to run at the same time",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-aiohttp-concurrency",
+        help="Number of test blocks using the aiohttp backend to run at the same time",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-log-body-limit",
+        help="Maximum number of characters of response bodies and other large values to log, 0 for no limit",
+        required=False,
+        type=int,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-log-full-body-on-failure",
+        help="Log the whole body of responses which fail verification, however big they are",
+        default=False,
+        action="store_true",
+    )
+    parser_addoption(
+        "--tavern-jsonschema-backend",
+        help="Library to validate JSON schemas with - jsonschema, or fastjsonschema which is faster if installed",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-timing",
+        help="Record how long each part of each stage takes and show the slowest stages and endpoints",
+        default=False,
+        action="store_true",
+    )
+    parser_addoption(
+        "--tavern-timing-report",
+        help="Write timings of each stage and test to this file (.json or .csv), implies --tavern-timing",
+        required=False,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-http-session-pool",
+        help="Reuse HTTP sessions and their connections between tests (cookies are still cleared)",
+        default=False,
+        action="store_true",
+    )
+    parser_addoption(
+        "--tavern-http-pool-connections",
+        help="Number of hosts to keep connections to in each pooled HTTP session",
+        required=False,
+        type=int,
+        default=None
+    )
+    parser_addoption(
+        "--tavern-http-pool-maxsize",
+        help="Maximum number of connections to keep open to each host in each pooled HTTP session",
+        required=False,
+        type=int,
+        default=None
+    )
+
+
+def add_ini_options(parser_addini):
+    """Add ini file options
+
+    These are the same as the command line options, which take precedence
+    """
+    parser_addini(
+        "tavern-global-cfg",
+        help="One or more global configuration files to include in every test",
+        type="linelist",
+        default=[]
+    )
+    parser_addini(
+        "tavern-http-backend",
+        help="Which http backend to use",
+        default="requests",
+    )
+    parser_addini(
+        "tavern-mqtt-backend",
+        help="Which mqtt backend to use",
+        default="paho-mqtt",
+    )
+    parser_addini(
+        "tavern-strict",
+        help="Default response matching strictness",
+        type="args",
+        default=None,
+    )
+    parser_addini(
+        "tavern-beta-new-traceback",
+        help="Use new traceback style (beta)",
+        type="bool",
+        default=False,
+    )
+    parser_addini(
+        "tavern-function-cfg",
+        help="One or more functions to get configuration to include in every test",
+        type="linelist",
+        default=[]
+    )
+    parser_addini(
+        "tavern-base-dir",
+        help="Base dir for tavern test case to include test case",
+        default=None
+    )
+    parser_addini(
+        "tavern-setup-functions",
+        help="Initialize Tavern with config and loader",
+        type="linelist",
+        default=[]
+    )
+    parser_addini(
+        "tavern-cache-dir",
+        help="Directory to cache loaded test files in, eg .tavern_cache",
+        default=None
+    )
+    parser_addini(
+        "tavern-workers",
+        help="Number of processes to run tests in, or 'auto' for one per CPU",
+        default=None
+    )
+    parser_addini(
+        "tavern-setup-concurrency",
+        help="Number of setup tests which don't depend on each other to run at the same time",
+        default=None
+    )
+    parser_addini(
+        "tavern-aiohttp-concurrency",
+        help="Number of test blocks using the aiohttp backend to run at the same time",
+        default=None
+    )
+    parser_addini(
+        "tavern-log-body-limit",
+        help="Maximum number of characters of response bodies and other large values to log, 0 for no limit",
+        default=None
+    )
+    parser_addini(
+        "tavern-log-full-body-on-failure",
+        help="Log the whole body of responses which fail verification, however big they are",
+        type="bool",
+        default=False,
+    )
+    parser_addini(
+        "tavern-jsonschema-backend",
+        help="Library to validate JSON schemas with - jsonschema, or fastjsonschema which is faster if installed",
+        default=None
+    )
+    parser_addini(
+        "tavern-timing",
+        help="Record how long each part of each stage takes and show the slowest stages and endpoints",
+        type="bool",
+        default=False,
+    )
+    parser_addini(
+        "tavern-timing-report",
+        help="Write timings of each stage and test to this file (.json or .csv), implies tavern-timing",
+        default=None
+    )
+    parser_addini(
+        "tavern-http-session-pool",
+        help="Reuse HTTP sessions and their connections between tests (cookies are still cleared)",
+        type="bool",
+        default=False,
+    )
+    parser_addini(
+        "tavern-http-pool-connections",
+        help="Number of hosts to keep connections to in each pooled HTTP session",
+        default=None
+    )
+    parser_addini(
+        "tavern-http-pool-maxsize",
+        help="Maximum number of connections to keep open to each host in each pooled HTTP session",
+        default=None
+    )
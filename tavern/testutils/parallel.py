@@ -0,0 +1,328 @@
+"""Run collected tests in several worker processes
+
+After collection, the pytest process forks into worker processes which all
+have a copy of the collected items. The main process hands out the index of the
+next item to run to whichever worker asks for one, and the workers send back
+the reports for each item so that the main process can report them as if it
+had run them itself.
+
+'setup' tests are only run once for all of the workers - see
+YamlItemContext in pytesthook.py.
+"""
+
+import logging
+import multiprocessing
+import os
+import select
+import shutil
+import tempfile
+from collections import deque
+
+import pytest
+from _pytest.runner import TestReport
+
+from tavern.schemas.files import validated_specs
+from tavern.util.loader import spec_cache
+
+logger = logging.getLogger(__name__)
+
+# Caches which count how well they worked, which are added up from all the
+# workers to show at the end of the run
+_counted_caches = {
+    "spec_cache": spec_cache,
+    "validated_specs": validated_specs,
+}
+
+
+def get_n_workers(config):
+    """Get how many worker processes to use from the command line or ini file
+
+    Args:
+        config (pytest.Config): pytest config
+
+    Returns:
+        int: number of workers. 0 means don't run in parallel.
+    """
+    workers = config.getoption("tavern_workers")
+    if workers is None:
+        workers = config.getini("tavern-workers")
+
+    if not workers:
+        return 0
+
+    if workers == "auto":
+        return multiprocessing.cpu_count()
+
+    try:
+        workers = int(workers)
+    except ValueError:
+        raise pytest.UsageError("Number of workers must be an integer or 'auto', got '{}'".format(workers))
+
+    if workers < 0:
+        raise pytest.UsageError("Number of workers can't be negative")
+
+    return workers
+
+
+def _get_context():
+    # Workers need a copy of the collected tests, so they have to be forked
+    if not hasattr(os, "fork"):
+        raise pytest.UsageError("Running tests in parallel requires os.fork")
+
+    try:
+        return multiprocessing.get_context("fork")
+    except AttributeError:
+        # Python 2 - always forks
+        return multiprocessing
+
+
+class _ReportForwarder(object):
+    """Plugin used in a worker to send results back to the main process"""
+
+    def __init__(self, config, worker_id, conn):
+        self.config = config
+        self.worker_id = worker_id
+        self.conn = conn
+
+    def _send(self, kind, data):
+        self.conn.send((self.worker_id, kind, data))
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self._send("start", (nodeid, location))
+
+    def pytest_runtest_logreport(self, report):
+        data = self.config.hook.pytest_report_to_serializable(config=self.config, report=report)
+        self._send("report", data)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        self._send("finish", (nodeid, location))
+
+
+def _run_worker(session, worker_id, conn):
+    config = session.config
+
+    # Only the main process should print anything
+    terminal = config.pluginmanager.get_plugin("terminalreporter")
+    if terminal is not None:
+        config.pluginmanager.unregister(terminal)
+
+    config.pluginmanager.register(_ReportForwarder(config, worker_id, conn), "tavern_report_forwarder")
+
+    # Counts copied from the main process were already counted there
+    for cache in _counted_caches.values():
+        cache.reset_stats()
+
+    items = session.items
+
+    def next_index():
+        conn.send((worker_id, "next", None))
+        return conn.recv()
+
+    # Get the next item before running the current one so that pytest knows
+    # which fixtures it can keep
+    current = next_index()
+    while current is not None:
+        following = next_index()
+        nextitem = items[following] if following is not None else None
+
+        config.hook.pytest_runtest_protocol(item=items[current], nextitem=nextitem)
+
+        if session.shouldfail or session.shouldstop:
+            break
+
+        current = following
+
+    # Tests are loaded and validated in the worker, so send back the cache
+    # counts
+    stats = {name: cache.stats() for name, cache in _counted_caches.items()}
+    conn.send((worker_id, "done", stats))
+    conn.close()
+
+
+class ParallelRunner(object):
+    """Runs all the items in a session using worker processes
+
+    Each worker has a pipe to the main process which it uses to ask for the
+    next item to run and to send back reports. Pipes are used instead of a
+    multiprocessing.Queue so that everything a worker sent before exiting is
+    received, and so that the main process knows which items each worker has
+    taken. If a worker dies, the item it was running is reported as failed
+    and any other items it had taken are run by a new worker.
+
+    Args:
+        session (pytest.Session): session with collected items
+        n_workers (int): number of worker processes to use
+        setup_context (YamlItemContext): where 'setup' tests save their
+            variables - this is shared between all the workers while running
+    """
+
+    def __init__(self, session, n_workers, setup_context):
+        self.session = session
+        self.config = session.config
+        self.n_workers = min(n_workers, len(session.items))
+        self.setup_context = setup_context
+
+        self._context = None
+        self._todo = deque()
+        self._stopping = False
+        # worker id: (process, connection)
+        self._workers = {}
+        # worker id: indexes of items the worker has been given but not
+        # finished yet
+        self._claimed = {}
+        # worker id: events for the item the worker is currently running,
+        # reported together once it has finished
+        self._pending = {}
+        self._next_worker_id = 0
+
+    def run(self):
+        if not hasattr(self.config.hook, "pytest_report_to_serializable"):
+            raise pytest.UsageError("Running tests in parallel requires pytest 4.4 or later")
+
+        self._context = _get_context()
+        self._todo.extend(range(len(self.session.items)))
+
+        store_dir = tempfile.mkdtemp(prefix="tavern-setup-")
+        self.setup_context.store_dir = store_dir
+
+        logger.info("Running %d tests with %d workers", len(self.session.items), self.n_workers)
+
+        try:
+            for _ in range(self.n_workers):
+                self._start_worker()
+
+            self._collect_results()
+        finally:
+            for process, conn in self._workers.values():
+                conn.close()
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+            self.setup_context.store_dir = None
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+        if self.session.shouldfail:
+            raise self.session.Failed(self.session.shouldfail)
+        if self.session.shouldstop:
+            raise self.session.Interrupted(self.session.shouldstop)
+
+    def _start_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+
+        conn, worker_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.session, worker_id, worker_conn),
+        )
+        process.start()
+
+        # Only the worker should have this end open, so that reading from
+        # the pipe fails as soon as the worker exits
+        worker_conn.close()
+
+        self._workers[worker_id] = (process, conn)
+        self._claimed[worker_id] = []
+
+    def _collect_results(self):
+        while self._workers:
+            conns = {conn.fileno(): worker_id for worker_id, (_, conn) in self._workers.items()}
+            ready, _, _ = select.select(list(conns), [], [])
+
+            for fileno in ready:
+                worker_id = conns[fileno]
+                process, conn = self._workers[worker_id]
+
+                try:
+                    _, kind, data = conn.recv()
+                except EOFError:
+                    self._worker_crashed(worker_id)
+                    continue
+
+                if kind == "next":
+                    try:
+                        conn.send(self._give_item(worker_id))
+                    except (IOError, OSError):
+                        # Worker has gone, which will be noticed on the next
+                        # read from the pipe
+                        pass
+                elif kind == "done":
+                    for name, stats in data.items():
+                        _counted_caches[name].add_stats(stats)
+                    conn.close()
+                    process.join()
+                    del self._workers[worker_id]
+                elif kind == "start":
+                    self._pending[worker_id] = [(kind, data)]
+                elif kind == "report":
+                    self._pending[worker_id].append((kind, data))
+                elif kind == "finish":
+                    self._pending[worker_id].append((kind, data))
+                    self._claimed[worker_id].pop(0)
+                    self._replay(worker_id)
+
+            if self.session.shouldfail or self.session.shouldstop:
+                # Stop handing out tests
+                self._stopping = True
+
+    def _give_item(self, worker_id):
+        if self._stopping or not self._todo:
+            return None
+
+        index = self._todo.popleft()
+        self._claimed[worker_id].append(index)
+        return index
+
+    def _replay(self, worker_id):
+        """Report everything that happened while a worker ran one test, so
+        that output from different workers doesn't get mixed up"""
+        hook = self.config.hook
+
+        for kind, data in self._pending.pop(worker_id):
+            if kind == "start":
+                nodeid, location = data
+                hook.pytest_runtest_logstart(nodeid=nodeid, location=location)
+            elif kind == "report":
+                report = hook.pytest_report_from_serializable(config=self.config, data=data)
+                hook.pytest_runtest_logreport(report=report)
+            elif kind == "finish":
+                nodeid, location = data
+                hook.pytest_runtest_logfinish(nodeid=nodeid, location=location)
+
+    def _worker_crashed(self, worker_id):
+        process, conn = self._workers.pop(worker_id)
+        conn.close()
+
+        # Reap it, and find out why it exited
+        process.join()
+        exitcode = process.exitcode
+
+        claimed = self._claimed.pop(worker_id)
+        self._pending.pop(worker_id, None)
+
+        if not claimed:
+            logger.error("Worker %d exited with code %s", worker_id, exitcode)
+            return
+
+        # The first item it claimed is the one it was running
+        item = self.session.items[claimed.pop(0)]
+        logger.error("Worker %d exited with code %s while running %s", worker_id, exitcode, item.nodeid)
+
+        hook = self.config.hook
+        hook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        report = TestReport(
+            item.nodeid,
+            item.location,
+            {},
+            "failed",
+            "Worker process exited with code {} while running test".format(exitcode),
+            "call",
+        )
+        hook.pytest_runtest_logreport(report=report)
+        hook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+
+        if claimed and not self._stopping:
+            # Let another worker run the items it hadn't started yet
+            self._todo.extendleft(reversed(claimed))
+            self._start_worker()
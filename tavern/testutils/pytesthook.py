@@ -5,6 +5,7 @@ import logging
 import os
 import re
 from builtins import str as ustr
+from timeit import default_timer
 
 import attr
 import py
@@ -17,13 +18,24 @@ from future.utils import raise_from
 
 from box import Box
 from tavern.core import run_test
-from tavern.plugins import load_plugins
-from tavern.schemas.files import verify_tests
+from tavern.plugins import load_plugins, session_pool
+from tavern.schemas.files import verify_tests, validated_specs
 from tavern.util.import_util import import_ext_function
 from tavern.util import exceptions
-from tavern.util.dict_util import format_keys, deep_dict_merge
+from tavern.util.dict_util import format_keys, deep_dict_merge, copy_variables
 from tavern.util.general import load_global_config
-from tavern.util.loader import yaml_loader, schema_loader
+from tavern.util.loader import yaml_loader, schema_loader, spec_cache
+from tavern.util.log_utils import log_settings
+from tavern.util.jsonschema_util import jsonschema_settings, BACKENDS as JSONSCHEMA_BACKENDS
+from tavern.util.timing import stage_timings
+from tavern.testutils.parallel import ParallelRunner, get_n_workers
+from tavern.testutils.concurrency import ConcurrentRunner, get_aiohttp_concurrency
+from tavern.testutils.options import add_parser_options, add_ini_options
+from tavern.testutils.timing_report import configure_timing
+from tavern.testutils.global_config import load_session_global_cfg
+from tavern.testutils.setup_graph import (
+    setup_graph, get_setup_refs, resolve_setup_path, get_setup_concurrency, run_saved_setups,
+    yaml_item_context)
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +62,37 @@ def pytest_configure(config):
     schema_loader.base_dir = base_dir
     yaml_loader.base_dir = base_dir
 
+    cache_dir = config.getoption("tavern_cache_dir")
+    if cache_dir is None:
+        cache_dir = config.getini("tavern-cache-dir")
+    if cache_dir:
+        spec_cache.cache_dir = os.path.join(rootdir, cache_dir)
+
+    _configure_session_pool(config)
+
+    body_limit = config.getoption("tavern_log_body_limit")
+    if body_limit is None:
+        body_limit = config.getini("tavern-log-body-limit")
+    if body_limit not in (None, ""):
+        try:
+            log_settings.body_limit = int(body_limit)
+        except ValueError:
+            raise pytest.UsageError("tavern-log-body-limit must be an integer, got '{}'".format(body_limit))
+    log_settings.full_body_on_failure = bool(
+        config.getoption("tavern_log_full_body_on_failure") or
+        config.getini("tavern-log-full-body-on-failure"))
+
+    jsonschema_backend = config.getoption("tavern_jsonschema_backend")
+    if jsonschema_backend is None:
+        jsonschema_backend = config.getini("tavern-jsonschema-backend")
+    if jsonschema_backend:
+        if jsonschema_backend not in JSONSCHEMA_BACKENDS:
+            raise pytest.UsageError("tavern-jsonschema-backend must be one of {}, got '{}'".format(
+                ", ".join(JSONSCHEMA_BACKENDS), jsonschema_backend))
+        jsonschema_settings.backend = jsonschema_backend
+
+    configure_timing(config)
+
     for setup_function in setup_functions:
         try:
             fn = import_ext_function(setup_function)
@@ -63,6 +106,73 @@ def pytest_configure(config):
                 raise_from(exceptions.CallSetupFunctionError(
                     "Error Running setup function {}".format(setup_function)), e)
 
+
+def _configure_session_pool(config):
+    session_pool.enabled = bool(
+        config.getoption("tavern_http_session_pool") or
+        config.getini("tavern-http-session-pool"))
+    for option in ["pool_connections", "pool_maxsize"]:
+        value = config.getoption("tavern_http_" + option)
+        if value is None:
+            value = config.getini("tavern-http-" + option.replace("_", "-"))
+        if value:
+            try:
+                session_pool.session_options[option] = int(value)
+            except ValueError:
+                raise pytest.UsageError("tavern-http-{} must be an integer, got '{}'".format(
+                    option.replace("_", "-"), value))
+
+
+def pytest_unconfigure(config):
+    # pylint: disable=unused-argument
+    session_pool.close()
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Show how well the caches for loading and validating tests worked
+
+    The spec cache is only shown if it's enabled, and validation only with -v
+    """
+    lines = []
+
+    if spec_cache.cache_dir:
+        lines.append("spec cache: {hits} files loaded from the cache, {misses} loaded from disk "
+                     "({invalidations} because a file had changed)".format(**spec_cache.stats()))
+
+    validation_stats = validated_specs.stats()
+    if terminalreporter.verbosity > 0 and validation_stats["misses"]:
+        lines.append("validation: {misses} tests validated, {hits} skipped because a test with "
+                     "the same structure was already validated".format(**validation_stats))
+
+    if lines:
+        terminalreporter.write_sep("=", "tavern caches")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session):
+    """Run tests in worker processes if --tavern-workers is set, or run test
+    blocks using the aiohttp backend at the same time if
+    --tavern-aiohttp-concurrency is set"""
+    n_workers = get_n_workers(session.config)
+    concurrency = get_aiohttp_concurrency(session.config)
+
+    if (n_workers <= 1 and concurrency <= 1) or session.config.option.collectonly or not session.items:
+        # Use the normal pytest loop
+        return None
+
+    if session.testsfailed and not session.config.option.continue_on_collection_errors:
+        raise session.Interrupted("%d errors during collection" % session.testsfailed)
+
+    if n_workers > 1:
+        ParallelRunner(session, n_workers, yaml_item_context).run()
+    else:
+        ConcurrentRunner(session, concurrency).run()
+
+    return True
+
+
 def pytest_collect_file(parent, path):
     """On collecting files, get any files that end in .tavern.yaml or .tavern.yml as tavern
     test files
@@ -76,110 +186,12 @@ def pytest_collect_file(parent, path):
 
     return None
 
-def add_parser_options(parser_addoption, with_defaults=True):
-    """Add argparse options
-
-    This is shared between the CLI and pytest (for now)
-    """
-    parser_addoption(
-        "--tavern-global-cfg",
-        help="One or more global configuration files to include in every test",
-        required=False,
-        nargs="+",
-    )
-    parser_addoption(
-        "--tavern-http-backend",
-        help="Which http backend to use",
-        default='requests' if with_defaults else None,
-    )
-    parser_addoption(
-        "--tavern-mqtt-backend",
-        help="Which mqtt backend to use",
-        default='paho-mqtt' if with_defaults else None,
-    )
-    parser_addoption(
-        "--tavern-strict",
-        help="Default response matching strictness",
-        default=None,
-        nargs="+",
-        choices=["body", "headers", "redirect_query_params"],
-    )
-    parser_addoption(
-        "--tavern-beta-new-traceback",
-        help="Use new traceback style (beta)",
-        default=False,
-        action="store_true",
-    )
-    parser_addoption(
-        "--tavern-function-cfg",
-        help="One or more functions to get configuration to include in every test",
-        required=False,
-        nargs="+"
-    )
-    parser_addoption(
-        "--tavern-base-dir",
-        help="Base dir for tavern test case to include test case",
-        required=False,
-        default=None
-    )
-    parser_addoption(
-        "--tavern-setup-functions",
-        help="Initialize Tavern with config and loader",
-        required=False,
-        nargs="+"
-    )
-
-
 def pytest_addoption(parser):
     """Add an option to pass in a global config file for tavern
     """
     add_parser_options(parser.addoption, with_defaults=False)
+    add_ini_options(parser.addini)
 
-    parser.addini(
-        "tavern-global-cfg",
-        help="One or more global configuration files to include in every test",
-        type="linelist",
-        default=[]
-    )
-    parser.addini(
-        "tavern-http-backend",
-        help="Which http backend to use",
-        default="requests",
-    )
-    parser.addini(
-        "tavern-mqtt-backend",
-        help="Which mqtt backend to use",
-        default="paho-mqtt",
-    )
-    parser.addini(
-        "tavern-strict",
-        help="Default response matching strictness",
-        type="args",
-        default=None,
-    )
-    parser.addini(
-        "tavern-beta-new-traceback",
-        help="Use new traceback style (beta)",
-        type="bool",
-        default=False,
-    )
-    parser.addini(
-        "tavern-function-cfg",
-        help="One or more functions to get configuration to include in every test",
-        type="linelist",
-        default=[]
-    )
-    parser.addini(
-        "tavern-base-dir",
-        help="Base dir for tavern test case to include test case",
-        default=None
-    )
-    parser.addini(
-        "tavern-setup-functions",
-        help="Initialize Tavern with config and loader",
-        type="linelist",
-        default=[]
-    )
 
 class YamlFile(pytest.File):
 
@@ -336,7 +348,7 @@ class YamlFile(pytest.File):
             # Convert to a list so we can catch parser exceptions
             logger.debug("self.fspath:%s", self.fspath)
             path = str(self.fspath)
-            all_tests = [yaml_loader(path)]
+            all_tests = [spec_cache(path)]
         except yaml.parser.ParserError as e:
             raise_from(exceptions.BadSchemaError, e)
 
@@ -346,6 +358,8 @@ class YamlFile(pytest.File):
                     "Empty document in input file '%s'", self.fspath)
                 continue
 
+            setup_graph.add_test(self.config, test_spec)
+
             try:
                 for i in self._generate_items(test_spec):
                     i.initialise_fixture_attrs()
@@ -354,24 +368,6 @@ class YamlFile(pytest.File):
                 verify_tests(test_spec, with_plugins=False)
                 raise
 
-class YamlItemContext():
-    def __init__(self):
-        self.context = {}
-
-    def get_context(self, path):
-        if path not in self.context:
-            return None
-
-        return self.context[path]
-
-    def update_context(self, path, context):
-        if path in self.context:
-            self.context[path].update(context)
-        else:
-            self.context[path] = context
-
-yaml_item_context = YamlItemContext()
-
 
 class YamlItem(pytest.Item):
 
@@ -393,6 +389,10 @@ class YamlItem(pytest.Item):
         self.global_cfg = self._initialize_variables()
         self._resolve_variables(self.spec, self.global_cfg)
         self.exceptions = None
+        # Stage timings from the last run, if they're being recorded
+        self.tavern_timings = []
+        # Set if this test was started before pytest got to it - see run_in
+        self._started = None
 
     def initialise_fixture_attrs(self):
         # pylint: disable=protected-access,attribute-defined-outside-init
@@ -458,6 +458,9 @@ class YamlItem(pytest.Item):
         return cfg_after_hooks
 
     def _initialize_variables(self):
+        return load_session_global_cfg(self)
+
+    def _load_global_cfg(self):
         global_cfg = self._parse_arguments()
         global_cfg.setdefault("variables", {})
         tavern_box = Box({
@@ -573,16 +576,7 @@ class YamlItem(pytest.Item):
         return values
 
     def _run_setup(self, path):
-        base_dir = self.config.getoption("tavern_base_dir")
-        if base_dir is None:
-            base_dir = self.config.getini("tavern-base-dir")
-        rootdir = str(self.config.rootdir)
-        if base_dir is not None:
-            base_dir = os.path.join(rootdir, base_dir)
-        else:
-            base_dir = rootdir
-
-        path = os.path.join(base_dir, path[1:])
+        path = resolve_setup_path(self.config, path)
         setup_file = YamlFile(path, self.parent.parent)
         item = list(setup_file.collect())[0]
         item.runtest()
@@ -597,21 +591,36 @@ class YamlItem(pytest.Item):
             setup_path = setup["path"]
             if "saved" in setup and not setup["saved"]:
                 setup_varialbes = self._run_setup(setup_path)
-                return copy.deepcopy(setup_varialbes)
+                return copy_variables(setup_varialbes)
 
         # 如果context有就用context
         # isinstance(setup, str)
         # isinstance(setup, dict) "saved" in setup and setup["saved"] == Ture
         # isinstance(setup, dict) "saved" not in setup
-        setup_varialbes = yaml_item_context.get_context(setup_path)
         # 如果存在context，直接用
-        if not setup_varialbes:
-            setup_varialbes = self._run_setup(setup_path)
-            yaml_item_context.update_context(setup_path, setup_varialbes)
+        setup_varialbes = yaml_item_context.get_or_run(
+            setup_path, lambda: self._run_setup(setup_path))
+
+        return copy_variables(setup_varialbes)
 
-        return copy.deepcopy(setup_varialbes)
+    def run_in(self, pool):
+        """Start running this test in a thread pool, so that runtest only has
+        to wait for it to finish
+
+        Args:
+            pool (multiprocessing.pool.ThreadPool): pool to run it in
+        """
+        self._started = pool.apply_async(self._run)
 
     def runtest(self):
+        if self._started is not None:
+            started, self._started = self._started, None
+            # Raises the exception if it failed
+            started.get()
+        else:
+            self._run()
+
+    def _run(self):
         global_cfg = copy.deepcopy(self.global_cfg)
 
         global_cfg.setdefault("variables", {})
@@ -624,13 +633,27 @@ class YamlItem(pytest.Item):
         # and an error when running the test though.
         xfail = self.spec.get("_xfail", False)
        
+        start = default_timer()
+        setup_time = 0.0
+
         try:
             verify_tests(self.spec)
 
             if "setup" in self.spec:
-                for i in self.spec["setup"]:
-                    setup_varialbes = self._load_setup_varialbes(i)
-                    global_cfg["variables"].update(setup_varialbes)
+                setup_start = default_timer()
+                try:
+                    run_saved_setups(
+                        get_setup_refs(self.spec),
+                        yaml_item_context,
+                        self._run_setup,
+                        get_setup_concurrency(self.config),
+                    )
+
+                    for i in self.spec["setup"]:
+                        setup_varialbes = self._load_setup_varialbes(i)
+                        global_cfg["variables"].update(setup_varialbes)
+                finally:
+                    setup_time = default_timer() - setup_start
 
             fixture_values = self._load_fixture_values()
             global_cfg["variables"].update(fixture_values)
@@ -653,6 +676,10 @@ class YamlItem(pytest.Item):
                 raise exceptions.TestFailError(
                     "Expected test to fail at {} stage".format(xfail))
             self.global_cfg = global_cfg
+        finally:
+            if stage_timings.enabled:
+                stage_timings.add_test(self.name, str(self.path), default_timer() - start, setup_time)
+                self.tavern_timings = stage_timings.pop_records()
 
     def repr_failure(self, excinfo):  # pylint: disable=no-self-use
         """ called when self.runtest() raises an exception.
@@ -0,0 +1,337 @@
+"""Dependencies between 'setup' tests
+
+A test can list other tests to run before it under 'setup', and those tests
+can have their own setup tests. The graph of which setup tests depend on which
+is built while collecting so that loops are found before anything is run,
+and so that setup tests which don't depend on each other can be run at the
+same time.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from tavern.util import exceptions
+from tavern.util.loader import spec_cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_setup_refs(spec):
+    """Get the setup tests a test depends on
+
+    Args:
+        spec (dict): test spec
+
+    Returns:
+        list(tuple(str, bool)): path of each setup test, in the order they
+            are listed, and whether its variables are saved to be used again
+    """
+    refs = []
+
+    for setup in spec.get("setup", None) or []:
+        if isinstance(setup, dict):
+            refs.append((setup["path"], setup.get("saved", True) is not False))
+        else:
+            refs.append((setup, True))
+
+    return refs
+
+
+def resolve_setup_path(config, path):
+    """Get the file a setup path refers to
+
+    Setup paths are relative to tavern-base-dir, or the pytest root directory
+    if that isn't set.
+
+    Args:
+        config (pytest.Config): pytest config
+        path (str): path as given in 'setup'
+
+    Returns:
+        str: path to setup test file
+    """
+    base_dir = config.getoption("tavern_base_dir")
+    if base_dir is None:
+        base_dir = config.getini("tavern-base-dir")
+    rootdir = str(config.rootdir)
+    if base_dir is not None:
+        base_dir = os.path.join(rootdir, base_dir)
+    else:
+        base_dir = rootdir
+
+    return os.path.join(base_dir, path[1:])
+
+
+def get_setup_concurrency(config):
+    """Get how many setup tests can be run at the same time
+
+    Args:
+        config (pytest.Config): pytest config
+
+    Returns:
+        int: maximum number of threads to run setup tests in. 1 means run
+            them one after the other.
+    """
+    concurrency = config.getoption("tavern_setup_concurrency")
+    if concurrency is None:
+        concurrency = config.getini("tavern-setup-concurrency")
+
+    if not concurrency:
+        return 1
+
+    try:
+        concurrency = int(concurrency)
+    except ValueError:
+        raise pytest.UsageError("Setup concurrency must be an integer, got '{}'".format(concurrency))
+
+    if concurrency < 1:
+        raise pytest.UsageError("Setup concurrency must be at least 1")
+
+    return concurrency
+
+
+class SetupGraph(object):
+    """Which setup tests each setup test depends on, by the path used to
+    refer to them in 'setup'
+    """
+
+    def __init__(self):
+        # path: list of (path, saved) it depends on
+        self._deps = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        return path in self._deps
+
+    def clear(self):
+        with self._lock:
+            self._deps = {}
+
+    def _load_deps(self, config, path):
+        try:
+            spec = spec_cache(resolve_setup_path(config, path))
+        except Exception:  # pylint: disable=broad-except
+            # Raised properly when the setup test is actually run
+            logger.debug("Unable to load setup test '%s'", path, exc_info=True)
+            return []
+
+        try:
+            return get_setup_refs(spec or {})
+        except (TypeError, KeyError, AttributeError):
+            # Invalid setup block - raised when the test is verified
+            return []
+
+    def add_test(self, config, spec):
+        """Add the setup tests that a test depends on, and everything they
+        depend on
+
+        Args:
+            config (pytest.Config): pytest config
+            spec (dict): test spec
+
+        Raises:
+            SetupCycleError: a setup test depends on itself
+        """
+        try:
+            refs = get_setup_refs(spec)
+        except (TypeError, KeyError, AttributeError):
+            return
+
+        with self._lock:
+            for path, _ in refs:
+                self._add(config, path, [])
+
+    def _add(self, config, path, chain):
+        if path in chain:
+            raise exceptions.SetupCycleError(
+                "Setup tests depend on each other: {}".format(
+                    " -> ".join(chain[chain.index(path):] + [path])))
+
+        if path in self._deps:
+            # Already checked everything below it
+            return
+
+        deps = self._load_deps(config, path)
+
+        chain.append(path)
+        for dep, _ in deps:
+            self._add(config, dep, chain)
+        chain.pop()
+
+        self._deps[path] = deps
+
+    def saved_layers(self, refs):
+        """Group saved setup tests so that each group only depends on setup
+        tests in earlier groups
+
+        Only setup tests which are reached through saved references are
+        included, as other setup tests are run every time they are used.
+
+        Args:
+            refs (list(tuple(str, bool))): setup tests, as returned by
+                get_setup_refs
+
+        Returns:
+            list(list(str)): paths of setup tests to run, in groups
+        """
+        depths = {}
+
+        def depth(path):
+            if path not in depths:
+                saved_deps = [dep for dep, saved in self._deps.get(path, []) if saved]
+                depths[path] = 1 + max([depth(dep) for dep in saved_deps] or [-1])
+            return depths[path]
+
+        for path, saved in refs:
+            if saved:
+                depth(path)
+
+        layers = [[] for _ in range(max(list(depths.values()) or [-1]) + 1)]
+        for path in sorted(depths):
+            layers[depths[path]].append(path)
+
+        return layers
+
+
+setup_graph = SetupGraph()
+
+
+def run_saved_setups(refs, context, run_setup, concurrency):
+    """Run saved setup tests that haven't been run yet, running any which
+    don't depend on each other at the same time
+
+    Args:
+        refs (list(tuple(str, bool))): setup tests that a test uses
+        context (YamlItemContext): where saved variables are kept
+        run_setup (callable): called with a setup path to run it and return
+            the variables it saved
+        concurrency (int): maximum number of setup tests to run at once
+    """
+    if concurrency <= 1:
+        return
+
+    layers = setup_graph.saved_layers(refs)
+    pending = [[p for p in layer if not context.get_context(p)] for layer in layers]
+
+    if not any(len(layer) > 1 for layer in pending):
+        # Nothing to gain from threads
+        return
+
+    def run(path):
+        context.get_or_run(path, lambda: run_setup(path))
+
+    pool = ThreadPool(min(concurrency, max(len(layer) for layer in pending)))
+    try:
+        for layer in pending:
+            logger.debug("Running setup tests %s", layer)
+            pool.map(run, layer)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class YamlItemContext(object):
+    """Variables saved by running 'setup' tests, by the path of the test
+
+    Each setup test is only run once, even if several threads need it at the
+    same time.
+
+    When tests are run in parallel, store_dir is set to a directory shared by
+    all the worker processes. Variables are also saved there so that each setup
+    test is only run by one worker, and the others wait for it and then reuse
+    the variables.
+    """
+
+    def __init__(self):
+        self.context = {}
+        self.store_dir = None
+        self._lock = threading.Lock()
+        self._path_locks = {}
+
+    def _path_lock(self, path):
+        with self._lock:
+            # Reentrant so that a loop of setup tests which wasn't found when
+            # collecting doesn't just hang
+            return self._path_locks.setdefault(path, threading.RLock())
+
+    def get_context(self, path):
+        if path not in self.context:
+            return None
+
+        return self.context[path]
+
+    def update_context(self, path, context):
+        if path in self.context:
+            self.context[path].update(context)
+        else:
+            self.context[path] = context
+
+    def get_or_run(self, path, run_setup):
+        """Get variables saved by the setup test at path, running it if it
+        hasn't been run yet
+
+        Args:
+            path (str): path to setup test
+            run_setup (callable): runs the setup test and returns the variables
+                it saved
+
+        Returns:
+            dict: saved variables
+        """
+        variables = self.get_context(path)
+        if variables:
+            return variables
+
+        with self._path_lock(path):
+            # Might have been run by another thread while waiting
+            variables = self.get_context(path)
+
+            if not variables:
+                if self.store_dir is None:
+                    variables = run_setup()
+                else:
+                    variables = self._get_or_run_shared(path, run_setup)
+
+                self.update_context(path, variables)
+
+        return variables
+
+    def _get_or_run_shared(self, path, run_setup):
+        import fcntl  # Only available on unix, but so is running in parallel
+
+        name = hashlib.sha1(path.encode("utf8")).hexdigest()
+        filename = os.path.join(self.store_dir, name + ".pickle")
+
+        with open(os.path.join(self.store_dir, name + ".lock"), "a") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+
+            try:
+                with open(filename, "rb") as sfile:
+                    variables = pickle.load(sfile)
+            except (IOError, OSError):
+                variables = None
+
+            if variables:
+                logger.debug("Using variables from setup '%s' run by another worker", path)
+                return variables
+
+            variables = run_setup()
+
+            try:
+                dumped = pickle.dumps(variables, pickle.HIGHEST_PROTOCOL)
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("Unable to share variables from setup '%s' with other workers", path, exc_info=True)
+            else:
+                with open(filename, "wb") as sfile:
+                    sfile.write(dumped)
+
+            return variables
+
+
+yaml_item_context = YamlItemContext()
@@ -0,0 +1,178 @@
+"""Summarise timings recorded while running tests
+
+The timings recorded while running each test are attached to its pytest
+report, so that they get back to the main process when running tests in
+worker processes. TimingReport collects them from the reports, shows the
+slowest stages and endpoints at the end of the run and optionally writes
+everything to a JSON or CSV file.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import pytest
+
+from tavern.util.load import percentile
+from tavern.util.timing import PHASES, stage_timings
+
+logger = logging.getLogger(__name__)
+
+
+# Number of stages and endpoints to show in the terminal summary
+N_SLOWEST = 10
+
+_SUMMARY_FIELDS = ["kind", "name", "count", "failed", "mean", "p50", "p90", "p95", "p99", "max"] + \
+    ["mean_{}".format(p) for p in PHASES] + ["mean_setup"]
+
+
+def summarise(records):
+    """Get percentiles of how long each stage, endpoint and test took
+
+    Args:
+        records (list(dict)): records from StageTimings
+
+    Returns:
+        list(OrderedDict): one row for each stage, endpoint and test, with
+            _SUMMARY_FIELDS
+    """
+    groups = OrderedDict()
+
+    def add(kind, name, record):
+        groups.setdefault((kind, name), []).append(record)
+
+    for record in records:
+        if record["kind"] == "stage":
+            add("stage", "{}::{}".format(record["test"], record["stage"]), record)
+            if record["endpoint"]:
+                add("endpoint", record["endpoint"], record)
+        else:
+            add("test", "{}::{}".format(record["path"], record["test"]), record)
+
+    rows = []
+
+    for (kind, name), group in groups.items():
+        totals = sorted(r["total"] for r in group)
+
+        row = OrderedDict((key, None) for key in _SUMMARY_FIELDS)
+        row.update(
+            kind=kind,
+            name=name,
+            count=len(group),
+            failed=sum(1 for r in group if r.get("status") == "failed"),
+            mean=sum(totals) / len(totals),
+            max=totals[-1],
+        )
+        for p in [50, 90, 95, 99]:
+            row["p{}".format(p)] = percentile(totals, p)
+
+        if kind == "test":
+            row["mean_setup"] = sum(r["setup"] for r in group) / len(group)
+        else:
+            for phase in PHASES:
+                row["mean_{}".format(phase)] = sum(r["phases"].get(phase, 0.0) for r in group) / len(group)
+
+        rows.append(row)
+
+    return rows
+
+
+def configure_timing(config):
+    """Turn on timings and show or write the report at the end of the run if
+    --tavern-timing or --tavern-timing-report are set
+
+    Args:
+        config (pytest.Config): pytest config
+    """
+    timing_report = config.getoption("tavern_timing_report")
+    if timing_report is None:
+        timing_report = config.getini("tavern-timing-report")
+
+    if timing_report or config.getoption("tavern_timing") or config.getini("tavern-timing"):
+        stage_timings.enabled = True
+        if timing_report:
+            timing_report = os.path.join(str(config.rootdir), timing_report)
+        config.pluginmanager.register(TimingReport(timing_report), "tavern_timing_report")
+
+
+class TimingReport(object):
+    """pytest plugin which collects timings from test reports
+
+    Args:
+        report_path (str): file to write the report to, ending with .json
+            or .csv, or None to only show the summary
+    """
+
+    def __init__(self, report_path=None):
+        self.report_path = report_path
+        self.records = []
+
+        if report_path and not report_path.endswith((".json", ".csv")):
+            raise pytest.UsageError("Timing report must be a .json or .csv file, got '{}'".format(report_path))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+
+        if call.when == "call":
+            report = outcome.get_result()
+            report.tavern_timings = getattr(item, "tavern_timings", [])
+
+    def pytest_runtest_logreport(self, report):
+        self.records.extend(getattr(report, "tavern_timings", None) or [])
+
+    def pytest_sessionfinish(self, session):
+        # pylint: disable=unused-argument
+        if self.report_path:
+            self.write(self.report_path)
+
+    def write(self, path):
+        rows = summarise(self.records)
+
+        if path.endswith(".json"):
+            with io.open(path, "w", encoding="utf8") as report_file:
+                report_file.write(json.dumps(
+                    {"summary": rows, "records": self.records}, indent=2, ensure_ascii=False))
+        else:
+            with open(path, "w") as report_file:
+                writer = csv.DictWriter(report_file, _SUMMARY_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+
+        logger.info("Wrote timing report to %s", path)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        rows = summarise(self.records)
+        if not rows:
+            return
+
+        terminalreporter.write_sep("=", "tavern timings")
+
+        def show(title, kind):
+            slowest = sorted((r for r in rows if r["kind"] == kind), key=lambda r: r["p95"], reverse=True)
+            if not slowest:
+                return
+
+            terminalreporter.write_line("slowest {} (by p95):".format(title))
+            for row in slowest[:N_SLOWEST]:
+                terminalreporter.write_line("  {:8.3f}s p95 {:8.3f}s mean {:5d}x  {}".format(
+                    row["p95"], row["mean"], row["count"], row["name"]))
+
+        show("stages", "stage")
+        show("endpoints", "endpoint")
+
+        # Where time goes in all stages, to spot slowdowns in tavern itself
+        stage_records = [r for r in self.records if r["kind"] == "stage"]
+        total = sum(r["total"] for r in stage_records)
+        if total:
+            spent = []
+            for phase in PHASES:
+                phase_total = sum(r["phases"].get(phase, 0.0) for r in stage_records)
+                spent.append("{} {:.1f}%".format(phase, 100 * phase_total / total))
+            terminalreporter.write_line("time in stages: {}".format(", ".join(spent)))
+
+        if self.report_path:
+            terminalreporter.write_line("timing report written to {}".format(self.report_path))
@@ -1,12 +1,16 @@
 import re
 import logging
 import random
+import threading
 from future.utils import raise_from
 from . import exceptions
 from .compat import basestring, builtin_str, integer_types
 from .dict_util import check_keys_match_recursive
 from functools import reduce
-from jsonschema import validate
+from collections import Counter
+from .jsonschema_util import validate
+from .log_utils import Truncated
+from .cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -30,11 +34,84 @@ def random_string(length=8, prefix="", has_number=True, has_uppercase=True, has_
 def uuid(prefix=""):
     return random_string(prefix=prefix)
 
+
+# Tags for canonical keys of unhashable values. They can't be in any response,
+# so a canonical key is never equal to a hashable item.
+_DICT = object()
+_LIST = object()
+_SET = object()
+_BAG = object()
+
+# Types of (almost) everything in a decoded JSON body apart from objects and
+# arrays, which are checked for first
+_scalar_types = frozenset(list(integer_types) + [float, bool, type(None), bytes, type(u"")])
+
+
+def _canonical_key(value):
+    """Get a hashable key for value which is equal to the key of any other
+    value that compares equal to it
+
+    Dicts, lists and sets (eg decoded JSON objects and arrays) are converted
+    to tagged tuples and frozensets, so {"a": 1} and {"a": 1.0} have equal
+    keys, but [1] and (1,) don't. Anything else is its own key.
+
+    The key of a value containing something unhashable which isn't one of
+    those, eg a bytearray, raises TypeError when it is hashed.
+    """
+    if type(value) in _scalar_types:
+        return value
+    elif isinstance(value, dict):
+        return (_DICT, frozenset([(k, _canonical_key(v)) for k, v in value.items()]))
+    elif isinstance(value, list):
+        return (_LIST, tuple([_canonical_key(v) for v in value]))
+    elif isinstance(value, tuple):
+        return tuple([_canonical_key(v) for v in value])
+    elif isinstance(value, (set, frozenset)):
+        return (_SET, frozenset([_canonical_key(v) for v in value]))
+
+    return value
+
+
+class _FirstIndexes(object):
+    """Remembers the index each distinct value was first seen at
+
+    Values are looked up by their canonical key, so this takes linear time
+    overall. Anything which can't be given a key is compared with == against
+    the other values like that, one by one.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._unhashable = []
+
+    def add(self, value, index):
+        """Add a value, if an equal value hasn't been added already
+
+        Returns:
+            int: index of the equal value added before, or None if there
+                wasn't one
+        """
+        try:
+            key = _canonical_key(value)
+            first_index = self._indexes.get(key)
+        except TypeError:
+            for seen, seen_index in self._unhashable:
+                if seen == value:
+                    return seen_index
+            self._unhashable.append((value, index))
+            return None
+
+        if first_index is None:
+            self._indexes[key] = index
+
+        return first_index
+
+
 # comparator
 
 
-def jsonschema_validation(check_value, schema):
-    validate(check_value, schema)
+def jsonschema_validation(check_value, schema, check_formats=False):
+    validate(check_value, schema, check_formats=check_formats)
 
 
 def unique_item_properties(check_value, keys_or_indexs):
@@ -42,20 +119,14 @@ def unique_item_properties(check_value, keys_or_indexs):
         check_value, (list, tuple)), "Check value for unique_item_properties must be list or tuple, value is: %s" % check_value
     if not isinstance(keys_or_indexs, (list, tuple)):
         keys_or_indexs = [keys_or_indexs]
-    exist = {}
+    exist = [(key_or_index, _FirstIndexes()) for key_or_index in keys_or_indexs]
     for index, item in enumerate(check_value):
         assert isinstance(item, (dict, list, tuple)
                           ), "item in Check value for unique_item_properties must be collection,value is: {},index is: {}".format(item, index)
 
-        for key_or_index in keys_or_indexs:
-            if key_or_index not in exist:
-                exist[key_or_index] = []
-
-            value = item[key_or_index]
-            assert value not in exist[key_or_index], "Found duplicate value, index is {} - {}".format(
-                exist[key_or_index].index(value), index)
-
-            exist[key_or_index].append(value)
+        for key_or_index, first_indexes in exist:
+            first_index = first_indexes.add(item[key_or_index], index)
+            assert first_index is None, "Found duplicate value, index is {} - {}".format(first_index, index)
 
 
 def equals(check_value, expect_value, **kwargs):
@@ -76,55 +147,134 @@ def element_equals_with_index(check_list, expect_value, **kwargs):
         equals(check_list[index], expect_value)
 
 
+def _unordered_key(value):
+    """Like _canonical_key, but lists (at any depth, until inside a dict)
+    have the same key whatever order their elements are in"""
+    if type(value) in _scalar_types:
+        return value
+    elif isinstance(value, list):
+        return (_BAG, frozenset(Counter([_unordered_key(v) for v in value]).items()))
+    elif isinstance(value, tuple):
+        return tuple([_unordered_key(v) for v in value])
+    return _canonical_key(value)
+
+
+class _Multiset(object):
+    """Counts how many times each distinct value appears in some values
+
+    Values are counted by key (eg _canonical_key), so counting takes linear
+    time. If any values can't be given a hashable key, those are compared
+    with == against each other one by one instead.
+
+    Args:
+        values (list): values to count
+        key (callable): gets the key to count a value by
+    """
+
+    def __init__(self, values, key):
+        # [value, count] for values which couldn't be given a key
+        self._unhashable = []
+
+        try:
+            keys = [key(value) for value in values]
+            self._counts = Counter(keys)
+        except TypeError:
+            self._counts = Counter()
+            self._values = {}
+            for value in values:
+                self._add_one(value, key)
+        else:
+            # One of the values with each key, to report differences with
+            self._values = dict(zip(keys, values))
+
+    def _add_one(self, value, key):
+        try:
+            value_key = key(value)
+            self._counts[value_key] += 1
+        except TypeError:
+            counted = self._find_unhashable(value)
+            if counted is None:
+                self._unhashable.append([value, 1])
+            else:
+                counted[1] += 1
+        else:
+            self._values.setdefault(value_key, value)
+
+    def _find_unhashable(self, value):
+        return next((c for c in self._unhashable if c[0] == value), None)
+
+    def missing_from(self, other):
+        """Get the values which appear more times in this than in other
+
+        Returns:
+            list: each value, repeated by how many more times it appears
+        """
+        # pylint: disable=protected-access
+        missing = []
+        for value_key, count in self._counts.items():
+            missing.extend([self._values[value_key]] * (count - other._counts.get(value_key, 0)))
+
+        for value, count in self._unhashable:
+            counted = other._find_unhashable(value)
+            missing.extend([value] * (count - (counted[1] if counted else 0)))
+
+        return missing
+
+
+def _pick_check_key(items, check_key, name):
+    """Get the value of check_key in each item, or a tuple of the values if
+    check_key is a list of keys"""
+    try:
+        if isinstance(check_key, (list, tuple)):
+            return [tuple([item[key] for key in check_key]) for item in items]
+        return [item[check_key] for item in items]
+    except (KeyError, IndexError, TypeError):
+        pass
+
+    # Find which one wasn't there
+    keys = check_key if isinstance(check_key, (list, tuple)) else [check_key]
+    for item in items:
+        for key in keys:
+            try:
+                item[key]
+            except (KeyError, IndexError, TypeError):
+                raise AssertionError(
+                    """
+                    not found {} in {} in {}
+                    """.format(key, item, name))
+
+
 def equals_ignore_order(check_list, expect_list, **kwargs):
+    """Check two lists have the same elements, the same number of times, in
+    any order
+
+    Elements which are lists are also compared ignoring order. With
+    check_key, only the value of that key (or index) of each element is
+    compared, or the values of each key if it is a list.
+    """
     assert isinstance(check_list, (list, tuple)
-                      ), "Check list for equal_ignore_order must be list or tuple, given value is %s" % check_list
+                      ), "Check list for equal_ignore_order must be list or tuple, given value is %s" % (check_list,)
     assert isinstance(expect_list, (list, tuple)
-                      ), "Expect list for equal_ignore_order must be list or tuple, given value is %s" % check_list
-    assert len(check_list) == len(expect_list)
-    check_key = None
-    if "check_key" in kwargs:
-        check_key = kwargs["check_key"]
-    if not check_key:
-        # list, tuple
-        if isinstance(check_list[0], (list, tuple)):
-            for i in range(len(check_list)):
-                equals_ignore_order(check_list[i], expect_list[i])
-        # string, number, boolean
-        elif set(check_list) != set(expect_list):
-            raise AssertionError(
-                """
-                When ignore order, two lists are not equal. Check list is {}, expect list is {}
-                """.format(check_list, check_list))
-    # dict, check_key must be string or number
-    else:
-        ckeys = []
-        ekeys = []
-        if isinstance(check_key, str):
-            for i in range(len(check_list)):
-                if check_key not in check_list[i] or check_key not in expect_list[i]:
-                    raise AssertionError(
-                    """
-                    not found {} in {} or {}
-                    """.format(check_key, check_list[i], expect_list[i]))
-                ckeys.append(check_list[i])
-                ekeys.append(expect_list[i])
-        elif isinstance(check_key, (list, tuple)):
-            check_value_list = []
-            expect_value_list = []
-            for i in range(len(check_list)):
-                for j in check_key:
-                    if j not in check_list[i] or j not in expect_list[i]:
-                        raise AssertionError(
-                        """
-                        not found {} in {} or {}
-                        """.format(j, check_list[i], expect_list[i]))
-                    check_value_list.append(check_list[i][j])
-                    expect_value_list.append(expect_list[i][j])
-                ckeys.append(check_value_list)
-                ekeys.append(expect_value_list)
+                      ), "Expect list for equal_ignore_order must be list or tuple, given value is %s" % (expect_list,)
+
+    check_key = kwargs.get("check_key")
+    # 0 is a valid index
+    if check_key or (isinstance(check_key, integer_types) and not isinstance(check_key, bool)):
+        check_list = _pick_check_key(check_list, check_key, "check list")
+        expect_list = _pick_check_key(expect_list, check_key, "expect list")
+
+    check_counts = _Multiset(check_list, _unordered_key)
+    expect_counts = _Multiset(expect_list, _unordered_key)
+
+    missing = expect_counts.missing_from(check_counts)
+    extra = check_counts.missing_from(expect_counts)
+
+    if missing or extra:
+        raise AssertionError(
+            """
+            When ignore order, two lists are not equal. Missing from check list: {}, extra in check list: {}
+            """.format(Truncated(missing), Truncated(extra)))
 
-        equals_ignore_order(ckeys, ekeys)
 
 def list_equals_by_sorted_key(check_list, expect_list, **kwargs):
     assert isinstance(check_list, (list, tuple)
@@ -145,15 +295,22 @@ def list_equals_by_sorted_key(check_list, expect_list, **kwargs):
 
 
 def unique_item_in_list(check_list):
-    checked = []
-    for i in check_list:
-        if i in checked:
+    # Usually there aren't any duplicates, which is quickest to check with a
+    # set. Only go through one by one to find the duplicate if there is one.
+    try:
+        if len(set([_canonical_key(i) for i in check_list])) == len(check_list):
+            return True
+    except TypeError:
+        pass
+
+    first_indexes = _FirstIndexes()
+    for index, i in enumerate(check_list):
+        first_index = first_indexes.add(i, index)
+        if first_index is not None:
             raise AssertionError(
                 """
-                element is not unique in list, element is {}, check_list is {}
-                """.format(i, check_list))
-        else:
-            checked.append(i)
+                element is not unique in list, element is {}, index is {} - {}, check_list is {}
+                """.format(i, first_index, index, Truncated(check_list)))
     return True
 
 
@@ -216,45 +373,165 @@ def contains(check_value, expect_value):
     assert expect_value in check_value
 
 
-def _list_contains(check_list, check_value, **kwargs):
-    assert isinstance(check_list, (list, tuple)
-                      ), "Check list must be list or tuple, given value is %s" % check_list
-    check_key = kwargs["check_key"] if "check_key" in kwargs else None
-    unique_key = kwargs["unique_key"] if "unique_key" in kwargs else None
+class _ListIndex(object):
+    """The values picked out of each element of a list, for checking whether
+    the list contains something in constant time
 
-    # unique_key in check_value
-    if unique_key:
-        for i in check_list:
-            if check_value[unique_key] == i[unique_key]:
+    Elements which don't have the key being looked at are left out. Values
+    which can't be given a canonical key are compared with == one by one.
+
+    Args:
+        check_list (list): list to index
+        pick (callable): gets the value to look for from an element
+    """
+
+    def __init__(self, check_list, pick):
+        self.check_list = check_list
+        self._keys = set()
+        self._unhashable = []
+
+        for item in check_list:
+            try:
+                value = pick(item)
+            except (KeyError, IndexError, TypeError):
+                continue
+
+            try:
+                self._keys.add(_canonical_key(value))
+            except TypeError:
+                self._unhashable.append(value)
+
+    def __contains__(self, value):
+        try:
+            if _canonical_key(value) in self._keys:
                 return True
-        return False
+        except TypeError:
+            pass
+
+        return any(value == other for other in self._unhashable)
+
+
+# Indexes of lists in the response being verified, by identity of the list
+# and what is being looked for. Each thread has its own, because responses are
+# verified in several threads at once by parallel stage groups and load mode,
+# and each thread clears its indexes with clear_list_indexes for each
+# response so that bodies aren't kept after they've been verified.
+_list_indexes = threading.local()
+
+
+def get_list_index_cache():
+    """Get the cache of list indexes for the current thread
+
+    Returns:
+        LRUCache: indexes of lists in the response being verified
+    """
+    try:
+        return _list_indexes.cache
+    except AttributeError:
+        cache = _list_indexes.cache = LRUCache(maxsize=16, name="list indexes")
+        return cache
+
+
+def clear_list_indexes():
+    """Forget indexes of lists built by list_contains_with_items and
+    list_not_contains_with_items in the current thread"""
+    cache = get_list_index_cache()
+    if cache:
+        cache.clear()
+
+
+def _get_list_index(check_list, check_key, unique_key):
+    if unique_key:
+        spec = ("unique_key", unique_key)
+        pick = lambda item: item[unique_key]
+    elif isinstance(check_key, (list, tuple)):
+        spec = ("check_keys", tuple(check_key))
+        pick = lambda item: {key: item[key] for key in check_key}
     elif check_key:
-        if isinstance(check_key, (list, tuple)):
-            for i in check_list:
-                element = {}
-                for key in check_key:
-                    element[key] = i[key]
-                if check_value == element:
-                    return True
-            return False
-        else:
-            for i in check_list:
-                if check_value == i[check_key]:
-                    return True
-            return False
+        spec = ("check_key", check_key)
+        pick = lambda item: item[check_key]
+    else:
+        spec = ("item",)
+        pick = lambda item: item
+
+    # The index keeps a reference to the list, so another list can't get the
+    # same id while it's cached. The length is checked in case something has
+    # been added to or removed from the list since it was indexed.
+    try:
+        cache_key = (id(check_list), len(check_list), spec)
+        hash(cache_key)
+    except TypeError:
+        return _ListIndex(check_list, pick)
+
+    return get_list_index_cache().get_or_create(cache_key, lambda: _ListIndex(check_list, pick))
+
+
+def _list_contains(check_list, check_values, **kwargs):
+    """Check which of some values are in a list
+
+    The list is indexed the first time it is checked, so checking the same
+    list again (eg in another validator for the same response) only takes
+    as long as looking up each value.
+
+    Args:
+        check_list (list): list to look in
+        check_values (list): values to look for
+        unique_key (str): only compare the value of this key in each
+            element and value
+        check_key (str, list): compare values to the value of this key, or a
+            dict of the values of these keys, in each element
+
+    Returns:
+        list(bool): whether each value is in the list
+    """
+    assert isinstance(check_list, (list, tuple)
+                      ), "Check list must be list or tuple, given value is %s" % (check_list,)
+    check_key = kwargs.get("check_key")
+    unique_key = kwargs.get("unique_key")
+
+    index = _get_list_index(check_list, check_key, unique_key)
+
+    if unique_key:
+        return [check_value[unique_key] in index for check_value in check_values]
+    return [check_value in index for check_value in check_values]
 
 
 def list_contains_with_items(check_list, check_value, **kwargs):
-    if not _list_contains(check_list, check_value, **kwargs):
-        raise AssertionError("%s not found in %s" % (check_value, check_list))
+    if not _list_contains(check_list, [check_value], **kwargs)[0]:
+        raise AssertionError("%s not found in %s" % (check_value, Truncated(check_list)))
     return
 
 
 def list_not_contains_with_items(check_list, check_value, **kwargs):
-    if _list_contains(check_list, check_value, **kwargs):
-        raise AssertionError("%s not found in %s" % (check_value, check_list))
+    if _list_contains(check_list, [check_value], **kwargs)[0]:
+        raise AssertionError("%s found in %s" % (check_value, Truncated(check_list)))
     return
 
+
+def list_contains_all_items(check_list, check_values, **kwargs):
+    """Like list_contains_with_items for each of check_values, but reports
+    all of them which weren't found"""
+    assert isinstance(check_values, (list, tuple)
+                      ), "Check values must be list or tuple, given value is %s" % (check_values,)
+
+    found = _list_contains(check_list, check_values, **kwargs)
+    missing = [value for value, is_found in zip(check_values, found) if not is_found]
+    if missing:
+        raise AssertionError("%s not found in %s" % (Truncated(missing), Truncated(check_list)))
+
+
+def list_not_contains_any_items(check_list, check_values, **kwargs):
+    """Like list_not_contains_with_items for each of check_values, but
+    reports all of them which were found"""
+    assert isinstance(check_values, (list, tuple)
+                      ), "Check values must be list or tuple, given value is %s" % (check_values,)
+
+    found = _list_contains(check_list, check_values, **kwargs)
+    present = [value for value, is_found in zip(check_values, found) if is_found]
+    if present:
+        raise AssertionError("%s found in %s" % (Truncated(present), Truncated(check_list)))
+
+
 def item_equals_in_list(check_list, check_key = "", **kwargs):
     assert isinstance(check_list, (list, tuple)
                       ), "Check list must be list or tuple, given value is %s" % check_list
@@ -0,0 +1,100 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """Cache with a maximum size, which throws away the least recently used
+    value when it is full
+
+    It can be shared between threads - values are created outside of the lock,
+    so a slow create doesn't hold up other threads, and if two threads create
+    the same value at once the first one to finish is kept.
+
+    Args:
+        maxsize (int): maximum number of values to keep
+        name (str): what is being cached, used when logging
+    """
+
+    def __init__(self, maxsize, name="values"):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self.name = name
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get_or_create(self, key, create):
+        """Get the value for key, or create it and remember it if it isn't
+        cached yet
+
+        If create raises an exception, nothing is cached.
+
+        Args:
+            key: hashable key for value
+            create (callable): called with no arguments to create the value
+
+        Returns:
+            object: cached or created value
+        """
+        with self._lock:
+            try:
+                value = self._values.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                # Reinserting moves it to the most recently used end
+                self._values[key] = value
+                return value
+
+        created = create()
+
+        with self._lock:
+            # Another thread might have created it in the meantime
+            value = self._values.pop(key, created)
+
+            while len(self._values) >= self.maxsize:
+                self._values.popitem(last=False)
+                self.evictions += 1
+
+            self._values[key] = value
+            return value
+
+    def clear(self):
+        """Remove all cached values and reset the statistics"""
+        logger.debug("Clearing cache of %s: %s", self.name, self.stats())
+
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Get statistics about how well the cache is working
+
+        Returns:
+            dict: hits, misses, evictions, current size, and maximum size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._values),
+                "maxsize": self.maxsize,
+            }
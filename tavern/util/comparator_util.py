@@ -1,11 +1,92 @@
+import logging
+
+import stevedore
+
 from .exceptions import InvalidBuildInComparatorError, DuplicateAliasError, InvalidAliasTypeError
-from .import_util import import_ext_function
 from .compat import basestring
 
+logger = logging.getLogger(__name__)
+
+
+# Name of function in built_in and all the aliases which can be used for it
+_built_in_aliases = [
+    ("equals", ["eq", "equals", "==", "is"]),
+    ("element_equals_with_index", ["element_equals_with_index"]),
+    ("equals_ignore_order", ["equals_ignore_order"]),
+    ("list_equals_by_sorted_key", ["list_equals_by_sorted_key"]),
+    ("list_contains_with_items", ["list_contains_with_items"]),
+    ("list_not_contains_with_items", ["list_not_contains_with_items"]),
+    ("list_contains_all_items", ["list_contains_all_items"]),
+    ("list_not_contains_any_items", ["list_not_contains_any_items"]),
+    ("item_equals_in_list", ["item_equals_in_list"]),
+    ("not_contains", ["not_contains"]),
+    ("contains", ["contains"]),
+    ("less_than", ["lt", "less_than"]),
+    ("less_than_or_equals", ["le", "less_than_or_equals"]),
+    ("greater_than", ["gt", "greater_than"]),
+    ("greater_than_or_equals", ["ge", "greater_than_or_equals"]),
+    ("not_equals", ["ne", "not_equals"]),
+    ("string_equals", ["str_eq", "string_equals"]),
+    ("length_equals", ["len_eq", "length_equals", "count_eq"]),
+    ("length_greater_than", ["len_gt", "count_gt", "length_greater_than", "count_greater_than"]),
+    ("length_greater_than_or_equals", ["len_ge", "count_ge", "length_greater_than_or_equals",
+                                       "count_greater_than_or_equals"]),
+    ("length_less_than", ["len_lt", "count_lt", "length_less_than", "count_less_than"]),
+    ("length_less_than_or_equals", ["len_le", "count_le", "length_less_than_or_equals",
+                                    "count_less_than_or_equals"]),
+    ("jsonschema_validation", ["jsonschema", "jsonschema_validation", "jv"]),
+    ("unique_item_properties", ["unique_item_properties", "uip"]),
+    ("unique_item_in_list", ["unique_item_in_list"]),
+    ("startswith", ["startswith", ""]),
+]
+
+# Entry point namespace that other packages can use to add comparators. The
+# name of the entry point is the alias.
+ENTRY_POINT_NAMESPACE = "tavern_comparators"
+
 
 class ComparatorManager(object):
+    """Map of alias to comparator function
+
+    The built in comparators and any registered with the 'tavern_comparators'
+    entry point are added the first time a comparator is added or looked up,
+    after which getting a comparator is a single dictionary lookup.
+    """
+
     def __init__(self):
         self._comparators = {}
+        self._loaded = False
+
+    def _load(self):
+        """Add built in comparators and comparators from entry points"""
+        # Imported here because built_in indirectly imports this module
+        from . import built_in
+        from tavern.plugins import plugin_load_error
+
+        loaded = {}
+
+        def register(alias, comparator):
+            if alias in loaded:
+                raise DuplicateAliasError(
+                    "Alias {} is already defined in other comparator".format(alias))
+            loaded[alias] = comparator
+
+        for name, aliases in _built_in_aliases:
+            comparator = getattr(built_in, name)
+            for alias in aliases:
+                register(alias, comparator)
+
+        manager = stevedore.ExtensionManager(
+            namespace=ENTRY_POINT_NAMESPACE,
+            on_load_failure_callback=plugin_load_error,
+        )
+
+        for ext in manager.extensions:
+            logger.debug("Adding comparator '%s' from %s", ext.name, ext.entry_point)
+            register(ext.name, ext.plugin)
+
+        self._comparators = loaded
+        self._loaded = True
 
     def add_comparator(self, aliases, comparator):
         if isinstance(aliases, basestring):
@@ -14,77 +95,26 @@ class ComparatorManager(object):
             raise InvalidAliasTypeError(
                 "Aliases type should be string ,list or tuple", type(aliases))
 
+        if not self._loaded:
+            self._load()
+
         for alias in aliases:
             if alias in self._comparators:
                 raise DuplicateAliasError(
                     "Alias {} is already defined in other comparator".format(alias))
             self._comparators[alias] = comparator
 
-    def _get_uniform_comparator(self, comparator):
-        """ convert comparator alias to uniform name
-        """
-        if comparator in ["eq", "equals", "==", "is"]:
-            return "equals"
-        if comparator in ["element_equals_with_index"]:
-            return "element_equals_with_index"
-        if comparator in ["equals_ignore_order"]:
-            return "equals_ignore_order"
-        if comparator in ["list_equals_by_sorted_key"]:
-            return "list_equals_by_sorted_key"
-        if comparator in ["list_contains_with_items"]:
-            return "list_contains_with_items"
-        if comparator in ["list_not_contains_with_items"]:
-            return "list_not_contains_with_items"
-        if comparator in ["item_equals_in_list"]:
-            return "item_equals_in_list"
-        if comparator in ["not_contains"]:
-            return "not_contains"
-        if comparator in ["contains"]:
-            return "contains"
-        elif comparator in ["lt", "less_than"]:
-            return "less_than"
-        elif comparator in ["le", "less_than_or_equals"]:
-            return "less_than_or_equals"
-        elif comparator in ["gt", "greater_than"]:
-            return "greater_than"
-        elif comparator in ["ge", "greater_than_or_equals"]:
-            return "greater_than_or_equals"
-        elif comparator in ["ne", "not_equals"]:
-            return "not_equals"
-        elif comparator in ["str_eq", "string_equals"]:
-            return "string_equals"
-        elif comparator in ["len_eq", "length_equals", "count_eq"]:
-            return "length_equals"
-        elif comparator in ["len_gt", "count_gt", "length_greater_than", "count_greater_than"]:
-            return "length_greater_than"
-        elif comparator in ["len_ge", "count_ge", "length_greater_than_or_equals",
-                            "count_greater_than_or_equals"]:
-            return "length_greater_than_or_equals"
-        elif comparator in ["len_lt", "count_lt", "length_less_than", "count_less_than"]:
-            return "length_less_than"
-        elif comparator in ["len_le", "count_le", "length_less_than_or_equals",
-                            "count_less_than_or_equals"]:
-            return "length_less_than_or_equals"
-        elif comparator in ["jsonschema", "jsonschema_validation", "jv"]:
-            return "jsonschema_validation"
-        elif comparator in ["unique_item_properties", "uip"]:
-            return "unique_item_properties"
-        elif comparator in ["unique_item_in_list"]:
-            return "unique_item_in_list"
-        elif comparator in ["startswith", ""]:
-            return "startswith"
-
     def get_comparator(self, alias):
-        built_in_comparator = self._get_uniform_comparator(alias)
-
-        if built_in_comparator is not None:
-            return import_ext_function(built_in_comparator)
+        if not self._loaded:
+            self._load()
 
-        if alias not in self._comparators:
-            raise InvalidBuildInComparatorError(
-                "unknown comparator keyword:{}".format(alias))
+        try:
+            return self._comparators[alias]
+        except KeyError:
+            pass
 
-        return self._comparators[alias]
+        raise InvalidBuildInComparatorError(
+            "unknown comparator keyword:{}".format(alias))
 
 
 comparators = ComparatorManager()
@@ -1,6 +1,8 @@
 import logging
 import time
 
+from .timing import stage_timings
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,4 +20,5 @@ def delay(stage, when):
         pass
     else:
         logger.debug("Delaying %s request for %.2f seconds", when, length)
-        time.sleep(length)
+        with stage_timings.phase("delay"):
+            time.sleep(length)
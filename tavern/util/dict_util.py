@@ -1,16 +1,19 @@
 import collections
+import copy
 import warnings
 import logging
+import pickle
 import re
 from builtins import str as ustr
 
 from future.utils import raise_from
-from box import Box
 from tavern.schemas.extensions import get_wrapped_create_function
+from tavern.util.cache import LRUCache
 
 from . import compat
 
-from tavern.util.loader import TypeConvertToken, ANYTHING, TypeSentinel
+from tavern.util.loader import TypeConvertToken, ANYTHING, TypeSentinel, dict_node, list_node
+from tavern.util.jmes_util import compile_expression
 from . import exceptions
 
 
@@ -63,48 +66,388 @@ def format_string(val, variables):
     return re.sub(r"\{(\{{0,1}[^\{\}\n]+\}{0,1})\}", replace_fn, val)
 
 
-def format_keys(val, variables):
-    """recursively format a dictionary with the given values
+# A string which is entirely one placeholder, eg "{a.b}", formats to the value
+# itself rather than to its string representation
+_single_placeholder_re = re.compile(r"^\{([^\{\}\n]+)\}$")
+_placeholder_re = re.compile(r"\{(\{{0,1}[^\{\}\n]+\}{0,1})\}")
+_escaped_placeholder_re = re.compile(r"\{([^\{\}\n]+)\}")
 
-    Args:
-        val (dict): Input dictionary to format
-        variables (dict): Dictionary of keys to format it with
+# Compiled string templates, keyed on the source string. This is cleared when
+# it gets too big so long running processes don't grow without bound.
+_STRING_TEMPLATE_CACHE_SIZE = 4096
+_string_templates = {}
 
-    Returns:
-        dict: recursively formatted dictionary
+
+class _JmesLookup(object):
+    """A placeholder like "{jmes:body.items[?id==`1`].name | [0]}", which
+    searches the variables with a JMESPath expression instead of accessing a
+    key path. Expressions can't contain braces.
+
+    Unlike a key path, an expression which matches nothing formats to None
+    rather than raising an error.
     """
-    formatted = val
-    box_vars = Box(variables)
 
-    if isinstance(val, dict):
-        
-        # formatted = {key: format_keys(val[key], box_vars) for key in val}
-        # format_keys 增加了对于 yaml 中 dict 类型中包含 $ext 关键字的解析
-        if "$ext" in val:
-            formatted = run_ext_function(val["$ext"], variables)
-        else:
-            formatted = {}
-            for key in val:
-                expect_key = format_keys(key, box_vars)
-                formatted[expect_key] = format_keys(val[key], box_vars)
-    elif isinstance(val, (list, tuple)):
-        formatted = [format_keys(item, box_vars) for item in val]
-    elif isinstance(val, (ustr, str)):
+    def __init__(self, expression):
+        self.expression = compile_expression(expression)
+
+    def search(self, variables):
+        return self.expression.search(variables)
+
+
+_JMES_PREFIX = "jmes:"
+
+
+def _parse_placeholder(match_str):
+    """Get what to look up for the contents of a placeholder - either a key
+    path tuple or a _JmesLookup"""
+    if match_str.startswith(_JMES_PREFIX):
+        return _JmesLookup(match_str[len(_JMES_PREFIX):])
+    return _split_key_path(match_str)
+
+
+def _resolve_placeholder(variables, placeholder):
+    if isinstance(placeholder, tuple):
+        return _access_key_path(variables, placeholder)
+    return placeholder.search(variables)
+
+
+def _split_key_path(match_str):
+    """Split a placeholder like 'a.b.0' into the keys used to access it,
+    converting integer-like keys to list indexes like recurse_access_key does
+    """
+    keys = []
+    for key in match_str.split("."):
+        try:
+            key = int(key)
+        except ValueError:
+            pass
+        keys.append(key)
+    return tuple(keys)
+
+
+def _access_key_path(variables, keys):
+    current = variables
+    for key in keys:
+        current = current[key]
+    return current
+
+
+class _LiteralTemplate(object):
+    """Something that doesn't need formatting - always renders to itself"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, variables):
+        # pylint: disable=unused-argument
+        return self.value
+
+    def lookups(self):
+        return []
+
+
+class _StringTemplate(object):
+    """Base for templates compiled from a format string"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def _render(self, variables):
+        raise NotImplementedError
+
+    def render(self, variables):
         try:
-            formatted = format_string(val, box_vars)
+            return self._render(variables)
         except KeyError as e:
             logger.error("Failed to resolve string '%s' with variables '%s'",
-                         val, box_vars)
+                         self.source, variables)
             logger.error("Key(s) not found in format: %s", e.args)
             raise_from(exceptions.MissingFormatError(e.args), e)
         except IndexError as e:
             logger.error("Empty format values are invalid")
             raise_from(exceptions.MissingFormatError(e.args), e)
+
+
+class _PlaceholderTemplate(_StringTemplate):
+    """A string like "{a.b}" which formats to the value of a.b, whatever type
+    it is"""
+
+    def __init__(self, source, placeholder):
+        super(_PlaceholderTemplate, self).__init__(source)
+        self.placeholder = placeholder
+
+    def _render(self, variables):
+        return _resolve_placeholder(variables, self.placeholder)
+
+    def lookups(self):
+        return [self.placeholder]
+
+
+class _MixedTemplate(_StringTemplate):
+    """A string like "Bearer {token}" with literal text around placeholders.
+
+    pieces is a list of literal strings and placeholders from
+    _parse_placeholder
+    """
+
+    def __init__(self, source, pieces):
+        super(_MixedTemplate, self).__init__(source)
+        self.pieces = pieces
+
+    def _render(self, variables):
+        return "".join(
+            piece if isinstance(piece, (ustr, str)) else str(_resolve_placeholder(variables, piece))
+            for piece in self.pieces
+        )
+
+    def lookups(self):
+        return [piece for piece in self.pieces if not isinstance(piece, (ustr, str))]
+
+
+class _DictTemplate(object):
+
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, variables):
+        formatted = {}
+        for key_template, value_template in self.items:
+            formatted[key_template.render(variables)] = value_template.render(variables)
+        return formatted
+
+    def lookups(self):
+        return [lookup for key_template, value_template in self.items
+                for lookup in key_template.lookups() + value_template.lookups()]
+
+
+class _ListTemplate(object):
+
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, variables):
+        return [item.render(variables) for item in self.items]
+
+    def lookups(self):
+        return [lookup for item in self.items for lookup in item.lookups()]
+
+
+class _ExtTemplate(object):
+    """A dictionary containing $ext - calls the function on every render"""
+
+    def __init__(self, ext):
+        self.ext = ext
+
+    def render(self, variables):
+        return run_ext_function(self.ext, variables)
+
+    def lookups(self):
+        # The function gets all the variables
+        return [self]
+
+
+class _TypeConvertTemplate(object):
+
+    def __init__(self, constructor, value_template):
+        self.constructor = constructor
+        self.value_template = value_template
+
+    def render(self, variables):
+        return self.constructor(self.value_template.render(variables))
+
+    def lookups(self):
+        return self.value_template.lookups()
+
+
+def _is_literal(template):
+    return isinstance(template, _LiteralTemplate)
+
+
+def _compile_string(val):
+    """Compile a format string, doing the same matching as format_string but
+    only once per distinct string"""
+    try:
+        return _string_templates[val]
+    except KeyError:
+        pass
+
+    match = _single_placeholder_re.match(val)
+    if match is not None and match.groups():
+        template = _PlaceholderTemplate(val, _parse_placeholder(match.group(1)))
+    else:
+        pieces = []
+        literal = ""
+        last_end = 0
+        for match in _placeholder_re.finditer(val):
+            literal += val[last_end:match.start()]
+            last_end = match.end()
+
+            match_str = match.group(1)
+            if _escaped_placeholder_re.search(match_str):
+                # Escaped with double braces, eg "{{abc}}" -> "{abc}"
+                literal += match_str
+            else:
+                if literal:
+                    pieces.append(literal)
+                    literal = ""
+                pieces.append(_parse_placeholder(match_str))
+
+        literal += val[last_end:]
+
+        if not pieces:
+            template = _LiteralTemplate(literal)
+        else:
+            if literal:
+                pieces.append(literal)
+            template = _MixedTemplate(val, pieces)
+
+    if len(_string_templates) >= _STRING_TEMPLATE_CACHE_SIZE:
+        _string_templates.clear()
+    _string_templates[val] = template
+
+    return template
+
+
+def _compile_value(val):
+    if isinstance(val, dict):
+        # format_keys 增加了对于 yaml 中 dict 类型中包含 $ext 关键字的解析
+        if "$ext" in val:
+            return _ExtTemplate(val["$ext"])
+
+        items = [
+            (_compile_value(key), _compile_value(value))
+            for key, value in val.items()
+        ]
+        if all(_is_literal(k) and _is_literal(v) for k, v in items):
+            return _LiteralTemplate(val)
+
+        return _DictTemplate(items)
+    elif isinstance(val, (list, tuple)):
+        items = [_compile_value(item) for item in val]
+        # Tuples are always formatted into lists, so they can't be reused
+        if isinstance(val, list) and all(_is_literal(i) for i in items):
+            return _LiteralTemplate(val)
+
+        return _ListTemplate(items)
+    elif isinstance(val, (ustr, str)):
+        return _compile_string(val)
     elif isinstance(val, TypeConvertToken):
-        value = format_keys(val.value, box_vars)
-        formatted = val.constructor(value)
+        return _TypeConvertTemplate(val.constructor, _compile_value(val.value))
+
+    return _LiteralTemplate(val)
+
+
+# Compiled templates for dicts and lists from test specs, keyed on the
+# identity and the pickled content of the spec object, so a spec which has
+# been changed in place is compiled again. Values are (spec, template) -
+# keeping a reference to the spec stops its id being reused while it is
+# cached.
+spec_templates = LRUCache(maxsize=1024, name="compiled spec templates")
+
+
+def compile_template(val):
+    """Compile a value from a test spec into a template which can be rendered
+    repeatedly with different variables
+
+    Strings are only scanned for placeholders the first time they are seen -
+    after that the compiled template is reused. The template for a dictionary
+    or list is cached against its contents, so formatting the same part of a
+    spec again (eg the request of a stage which is run several times, or the
+    same 'validate' block) doesn't compile it again, but it is compiled again
+    if it has been changed in place.
+
+    Any dictionaries or lists which don't contain anything to format
+    (placeholders, $ext blocks or type conversion tokens) are rendered as the
+    original object rather than a copy.
+
+    Example:
+
+        >>> compile_template({"a": "{b.0}", "c": "d {e}"}).render({"b": [1], "e": 2})
+        {'a': 1, 'c': 'd 2'}
+
+    Args:
+        val (dict, list, str): Input value to compile
+
+    Returns:
+        object: template with a render(variables) method
+    """
+    if not isinstance(val, (dict, list, tuple)) or not val:
+        # Nothing to gain from caching empty values, which are often
+        # throwaway defaults
+        return _compile_value(val)
+
+    try:
+        # Checking the content like this is a lot quicker than compiling
+        # again, and unlike == it doesn't treat 1, 1.0 and True as the same
+        content = pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError, RuntimeError):
+        return _compile_value(val)
+
+    cached_val, template = spec_templates.get_or_create(
+        (id(val), content), lambda: (val, _compile_value(val)))
+
+    if cached_val is not val:
+        # Shouldn't happen, but don't trust the id if it does
+        return _compile_value(val)
+
+    return template
+
+
+def format_keys(val, variables):
+    """recursively format a dictionary with the given values
+
+    Note:
+        Parts of the input which don't need formatting are returned as-is
+        rather than copied, so the output should not be modified in place.
+
+    Args:
+        val (dict): Input dictionary to format
+        variables (dict): Dictionary of keys to format it with
+
+    Returns:
+        dict: recursively formatted dictionary
+    """
+    return compile_template(val).render(variables)
+
+
+def placeholder_paths(val):
+    """Get the key paths which formatting a value looks up in the variables
+
+    Example:
+
+        >>> placeholder_paths({"a": "{b.0}", "c": ["d {e}"]})
+        [('b', 0), ('e',)]
 
-    return formatted
+    Args:
+        val (dict, list, str): value from a test spec
+
+    Returns:
+        list: tuples of keys, in the same form as for recurse_access_key. None
+            if the value contains a JMESPath placeholder or a $ext function,
+            either of which could use any of the variables.
+    """
+    paths = []
+    for lookup in compile_template(val).lookups():
+        if not isinstance(lookup, tuple):
+            return None
+        paths.append(lookup)
+    return paths
+
+
+def single_placeholder_path(val):
+    """If a value is a string which formats to the value of one key path, like
+    "{a.b}", get the path
+
+    Returns:
+        tuple: keys in the path, or None
+    """
+    if not isinstance(val, (ustr, str)):
+        return None
+
+    template = compile_template(val)
+    if isinstance(template, _PlaceholderTemplate) and isinstance(template.placeholder, tuple):
+        return template.placeholder
+    return None
 
 
 def recurse_set_value(current_value, keys, value):
@@ -211,6 +554,68 @@ def deep_dict_merge(initial_dct, merge_dct):
     return dct
 
 
+# Values which can be shared between copies because they can't be changed
+_immutable_types = frozenset((type(None), bool) + compat.basestring + compat.numeric_types)
+
+
+def _copy_dict(value):
+    return {k: copy_variables(v) for k, v in value.items()}
+
+
+def _copy_list(value):
+    return [copy_variables(v) for v in value]
+
+
+def _copy_tuple(value):
+    return tuple(copy_variables(v) for v in value)
+
+
+def _copy_dict_node(value):
+    return dict_node(_copy_dict(value), value.start_mark, value.end_mark)
+
+
+def _copy_list_node(value):
+    return list_node(_copy_list(value), value.start_mark, value.end_mark)
+
+
+_copiers = {
+    dict: _copy_dict,
+    list: _copy_list,
+    tuple: _copy_tuple,
+    dict_node: _copy_dict_node,
+    list_node: _copy_list_node,
+}
+
+
+def copy_variables(value):
+    """Copy variables so that changing the copy doesn't change the original
+
+    This is the same as copy.deepcopy for plain data, but much faster because
+    strings, numbers etc. are shared with the original instead of going
+    through the copy module. Anything else is copied with copy.deepcopy.
+
+    Unlike copy.deepcopy, a dict or list which appears more than once in
+    value is copied separately each time.
+
+    Args:
+        value: variables to copy, usually a dict
+
+    Returns:
+        copy of value
+    """
+    value_type = type(value)
+
+    if value_type in _immutable_types:
+        return value
+
+    try:
+        copier = _copiers[value_type]
+    except KeyError:
+        return copy.deepcopy(value)
+
+    return copier(value)
+
+
 def check_expected_keys(expected, actual):
     """Check that a set of expected keys is a superset of the actual keys
 
@@ -281,55 +686,41 @@ def yield_keyvals(block):
             yield [sidx], sidx, val
 
 
-def check_keys_match_recursive(expected_val, actual_val, keys, strict=True):
-    """Utility to recursively check response values
+def _path_keys(path):
+    """Get the keys to a value from a path of (parent path, key) pairs"""
+    keys = []
+    while path is not None:
+        path, key = path
+        keys.append(key)
+    keys.reverse()
+    return keys
 
-    expected and actual both have to be of the same type or it will raise an
-    error.
 
-    Example:
+def _mismatch_err(expected_val, actual_val, path):
+    """Get error in the format:
 
-        >>> check_keys_match_recursive({"a": {"b": "c"}}, {"a": {"b": "c"}}, []) is None
-        True
-        >>> check_keys_match_recursive({"a": {"b": "c"}}, {"a": {"b": "d"}}, []) # doctest: +IGNORE_EXCEPTION_DETAIL
-        Traceback (most recent call last):
-          File "/home/michael/code/tavern/tavern/tavern/util/dict_util.py", line 223, in check_keys_match_recursive
-        tavern.util.exceptions.KeyMismatchError: Key mismatch: (expected["a"]["b"] = 'c', actual["a"]["b"] = 'd')
-
-    Todo:
-        This could be turned into a single-dispatch function for cleaner
-        code and to remove a load of the isinstance checks
-
-    Args:
-        expected_val (dict, list, str): expected value
-        actual_val (dict, list, str): actual value
-        keys (list): any keys which have been recursively parsed to get to this
-            point. Used for debug output.
-        strict (bool): Whether 'strict' key checking should be done. If this is
-            False, a mismatch in dictionary keys between the expected and the
-            actual values will not raise an error (but a mismatch in value will
-            raise an error)
-
-    Raises:
-        KeyMismatchError: expected_val and actual_val did not match
+    a["b"]["c"] = 4, b["b"]["c"] = {'key': 'value'}
     """
+    formatted_keys = "".join('["{}"]'.format(key) for key in _path_keys(path))
+    return "expected{} = '{}' (type = {}), actual{} = '{}' (type = {})".format(
+        formatted_keys, expected_val, type(expected_val),
+        formatted_keys, actual_val, type(actual_val)
+    )
 
-    # pylint: disable=too-many-locals,too-many-statements
 
-    def full_err():
-        """Get error in the format:
+def _check_value_matches(expected_val, actual_val, path, strict, to_check):
+    """Check one value in check_keys_match_recursive
 
-        a["b"]["c"] = 4, b["b"]["c"] = {'key': 'value'}
-        """
-        def _format_err(which):
-            return "{}{}".format(which, "".join('["{}"]'.format(key) for key in keys))
+    Other values which compare equal match straight away. Dicts and lists
+    are only checked to have the same type and keys or length here - the
+    values in them are added to to_check to be checked after. They aren't
+    compared with ==, as that would compare the whole of every subtree on
+    the way down to a mismatch.
+    """
+    # pylint: disable=too-many-branches
 
-        e_formatted = _format_err("expected")
-        a_formatted = _format_err("actual")
-        return "{} = '{}' (type = {}), {} = '{}' (type = {})".format(
-            e_formatted, expected_val, type(expected_val),
-            a_formatted, actual_val, type(actual_val)
-        )
+    if not isinstance(expected_val, (dict, list)) and actual_val == expected_val:
+        return
 
     # Check required because of python 2/3 unicode compatability when loading yaml
     if isinstance(actual_val, ustr):
@@ -340,7 +731,8 @@ def check_keys_match_recursive(expected_val, actual_val, keys, strict=True):
     if expected_val is ANYTHING:
         # Match anything. We could just early exit here but having the debug
         # logging below is useful
-        expected_matches = True
+        logger.debug("Actual value = '%s' - matches !anything", actual_val)
+        return
     elif isinstance(expected_val, TypeSentinel):
         # If the 'expected' type is actually just a sentinel for another type,
         # then it should match
@@ -358,81 +750,128 @@ def check_keys_match_recursive(expected_val, actual_val, keys, strict=True):
             issubclass(actual_type, type(expected_val))
         )
 
-    try:
-        assert actual_val == expected_val
-    except AssertionError as e:
-        # At this point, there is likely to be an error unless we're using any
-        # of the type sentinels
-
-        if not (expected_val is ANYTHING):  # pylint: disable=superfluous-parens
-            # NOTE
-            # Second part of this check will be removed in future - see deprecation
-            # warning below for details
-            if not expected_matches and expected_val is not None:
-                raise_from(exceptions.KeyMismatchError(
-                    "Type of returned data was different than expected ({})".format(full_err())), e)
-
-        if isinstance(expected_val, dict):
+    def mismatch(msg):
+        return exceptions.KeyMismatchError("{} ({})".format(
+            msg, _mismatch_err(expected_val, actual_val, path)))
+
+    # NOTE
+    # Second part of this check will be removed in future - see deprecation
+    # warning below for details
+    if not expected_matches and expected_val is not None:
+        raise mismatch("Type of returned data was different than expected")
+
+    if isinstance(expected_val, dict):
+        if len(expected_val) != len(actual_val) or any(key not in actual_val for key in expected_val):
             akeys = set(actual_val.keys())
             ekeys = set(expected_val.keys())
 
-            if akeys != ekeys:
-                extra_actual_keys = akeys - ekeys
-                extra_expected_keys = ekeys - akeys
-
-                msg = ""
-                if extra_actual_keys:
-                    msg += " - Extra keys in response: {}".format(
-                        extra_actual_keys)
-                if extra_expected_keys:
-                    msg += " - Keys missing from response: {}".format(
-                        extra_expected_keys)
-
-                full_msg = "Structure of returned data was different than expected {} ({})".format(
-                    msg, full_err())
-
-                # If there are more keys in 'expected' compared to 'actual',
-                # this is still a hard error and we shouldn't continue
-                if extra_expected_keys or strict:
-                    raise_from(exceptions.KeyMismatchError(full_msg), e)
-                else:
-                    logger.warning(full_msg, exc_info=True)
-
-            # If strict is True, an error will be raised above. If not, recurse
-            # through both sets of keys and just ignore missing ones
-            to_recurse = akeys | ekeys
-
-            for key in to_recurse:
-                try:
-                    check_keys_match_recursive(
-                        expected_val[key], actual_val[key], keys + [key], strict)
-                except KeyError:
-                    logger.debug(
-                        "Skipping comparing missing key %s due to strict=%s", key, strict)
-        elif isinstance(expected_val, list):
-            if len(expected_val) != len(actual_val):
-                raise_from(exceptions.KeyMismatchError(
-                    "Length of returned list was different than expected - expected {} items, got {} ({})".format(len(expected_val), len(actual_val), full_err())), e)
-
-            # TODO
-            # Check things in the wrong order?
-
-            for i, (e_val, a_val) in enumerate(zip(expected_val, actual_val)):
-                try:
-                    check_keys_match_recursive(
-                        e_val, a_val, keys + [i], strict)
-                except exceptions.KeyMismatchError as sub_e:
-                    # This will still raise an error, but it will be more
-                    # obvious where the error came from (in python 3 at least)
-                    # and will take ANYTHING into account
-                    raise_from(sub_e, e)
-        elif expected_val is None:
-            warnings.warn("Expected value was 'null', so this check will pass - this will be removed in a future version. IF you want to check against 'any' value, use '!anything' instead.", FutureWarning)
-        elif expected_val is ANYTHING:
-            logger.debug("Actual value = '%s' - matches !anything", actual_val)
-        elif isinstance(expected_val, TypeSentinel) and expected_matches:
-            logger.debug("Actual value = '%s' - matches !any%s",
-                         actual_val, expected_val.constructor)
-        else:
-            raise_from(exceptions.KeyMismatchError(
-                "Key mismatch: ({})".format(full_err())), e)
+            extra_actual_keys = akeys - ekeys
+            extra_expected_keys = ekeys - akeys
+
+            msg = ""
+            if extra_actual_keys:
+                msg += " - Extra keys in response: {}".format(
+                    extra_actual_keys)
+            if extra_expected_keys:
+                msg += " - Keys missing from response: {}".format(
+                    extra_expected_keys)
+
+            err = mismatch("Structure of returned data was different than expected {}".format(msg))
+
+            # If there are more keys in 'expected' compared to 'actual',
+            # this is still a hard error and we shouldn't continue
+            if extra_expected_keys or strict:
+                raise err
+            else:
+                logger.warning("%s", err)
+
+        # Any keys in 'actual' but not in 'expected' have been checked above
+        # depending on strict, so just check the expected ones
+        for key in reversed(list(expected_val)):
+            to_check.append((expected_val[key], actual_val[key], (path, key)))
+    elif isinstance(expected_val, list):
+        if len(expected_val) != len(actual_val):
+            raise mismatch("Length of returned list was different than expected - expected {} items, got {}".format(
+                len(expected_val), len(actual_val)))
+
+        # TODO
+        # Check things in the wrong order?
+
+        for i in reversed(range(len(expected_val))):
+            to_check.append((expected_val[i], actual_val[i], (path, i)))
+    elif expected_val is None:
+        warnings.warn("Expected value was 'null', so this check will pass - this will be removed in a future version. IF you want to check against 'any' value, use '!anything' instead.", FutureWarning)
+    elif isinstance(expected_val, TypeSentinel) and expected_matches:
+        logger.debug("Actual value = '%s' - matches !any%s",
+                     actual_val, expected_val.constructor)
+    else:
+        raise exceptions.KeyMismatchError(
+            "Key mismatch: ({})".format(_mismatch_err(expected_val, actual_val, path)))
+
+
+def check_keys_match_recursive(expected_val, actual_val, keys, strict=True, collect_all=False):
+    """Utility to recursively check response values
+
+    expected and actual both have to be of the same type or it will raise an
+    error.
+
+    Values which are equal are matched with one comparison. Anything else is
+    checked a level at a time, in order, without recursing - so deeply nested
+    values don't hit the recursion limit, and each level is only looked at
+    once.
+
+    Example:
+
+        >>> check_keys_match_recursive({"a": {"b": "c"}}, {"a": {"b": "c"}}, []) is None
+        True
+        >>> check_keys_match_recursive({"a": {"b": "c"}}, {"a": {"b": "d"}}, []) # doctest: +IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+          File "/home/michael/code/tavern/tavern/tavern/util/dict_util.py", line 223, in check_keys_match_recursive
+        tavern.util.exceptions.KeyMismatchError: Key mismatch: (expected["a"]["b"] = 'c', actual["a"]["b"] = 'd')
+
+    Args:
+        expected_val (dict, list, str): expected value
+        actual_val (dict, list, str): actual value
+        keys (list): any keys which have been recursively parsed to get to this
+            point. Used for debug output.
+        strict (bool): Whether 'strict' key checking should be done. If this is
+            False, a mismatch in dictionary keys between the expected and the
+            actual values will not raise an error (but a mismatch in value will
+            raise an error)
+        collect_all (bool): Whether to carry on checking after finding a
+            mismatch, and raise an error listing all of them at the end
+
+    Raises:
+        KeyMismatchError: expected_val and actual_val did not match
+    """
+    # Paths are linked (parent path, key) pairs, so nothing is copied for
+    # each level and the keys are only put together for an error
+    path = None
+    for key in keys:
+        path = (path, key)
+
+    try:
+        if actual_val == expected_val:
+            return
+    except RuntimeError:
+        # Comparing very deeply nested values can hit the recursion limit
+        # (RecursionError is a RuntimeError) - check them a level at a time
+        pass
+
+    to_check = [(expected_val, actual_val, path)]
+    mismatches = []
+
+    while to_check:
+        expected, actual, path = to_check.pop()
+        try:
+            _check_value_matches(expected, actual, path, strict, to_check)
+        except exceptions.KeyMismatchError as e:
+            if not collect_all:
+                raise
+            mismatches.append(e)
+
+    if len(mismatches) == 1:
+        raise mismatches[0]
+    elif mismatches:
+        raise exceptions.KeyMismatchError("{} mismatches:\n{}".format(
+            len(mismatches), "\n".join(" - {}".format(e) for e in mismatches)))
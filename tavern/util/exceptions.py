@@ -119,3 +119,12 @@ class ImportSetupFunctionError(TavernException):
 
 class CallSetupFunctionError(TavernException):
     """ Call setup function error """
+
+
+class UnsupportedSchemaError(TavernException):
+    """Schema uses a feature that the compiled schema validator doesn't handle
+    """
+
+
+class SetupCycleError(TavernException):
+    """Setup tests depend on each other in a loop"""
@@ -3,14 +3,24 @@ import re
 import importlib
 from future.utils import raise_from
 from tavern.util.exceptions import InvalidExtFunctionError
+from tavern.util.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+_entrypoint_re = re.compile(r"^(([\w_\.]+):)?([\w_]+)$")
+
+# Functions which have already been imported, by entrypoint. Call
+# ext_function_cache.clear() if modules are reloaded.
+ext_function_cache = LRUCache(maxsize=512, name="ext functions")
+
 
 def import_ext_function(entrypoint):
     """Given a function name in the form of a setuptools entry point, try to
     dynamically load and return it
 
+    Functions are cached after the first time they are loaded, so this only
+    imports a module the first time one of its functions is used.
+
     Args:
         entrypoint (str): setuptools-style entrypoint in the form
             module.submodule:function
@@ -21,7 +31,11 @@ def import_ext_function(entrypoint):
     Raises:
         InvalidExtFunctionError: If the module or function did not exist
     """
-    match = re.match(r"^(([\w_\.]+):)?([\w_]+)$", entrypoint)
+    return ext_function_cache.get_or_create(entrypoint, lambda: _import_ext_function(entrypoint))
+
+
+def _import_ext_function(entrypoint):
+    match = _entrypoint_re.match(entrypoint)
 
     if not match:
         msg = "Expected entrypoint in the form module.submodule:function or builtin_function"
@@ -0,0 +1,48 @@
+import logging
+
+import jmespath
+from jmespath.exceptions import JMESPathError
+from future.utils import raise_from
+
+from tavern.util.cache import LRUCache
+from tavern.util.exceptions import JMESError
+
+logger = logging.getLogger(__name__)
+
+# Parsed JMESPath expressions, by source. The same few expressions are used
+# in every stage of a test, so each is only parsed the first time it is seen.
+expression_cache = LRUCache(maxsize=1024, name="JMESPath expressions")
+
+
+def compile_expression(expression):
+    """Parse a JMESPath expression, or get it from the cache if it has been
+    parsed before
+
+    Args:
+        expression (str): JMESPath expression, eg 'top.nested[0].name'
+
+    Returns:
+        jmespath.parser.ParsedResult: parsed expression with a search(data)
+            method
+
+    Raises:
+        JMESError: if the expression is invalid
+    """
+    try:
+        return expression_cache.get_or_create(expression, lambda: jmespath.compile(expression))
+    except JMESPathError as e:
+        raise_from(JMESError("Invalid JMES path '{}': {}".format(expression, e)), e)
+
+
+def search(expression, data):
+    """Search data with a JMESPath expression, like jmespath.search but only
+    parsing each expression once
+
+    Args:
+        expression (str): JMESPath expression
+        data (object): data to search, eg a decoded response body
+
+    Returns:
+        object: what the expression matched, or None if it matched nothing
+    """
+    return compile_expression(expression).search(data)
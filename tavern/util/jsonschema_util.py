@@ -0,0 +1,194 @@
+"""Validate values against JSON schemas, reusing validators between calls
+
+jsonschema.validate checks the schema against its meta schema and builds a
+new validator, with a new $ref resolver, every time it is called. Tests use
+the same few schemas in every stage, so validators are cached - first by the
+identity of the schema object, then by its contents so that schemas loaded
+again from the same file (eg by !resolve_ref in another test) still find the
+validator built for the first one.
+
+If fastjsonschema is installed, setting jsonschema_settings.backend to
+'fastjsonschema' (--tavern-jsonschema-backend) compiles schemas to Python
+functions instead, which are much faster to run. Anything it can't compile
+is validated with jsonschema.
+"""
+
+import logging
+import threading
+
+import jsonschema
+from jsonref import JsonRef
+from future.utils import raise_from
+
+from tavern.util.cache import LRUCache
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+logger = logging.getLogger(__name__)
+
+
+BACKENDS = ["jsonschema", "fastjsonschema"]
+
+
+class JsonSchemaSettings(object):
+    """How to validate JSON schemas
+
+    Attributes:
+        backend (str): one of BACKENDS
+    """
+
+    def __init__(self):
+        self.backend = "jsonschema"
+
+
+jsonschema_settings = JsonSchemaSettings()
+
+# Shared between all validators which check formats
+_format_checker = jsonschema.FormatChecker()
+
+
+class _JsonSchemaValidator(object):
+    """Validates against a schema with jsonschema
+
+    The schema is only checked once. Each thread gets its own validator,
+    because the $ref resolver in it keeps track of the scope it is resolving
+    in while validating.
+    """
+
+    def __init__(self, schema, check_formats):
+        self.schema = schema
+        self.cls = jsonschema.validators.validator_for(schema)
+        self.cls.check_schema(schema)
+        self.format_checker = _format_checker if check_formats else None
+        self._local = threading.local()
+
+    def validate(self, instance):
+        validator = getattr(self._local, "validator", None)
+        if validator is None:
+            validator = self._local.validator = self.cls(self.schema, format_checker=self.format_checker)
+
+        error = jsonschema.exceptions.best_match(validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+class _FastJsonSchemaValidator(object):
+    """Validates against a schema compiled with fastjsonschema, raising the
+    same errors as jsonschema"""
+
+    def __init__(self, schema, check_formats):
+        # Don't fill in defaults from the schema, it would change the response
+        self.compiled = fastjsonschema.compile(schema, use_default=False, use_formats=check_formats)
+
+    def validate(self, instance):
+        try:
+            self.compiled(instance)
+        except fastjsonschema.JsonSchemaValueException as e:
+            raise_from(jsonschema.exceptions.ValidationError(
+                e.message,
+                validator=e.rule,
+                path=e.path[1:],
+                instance=e.value,
+                validator_value=e.rule_definition,
+            ), e)
+
+
+def _create_validator(schema, check_formats):
+    if jsonschema_settings.backend == "fastjsonschema":
+        if fastjsonschema is None:
+            logger.warning("fastjsonschema is not installed, using jsonschema")
+        else:
+            try:
+                return _FastJsonSchemaValidator(schema, check_formats)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning("fastjsonschema can't compile schema, using jsonschema: %s", e)
+
+    return _JsonSchemaValidator(schema, check_formats)
+
+
+def _content_key(value, refs_seen=None):
+    """Get a hashable key for a schema, which is the same for any schema
+    with the same contents
+
+    Resolved $refs are followed, apart from ones which refer back to
+    themselves which are keyed on the reference instead.
+    """
+    if refs_seen is None:
+        refs_seen = set()
+
+    if type(value) is JsonRef:  # pylint: disable=unidiomatic-typecheck
+        if id(value) in refs_seen:
+            return ("$ref", value.__reference__["$ref"])
+
+        refs_seen.add(id(value))
+        try:
+            return _content_key(value.__subject__, refs_seen)
+        finally:
+            refs_seen.discard(id(value))
+    elif isinstance(value, dict):
+        return ("dict", tuple(sorted(
+            (key, _content_key(item, refs_seen)) for key, item in value.items())))
+    elif isinstance(value, (list, tuple)):
+        return ("list", tuple(_content_key(item, refs_seen) for item in value))
+
+    # Include the type so that eg 1 and True in 'enum' are different
+    return (type(value).__name__, value)
+
+
+class _ValidatorCache(object):
+
+    def __init__(self, maxsize=256):
+        # Values are (schema, validator) - keeping a reference to the schema
+        # stops its id being reused while it is cached
+        self.by_identity = LRUCache(maxsize, "jsonschema validators by schema identity")
+        self.by_content = LRUCache(maxsize, "jsonschema validators by schema contents")
+
+    def get(self, schema, check_formats):
+        settings = (jsonschema_settings.backend, check_formats)
+
+        def by_content():
+            try:
+                key = (settings, _content_key(schema))
+                hash(key)
+            except TypeError:
+                logger.debug("Can't get cache key for schema, not caching validator")
+                return _create_validator(schema, check_formats)
+
+            return self.by_content.get_or_create(key, lambda: _create_validator(schema, check_formats))
+
+        cached_schema, validator = self.by_identity.get_or_create(
+            (settings, id(schema)), lambda: (schema, by_content()))
+
+        if cached_schema is not schema:
+            # Shouldn't happen, but don't trust the id if it does
+            return by_content()
+
+        return validator
+
+    def clear(self):
+        self.by_identity.clear()
+        self.by_content.clear()
+
+
+validator_cache = _ValidatorCache()
+
+
+def validate(instance, schema, check_formats=False):
+    """Validate a value against a JSON schema, like jsonschema.validate
+
+    Args:
+        instance (object): value to validate, eg a decoded response body
+        schema (dict): JSON schema. It shouldn't be changed after it has
+            been used, because the validator for it is cached.
+        check_formats (bool): whether to check 'format' in the schema. This
+            is off by default, like in jsonschema.validate
+
+    Raises:
+        jsonschema.exceptions.SchemaError: if the schema is invalid
+        jsonschema.exceptions.ValidationError: if instance doesn't match
+            the schema
+    """
+    validator_cache.get(schema, check_formats).validate(instance)
@@ -0,0 +1,302 @@
+"""Run a stage over and over from several threads to see how the server copes
+
+A stage with a 'load' block is run by a pool of threads until it has been run
+'times' times or for 'duration' seconds, optionally limited to 'rate'
+iterations per second. Iterations started during the first 'warmup' seconds
+are run but not measured. How long each iteration takes is recorded, and the
+stage fails if the latencies or the proportion of iterations which failed are
+over the limits in 'slo'.
+"""
+
+import logging
+import math
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
+
+from future.utils import raise_from
+
+from . import exceptions
+from .stage_group import copy_block_config
+
+logger = logging.getLogger(__name__)
+
+
+# Latency statistics that can have a limit in 'slo', in seconds
+LATENCY_STATS = ["mean", "p50", "p90", "p95", "p99", "max"]
+
+
+def percentile(values, p):
+    """Get a percentile of some values, interpolating between the two closest
+    values if it falls between them
+
+    Args:
+        values (list): values, sorted from smallest to largest
+        p (float): percentile to get, from 0 to 100
+
+    Returns:
+        float: the percentile, or None if there are no values
+    """
+    if not values:
+        return None
+
+    k = (len(values) - 1) * p / 100.0
+    lower = int(math.floor(k))
+    upper = int(math.ceil(k))
+
+    if lower == upper:
+        return values[lower]
+
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+class LoadResult(object):
+    """How long each measured iteration of a stage took
+
+    Args:
+        latencies (list(float)): time taken by each iteration in seconds,
+            including the ones which failed
+        errors (list(TavernException)): errors from iterations which failed
+        elapsed (float): seconds spent running measured iterations
+    """
+
+    def __init__(self, latencies, errors, elapsed):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def error_rate(self):
+        if not self.latencies:
+            return 0.0
+        return len(self.errors) / float(len(self.latencies))
+
+    @property
+    def throughput(self):
+        if not self.elapsed:
+            return 0.0
+        return self.count / self.elapsed
+
+    def stats(self):
+        """Get a summary of the latencies
+
+        Returns:
+            dict: number of iterations, errors, error rate, throughput (per
+                second) and each of LATENCY_STATS
+        """
+        summary = {
+            "count": self.count,
+            "errors": len(self.errors),
+            "error_rate": self.error_rate,
+            "throughput": self.throughput,
+            "mean": sum(self.latencies) / self.count if self.latencies else None,
+            "max": self.latencies[-1] if self.latencies else None,
+        }
+
+        for p in [50, 90, 95, 99]:
+            summary["p{}".format(p)] = percentile(self.latencies, p)
+
+        return summary
+
+    def check_slo(self, slo):
+        """Check the results against the limits in 'slo'
+
+        Args:
+            slo (dict): maximum value of any of LATENCY_STATS, and of
+                'error_rate'. If 'error_rate' isn't given, any error is too
+                many.
+
+        Returns:
+            list(str): description of each limit which was exceeded
+        """
+        stats = self.stats()
+        failures = []
+
+        for key in LATENCY_STATS:
+            if key in slo and stats[key] is not None and stats[key] > slo[key]:
+                failures.append("{} latency {:.3f}s is over {}s".format(key, stats[key], slo[key]))
+
+        max_error_rate = slo.get("error_rate", 0)
+        if self.error_rate > max_error_rate:
+            failures.append("{} of {} iterations failed (error rate {:.3f}, limit {})".format(
+                len(self.errors), self.count, self.error_rate, max_error_rate))
+
+        return failures
+
+
+class _Schedule(object):
+    """Decides when each iteration should start, shared by all the threads
+
+    Args:
+        times (int): number of measured iterations to run, or None to only
+            stop after 'duration'
+        rate (float): maximum number of iterations to start per second, or
+            None to start them as fast as possible
+        duration (float): seconds to run measured iterations for, or None to
+            only stop after 'times' iterations
+        warmup (float): seconds to run iterations for before measuring
+    """
+
+    def __init__(self, times, rate, duration, warmup):
+        self.times = times
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._started = 0
+        self._measured = 0
+        self.start = None
+        self.measure_start = None
+
+    def begin(self):
+        self.start = default_timer()
+        self.measure_start = self.start + self.warmup
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+
+    def next(self):
+        """Wait until the next iteration should start
+
+        Returns:
+            bool: whether the iteration should be measured, or None if no more
+                iterations should be run
+        """
+        with self._lock:
+            if self._stopped:
+                return None
+
+            if self.rate:
+                start_at = self.start + self._started / float(self.rate)
+            else:
+                start_at = default_timer()
+
+            measured = start_at >= self.measure_start
+
+            if measured:
+                if self.times is not None and self._measured >= self.times:
+                    return None
+                if self.duration is not None and start_at >= self.measure_start + self.duration:
+                    return None
+                self._measured += 1
+
+            self._started += 1
+
+        wait = start_at - default_timer()
+        if wait > 0:
+            time.sleep(wait)
+
+        return measured
+
+
+def run_load(stage, run, test_block_config):
+    """Run a stage in load mode
+
+    Each iteration gets its own copy of the test config. Once they have all
+    finished, variables saved by whichever successful iteration finished last
+    are added to test_block_config.
+
+    Args:
+        stage (dict): stage with a 'load' block
+        run (callable): called with the config to use to run the stage once
+        test_block_config (dict): config for the test block
+
+    Returns:
+        LoadResult: latencies of the measured iterations
+
+    Raises:
+        TestFailError: if the results are over any of the limits in 'slo'
+    """
+    load = stage["load"]
+    times = stage.get("times")
+    duration = load.get("duration")
+
+    if "mqtt_publish" in stage or "mqtt_response" in stage:
+        raise exceptions.BadSchemaError(
+            "MQTT stage '{}' can't be run in load mode".format(stage["name"]))
+
+    if times is None and duration is None:
+        raise exceptions.BadSchemaError(
+            "Stage '{}' needs 'times' or a 'duration' in 'load' to know when to stop".format(stage["name"]))
+
+    schedule = _Schedule(times, load.get("rate"), duration, load.get("warmup", 0))
+    concurrency = load.get("concurrency", 1)
+
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    last_saved = [None]
+
+    def worker(_):
+        try:
+            while True:
+                measured = schedule.next()
+                if measured is None:
+                    return
+
+                config = copy_block_config(test_block_config)
+                start = default_timer()
+                try:
+                    run(config)
+                except exceptions.TavernException as e:
+                    logger.debug("Iteration of '%s' failed", stage["name"], exc_info=True)
+                    error = e
+                else:
+                    error = None
+                latency = default_timer() - start
+
+                with lock:
+                    if measured:
+                        latencies.append(latency)
+                        if error is not None:
+                            errors.append(error)
+                    if error is None:
+                        last_saved[0] = config["variables"]
+        except Exception:
+            # Don't leave the other threads running until the end
+            schedule.stop()
+            raise
+
+    logger.info("Running '%s' in load mode with %d threads", stage["name"], concurrency)
+
+    pool = ThreadPool(concurrency)
+    schedule.begin()
+    try:
+        pool.map(worker, range(concurrency))
+    finally:
+        pool.close()
+        pool.join()
+
+    result = LoadResult(latencies, errors, max(0, default_timer() - schedule.measure_start))
+
+    if last_saved[0] is not None:
+        test_block_config["variables"].update(last_saved[0])
+
+    stats = result.stats()
+    if result.count:
+        logger.info(
+            "Load results for '%s': %d iterations, %d failed, %.1f/s, "
+            "mean %.3fs, p50 %.3fs, p95 %.3fs, p99 %.3fs, max %.3fs",
+            stage["name"], stats["count"], stats["errors"], stats["throughput"],
+            stats["mean"], stats["p50"], stats["p95"], stats["p99"], stats["max"])
+    else:
+        logger.warning("No iterations of '%s' were measured", stage["name"])
+
+    failures = result.check_slo(load.get("slo", {}))
+    if failures:
+        error = exceptions.TestFailError(
+            "Test '{}' failed: did not meet load targets:\n- {}".format(
+                stage["name"], "\n- ".join(failures)))
+        if errors:
+            raise_from(error, errors[0])
+        raise error
+
+    return result
@@ -5,3 +5,4 @@ from .type_sentinel import *
 from .other import *
 from .path_loader import *
 from .yaml_loader import *
+from .spec_cache import *
@@ -7,7 +7,7 @@ try:
 except ImportError:
     import urlparse  # type: ignore
 
-from .path_loader import schema_loader
+from .path_loader import schema_loader, yaml_loader
 from .yaml_loader import IncludeLoader
 
 logger = logging.getLogger(__name__)
@@ -18,12 +18,15 @@ def construct_resolve_reflink(loader, node):
     # pylint: disable=protected-access
     filename = loader.construct_scalar(node)
     file_path = os.path.join(loader._root, filename)
+    # JsonRef objects are lazy proxies which can't be cached
+    yaml_loader.mark_uncacheable()
     return load_uri(file_path, loader=schema_loader)
 
 
 def construct_resolve_ref(loader, node):
     # pylint: disable=protected-access
     value = loader.construct_mapping(node)
+    yaml_loader.mark_uncacheable()
     base_uri = os.path.join(loader._root, "root.json")
     return JsonRef.replace_refs(value, loader=schema_loader, base_uri=base_uri)
 
@@ -1,9 +1,12 @@
 import uuid
 from .yaml_loader import IncludeLoader
+from .path_loader import yaml_loader
 
 
 def makeuuid(loader, node):
     # pylint: disable=unused-argument
+    # Different every time, so the file can't be cached
+    yaml_loader.mark_uncacheable()
     return str(uuid.uuid4())
 
 
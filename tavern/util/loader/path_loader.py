@@ -2,6 +2,7 @@ import logging
 import os.path
 import json
 import io
+import threading
 from jsonref import JsonLoader
 import yaml
 from .yaml_loader import IncludeLoader
@@ -22,12 +23,16 @@ class SchemaLoader(JsonLoader):
     def base_dir(self, base_dir):
         self._base_dir = base_dir
 
-    def __call__(self, uri, **kwargs):
+    def resolve_uri(self, uri):
         if uri.startswith("/"):
             if not os.path.exists(uri):
                 uri = os.path.join(self.base_dir, uri[1:])
-        uri = os.path.normpath(uri)
+        return os.path.normpath(uri)
+
+    def __call__(self, uri, **kwargs):
+        return self._load_uri(self.resolve_uri(uri), **kwargs)
 
+    def _load_uri(self, uri, **kwargs):
         if uri in self.store and self.store[uri] == "parsing":
             logger.warning("Found rescursion:%s", uri)
             return {}
@@ -59,9 +64,83 @@ class SchemaLoader(JsonLoader):
 
 
 class YamlLoader(SchemaLoader):
+    """Loads yaml files with IncludeLoader, keeping track of which files each
+    file includes so that loaded files can be cached safely
+
+    Files can be loaded from several threads (eg by setups run concurrently),
+    but only one file and the files it includes are loaded at a time - the
+    stack of files being loaded, and the 'parsing' marker left in the store
+    while a file is loaded, are shared.
+    """
+
+    def __init__(self):
+        SchemaLoader.__init__(self)
+        # uri: set of uris directly included by that file
+        self._dependencies = {}
+        self._uncacheable = set()
+        # Stack of files currently being loaded
+        self._loading = []
+        # Reentrant so that included files can be loaded while it is held
+        self._lock = threading.RLock()
+
+    def __call__(self, uri, **kwargs):
+        uri = self.resolve_uri(uri)
+        with self._lock:
+            if self._loading:
+                self._dependencies[self._loading[-1]].add(uri)
+            return self._load_uri(uri, **kwargs)
+
+    def get_remote_json(self, uri, **kwargs):
+        self._dependencies[uri] = set()
+        self._loading.append(uri)
+        try:
+            return SchemaLoader.get_remote_json(self, uri, **kwargs)
+        finally:
+            self._loading.pop()
+
     def load_yaml_file(self, stream, **kwargs):
         return yaml.load(stream, Loader=IncludeLoader)
 
+    def mark_uncacheable(self):
+        """Mark the file currently being loaded as not being safe to cache,
+        for example because it generates a new value every time it's loaded
+        """
+        with self._lock:
+            if self._loading:
+                self._uncacheable.add(self._loading[-1])
+
+    def get_dependencies(self, uri):
+        """Get all the files that were loaded to load uri, including itself
+
+        Args:
+            uri (str): resolved path to a file loaded with this loader
+
+        Returns:
+            (set, bool): all files loaded, and whether the loaded file can be
+                cached
+        """
+        with self._lock:
+            seen = set()
+            to_visit = [uri]
+            cacheable = True
+
+            while to_visit:
+                current = to_visit.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+
+                if current in self._uncacheable:
+                    cacheable = False
+
+                try:
+                    to_visit.extend(self._dependencies[current])
+                except KeyError:
+                    # Not loaded by this loader, we don't know what it includes
+                    cacheable = False
+
+        return seen, cacheable
+
 
 schema_loader = SchemaLoader()
 yaml_loader = YamlLoader()
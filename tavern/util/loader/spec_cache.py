@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from .path_loader import yaml_loader
+
+logger = logging.getLogger(__name__)
+
+
+class SpecCache(object):
+    """Caches fully loaded test files on disk
+
+    Each cache entry is the loaded file (with any !include files already
+    included) along with a hash of every file that was loaded to create it. If
+    any of those files have changed since the entry was written, the file is
+    loaded again.
+
+    Files which use tags that give a different result every time they are
+    loaded, like !uuid, are never cached.
+
+    This is disabled unless cache_dir is set.
+    """
+
+    # Change this if the format of the cache entries changes
+    version = 1
+
+    def __init__(self, loader):
+        self.cache_dir = None
+        self._loader = loader
+        # path: (mtime, size, hash) so included files are only hashed once
+        self._hashes = {}
+        # Shown at the end of the run by pytest_terminal_summary
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stats(self):
+        """Get how many files were loaded from the cache
+
+        Returns:
+            dict: hits, misses and invalidations (misses where the entry had
+                to be thrown away because a file changed)
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def add_stats(self, stats):
+        """Add counts from stats() in a worker process to this cache's"""
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+        self.invalidations += stats["invalidations"]
+
+    def _hash_file(self, path):
+        stat = os.stat(path)
+        try:
+            mtime, size, digest = self._hashes[path]
+        except KeyError:
+            pass
+        else:
+            if (mtime, size) == (stat.st_mtime, stat.st_size):
+                return digest
+
+        with open(path, "rb") as hfile:
+            digest = hashlib.sha256(hfile.read()).hexdigest()
+
+        self._hashes[path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def _entry_filename(self, path):
+        name = hashlib.sha256(path.encode("utf8")).hexdigest()
+        return os.path.join(self.cache_dir, "{}.pickle".format(name))
+
+    def _read_entry(self, path):
+        entry_filename = self._entry_filename(path)
+
+        try:
+            with open(entry_filename, "rb") as efile:
+                entry = pickle.load(efile)
+        except (IOError, OSError):
+            logger.debug("Spec cache miss for %s", path)
+            return None
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Unable to read spec cache entry for %s", path, exc_info=True)
+            return None
+
+        if entry.get("version") != self.version or entry.get("path") != path:
+            logger.debug("Spec cache entry for %s is from a different version - invalidating", path)
+            return None
+
+        for dependency, digest in entry["hashes"].items():
+            try:
+                current = self._hash_file(dependency)
+            except (IOError, OSError):
+                current = None
+
+            if current != digest:
+                logger.debug("Spec cache entry for %s invalidated because %s changed",
+                             path, dependency)
+                self.invalidations += 1
+                return None
+
+        return entry
+
+    def _write_entry(self, path, spec):
+        dependencies, cacheable = self._loader.get_dependencies(path)
+
+        if not cacheable:
+            logger.debug("Not caching %s - it can't be cached", path)
+            return
+
+        entry = {
+            "version": self.version,
+            "path": path,
+            "hashes": {d: self._hash_file(d) for d in dependencies},
+            "spec": spec,
+        }
+
+        try:
+            dumped = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        except Exception:  # pylint: disable=broad-except
+            logger.debug("Not caching %s - unable to pickle it", path, exc_info=True)
+            return
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        entry_filename = self._entry_filename(path)
+
+        # Write to a temporary file first so that a parallel run never reads a
+        # half written entry
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as tmp:
+            tmp.write(dumped)
+
+        try:
+            os.rename(tmp.name, entry_filename)
+        except OSError:
+            # Windows can't rename over an existing file
+            os.remove(tmp.name)
+        else:
+            logger.debug("Wrote spec cache entry for %s (%d files)", path,
+                         len(dependencies))
+
+    def __call__(self, path):
+        """Load a test file, from the cache if possible
+
+        Args:
+            path (str): path to test file
+
+        Returns:
+            dict: loaded test spec
+        """
+        if not self.cache_dir:
+            return self._loader(path)
+
+        path = self._loader.resolve_uri(os.path.abspath(path))
+
+        entry = self._read_entry(path)
+        if entry is not None:
+            logger.debug("Spec cache hit for %s", path)
+            self.hits += 1
+            return entry["spec"]
+
+        self.misses += 1
+
+        spec = self._loader(path)
+        self._write_entry(path, spec)
+
+        return spec
+
+
+spec_cache = SpecCache(yaml_loader)
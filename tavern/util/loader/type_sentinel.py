@@ -69,6 +69,10 @@ class AnythingSentinel(TypeSentinel):
         """
         return ANYTHING
 
+    def __reduce__(self):
+        """Unpickle as ANYTHING as well, for the same reason"""
+        return "ANYTHING"
+
 
 # One instance of this (see above)
 ANYTHING = AnythingSentinel()
@@ -9,6 +9,12 @@ from yaml.composer import Composer
 from yaml.constructor import SafeConstructor
 from yaml.resolver import Resolver
 
+try:
+    from yaml.cyaml import CParser
+except ImportError:
+    # libyaml not available
+    CParser = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,6 +50,8 @@ def create_node_class(cls):
         # def __new__(self, x, start_mark, end_mark):
         #     return cls.__new__(self, x)
     node_class.__name__ = '%s_node' % cls.__name__
+    # So it can be pickled by name
+    node_class.__qualname__ = node_class.__name__
     return node_class
 
 
@@ -80,18 +88,22 @@ yaml.add_representer(
     list_node, yaml.representer.SafeRepresenter.represent_list)
 
 
-class IncludeLoader(Reader, Scanner, Parser, RememberComposer, Resolver,
-                    SourceMappingConstructor, SafeConstructor):
+def _get_root(stream):
+    try:
+        return os.path.split(stream.name)[0]
+    except AttributeError:
+        return os.path.curdir
+
+
+class PureIncludeLoader(Reader, Scanner, Parser, RememberComposer, Resolver,
+                        SourceMappingConstructor, SafeConstructor):
     """YAML Loader with `!include` constructor and which can remember anchors
     between documents"""
 
     def __init__(self, stream):
         """Initialise Loader."""
         # pylint: disable=non-parent-init-called
-        try:
-            self._root = os.path.split(stream.name)[0]
-        except AttributeError:
-            self._root = os.path.curdir
+        self._root = _get_root(stream)
         Reader.__init__(self, stream)
         Scanner.__init__(self)
         Parser.__init__(self)
@@ -99,3 +111,37 @@ class IncludeLoader(Reader, Scanner, Parser, RememberComposer, Resolver,
         SafeConstructor.__init__(self)
         Resolver.__init__(self)
         SourceMappingConstructor.__init__(self)
+
+
+# Share the constructors between loaders so that tags added to one (eg, with
+# IncludeLoader.add_constructor) can be used by both
+PureIncludeLoader.yaml_constructors = PureIncludeLoader.yaml_constructors.copy()
+PureIncludeLoader.yaml_multi_constructors = PureIncludeLoader.yaml_multi_constructors.copy()
+
+
+if CParser is not None:
+    class CIncludeLoader(RememberComposer, CParser, Resolver,
+                         SourceMappingConstructor, SafeConstructor):
+        """Same as PureIncludeLoader, but uses libyaml for parsing
+
+        Only the scanning and parsing is done by libyaml - RememberComposer
+        comes before CParser in the MRO so that nodes are still composed in
+        Python, which keeps anchors across documents working
+        """
+
+        def __init__(self, stream):
+            # pylint: disable=non-parent-init-called
+            self._root = _get_root(stream)
+            CParser.__init__(self, stream)
+            RememberComposer.__init__(self)
+            SafeConstructor.__init__(self)
+            Resolver.__init__(self)
+            SourceMappingConstructor.__init__(self)
+
+    CIncludeLoader.yaml_constructors = PureIncludeLoader.yaml_constructors
+    CIncludeLoader.yaml_multi_constructors = PureIncludeLoader.yaml_multi_constructors
+
+    IncludeLoader = CIncludeLoader
+else:
+    logger.debug("libyaml not available, using pure Python yaml loader")
+    IncludeLoader = PureIncludeLoader
@@ -0,0 +1,86 @@
+"""Helpers for logging potentially very large values
+
+Responses, request arguments and the variables for a test can be megabytes
+in size. Turning them into strings costs as much as the request itself, so
+they should only be logged through these helpers, which only build the string
+if the message is actually going to be logged and cut it down to a limited
+number of characters.
+"""
+
+from builtins import str as ustr
+
+
+class LogSettings(object):
+    """How much of large values to log
+
+    Attributes:
+        body_limit (int): maximum number of characters of a response body or
+            other large value to log, or 0 to log everything
+        full_body_on_failure (bool): whether to log the whole body of a
+            response which failed verification, even if it is over body_limit
+    """
+
+    def __init__(self):
+        self.body_limit = 4096
+        self.full_body_on_failure = False
+
+
+log_settings = LogSettings()
+
+
+def truncate(text, limit=None):
+    """Cut down text to be logged
+
+    Args:
+        text (str): text to log
+        limit (int): maximum length, defaults to log_settings.body_limit. 0
+            means no limit.
+
+    Returns:
+        str: text, or the start of it with how much was cut off
+    """
+    if limit is None:
+        limit = log_settings.body_limit
+
+    if not limit or len(text) <= limit:
+        return text
+
+    return u"{}... ({} more characters)".format(text[:limit], len(text) - limit)
+
+
+def preview_bytes(content, encoding=None, limit=None):
+    """Decode the start of some bytes to be logged, without decoding all of
+    them
+
+    Args:
+        content (bytes): bytes to log, eg a response body
+        encoding (str): encoding to decode with, defaults to utf8
+        limit (int): maximum number of bytes to decode, defaults to
+            log_settings.body_limit. 0 means no limit.
+
+    Returns:
+        str: decoded text, with how much was cut off
+    """
+    if limit is None:
+        limit = log_settings.body_limit
+
+    if limit and len(content) > limit:
+        text = content[:limit].decode(encoding or "utf8", "replace")
+        return u"{}... ({} more bytes)".format(text, len(content) - limit)
+
+    return content.decode(encoding or "utf8", "replace")
+
+
+class Truncated(object):
+    """Pass as a logging argument to only convert a value to a string, and
+    cut it down, if the message is logged
+
+    Args:
+        value (object): value to log
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return truncate(ustr(self.value))
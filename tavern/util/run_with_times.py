@@ -4,6 +4,7 @@ from functools import wraps
 from future.utils import raise_from
 
 from . import exceptions
+from .load import run_load
 
 logger = logging.getLogger(__name__)
 
@@ -11,10 +12,24 @@ logger = logging.getLogger(__name__)
 def run_with_times(stage):
     """Look for repeat and try to repeat the stage `times` times.
 
+    If the stage has a 'load' block, the repeats are run in load mode instead
+    - see tavern.util.load.
+
     Args:
         stage (dict): test stage
     """
 
+    if stage.get('load'):
+        def load_wrapper(fn):
+            @wraps(fn)
+            def wrapped(sessions, stage, test_block_config):
+                # pylint: disable=redefined-outer-name
+                return run_load(stage, lambda config: fn(sessions, stage, config), test_block_config)
+
+            return wrapped
+
+        return load_wrapper
+
     times = stage.get('times', 1)
 
     if times == 1:
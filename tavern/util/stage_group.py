@@ -0,0 +1,114 @@
+import logging
+from multiprocessing.pool import ThreadPool
+
+from future.utils import raise_from
+
+from . import exceptions
+from .delay import delay
+
+logger = logging.getLogger(__name__)
+
+
+def iter_stages(stages):
+    """Go through all stages in a test, including the ones inside 'parallel'
+    stage groups
+
+    Args:
+        stages (list): stages from a test spec
+
+    Yields:
+        dict: each stage
+    """
+    for stage in stages:
+        if "parallel" in stage:
+            for member in stage["parallel"]:
+                yield member
+        else:
+            yield stage
+
+
+def copy_block_config(test_block_config):
+    """Copy the test config for one stage which is run at the same time as
+    others
+
+    Stages only ever add or replace top level variables, so this doesn't need
+    to be a deep copy
+    """
+    stage_config = dict(test_block_config)
+    stage_config["variables"] = dict(test_block_config["variables"])
+    return stage_config
+
+
+def run_parallel_group(group, run_stage, test_block_config):
+    """Run all the stages in a 'parallel' stage group at the same time
+
+    Every stage is run, even if some of them fail. Each one gets its own copy
+    of the variables, and any variables they save are added to
+    test_block_config after they have all finished in the order the stages
+    are listed in, so if two stages save the same variable the last one in the
+    list wins.
+
+    Args:
+        group (dict): stage group, with a list of stages in 'parallel'
+        run_stage (callable): called with a stage and the config to use for it
+            to run one stage
+        test_block_config (dict): config for the test block
+
+    Raises:
+        TavernException: the exception from the stage that failed if only one
+            did, or a TestFailError naming all of them if several failed
+    """
+    stages = [s for s in group["parallel"] if not s.get("skip")]
+
+    for stage in stages:
+        if "mqtt_publish" in stage or "mqtt_response" in stage:
+            raise exceptions.BadSchemaError(
+                "MQTT stage '{}' can't be run in a parallel group".format(stage["name"]))
+
+    if not stages:
+        return
+
+    configs = [copy_block_config(test_block_config) for _ in stages]
+
+    def run(index):
+        try:
+            run_stage(stages[index], configs[index])
+        except exceptions.TavernException as e:
+            logger.error("Stage '%s' in '%s' failed", stages[index]["name"], group["name"])
+            return e
+        return None
+
+    delay(group, "before")
+
+    logger.info("Running %d stages in '%s' at the same time", len(stages), group["name"])
+
+    pool = ThreadPool(min(group.get("max_workers", len(stages)), len(stages)))
+    try:
+        errors = pool.map(run, range(len(stages)))
+    finally:
+        pool.close()
+        pool.join()
+
+    failed = [i for i, e in enumerate(errors) if e is not None]
+
+    if len(failed) == 1:
+        raise errors[failed[0]]
+    elif failed:
+        first = failed[0]
+        reasons = "".join(
+            "\n- '{}': {}".format(stages[i]["name"], (str(errors[i]).strip().splitlines() or [""])[0])
+            for i in failed)
+        error = exceptions.TestFailError(
+            "{} stages in '{}' failed:{}".format(len(failed), group["name"], reasons))
+        # Show the first stage that failed
+        error.stage = stages[first]
+        error.test_block_config = configs[first]
+        raise_from(error, errors[first])
+
+    variables = test_block_config["variables"]
+    for stage_config in configs:
+        for key, value in stage_config["variables"].items():
+            if key not in variables or variables[key] is not value:
+                variables[key] = value
+
+    delay(group, "after")
@@ -0,0 +1,199 @@
+"""Record how long each part of running a stage takes
+
+Timing is off unless --tavern-timing or --tavern-timing-report is passed.
+While it is on, every run of a stage (including each retry and each
+iteration of 'times') produces a record of how long was spent formatting the
+request, sending it, decoding the response, verifying it, saving values and
+sleeping in delays. Each phase only counts time not spent in a phase nested
+inside it, so the phases of a stage add up to at most its total time.
+"""
+
+import threading
+from functools import wraps
+from timeit import default_timer
+
+
+PHASES = ["format", "request", "decode", "verify", "save", "delay"]
+
+
+def describe_request(request_vars):
+    """Get a short description of what a request was sent to, to group
+    timings by
+
+    Args:
+        request_vars (dict): request_vars of a request
+
+    Returns:
+        str: method and url without the query string for HTTP requests, or
+            the topic for MQTT
+    """
+    if "url" in request_vars:
+        return "{} {}".format(
+            str(request_vars.get("method", "GET")).upper(),
+            str(request_vars["url"]).split("?", 1)[0])
+    elif "topic" in request_vars:
+        return "MQTT {}".format(request_vars["topic"])
+
+    return None
+
+
+class _StageRecord(object):
+
+    def __init__(self, test, stage):
+        self.test = test
+        self.stage = stage
+        self.endpoint = None
+        self.phases = {}
+        # Time spent in nested phases, one entry per phase being timed
+        self.nested = []
+
+    def add(self, phase, elapsed):
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+
+class _NoTiming(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_no_timing = _NoTiming()
+
+
+class _PhaseTimer(object):
+
+    def __init__(self, record, phase):
+        self.record = record
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.record.nested.append(0.0)
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = default_timer() - self.start
+        nested = self.record.nested.pop()
+        self.record.add(self.phase, elapsed - nested)
+        if self.record.nested:
+            self.record.nested[-1] += elapsed
+
+
+class StageTimings(object):
+    """Collects timings of stages run in this process
+
+    Phases are added to the stage being run in the current thread, so stages
+    run at the same time in parallel groups or in load mode each get their
+    own record.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._records = []
+        self._local = threading.local()
+
+    def _current(self):
+        return getattr(self._local, "record", None)
+
+    def phase(self, name):
+        """Time a phase of the stage being run in this thread
+
+        Args:
+            name (str): one of PHASES
+
+        Returns:
+            context manager: times whatever is run inside it. Does nothing
+                if timing is off or no stage is being run.
+        """
+        record = self._current()
+        if record is None:
+            return _no_timing
+        return _PhaseTimer(record, name)
+
+    def set_request(self, request_vars):
+        """Save what the stage being run in this thread sent a request to"""
+        record = self._current()
+        if record is not None:
+            record.endpoint = describe_request(request_vars)
+
+    def wrap_stage(self, test_name, fn):
+        """Time each call of a function which runs a stage
+
+        Args:
+            test_name (str): name of the test the stage is in
+            fn (callable): run_stage, or something with the same arguments
+
+        Returns:
+            callable: fn, which records how long it takes if timing is on
+        """
+        if not self.enabled:
+            return fn
+
+        @wraps(fn)
+        def wrapped(sessions, stage, test_block_config):
+            record = _StageRecord(test_name, stage["name"])
+            previous = self._current()
+            self._local.record = record
+
+            status = "failed"
+            start = default_timer()
+            try:
+                result = fn(sessions, stage, test_block_config)
+                status = "passed"
+            finally:
+                total = default_timer() - start
+                self._local.record = previous
+                self._add({
+                    "kind": "stage",
+                    "test": test_name,
+                    "stage": record.stage,
+                    "endpoint": record.endpoint,
+                    "status": status,
+                    "total": total,
+                    "phases": record.phases,
+                })
+
+            return result
+
+        return wrapped
+
+    def add_test(self, test_name, path, total, setup):
+        """Record how long a whole test took
+
+        Args:
+            test_name (str): name of the test
+            path (str): file the test is in
+            total (float): seconds taken to run the test, including setup
+            setup (float): seconds spent running 'setup' tests
+        """
+        if self.enabled:
+            self._add({
+                "kind": "test",
+                "test": test_name,
+                "path": path,
+                "total": total,
+                "setup": setup,
+            })
+
+    def _add(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def pop_records(self):
+        """Get everything recorded since this was last called
+
+        Returns:
+            list(dict): records of each stage and test
+        """
+        with self._lock:
+            records = self._records
+            self._records = []
+        return records
+
+
+stage_timings = StageTimings()
@@ -0,0 +1,97 @@
+"""Time loading a large generated suite of test files with each yaml loader
+
+Usage:
+
+    python tests/benchmarks/benchmark_collection.py [--files N] [--stages N]
+
+Loads every file the same way YamlFile.collect does, with the libyaml backed
+loader (if available) and with the pure Python one, then runs
+'pytest --collect-only' on the suite with the default loader.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from mock import patch
+import pytest
+
+from tavern.util import loader
+from tavern.util.loader import yaml_loader, PureIncludeLoader
+
+
+STAGE = """
+  - name: stage {stage}
+    request:
+      url: "{{host}}/items/{stage}"
+      method: POST
+      headers:
+        authorization: "Bearer {{token}}"
+      json:
+        id: !int "{{item_id}}"
+        name: "item {stage}"
+        tags: [a, b, c, d]
+        nested:
+          values: [1, 2.5, true, null]
+          description: >
+            Some longer folded text which
+            goes over multiple lines
+    response:
+      status_code: 200
+      save:
+        saved_{stage}: "{{body.id}}"
+      validate:
+        - eq: ["{{body.name}}", "item {stage}"]
+        - len_eq: ["{{body.tags}}", 4]
+        - eq: ["{{body.nested}}", !anything ]
+"""
+
+
+def generate_suite(directory, n_files, n_stages):
+    with open(os.path.join(directory, "common.yaml"), "w") as cfile:
+        cfile.write("name: common\nvariables:\n  host: http://localhost\n  item_id: '1'\n")
+
+    for i in range(n_files):
+        stages = "".join(STAGE.format(stage=s) for s in range(n_stages))
+        with open(os.path.join(directory, "stage_{}.yaml".format(i)), "w") as sfile:
+            sfile.write("name: test {}\nincludes:\n  - !include common.yaml\nstages:{}".format(i, stages))
+
+
+def load_suite(directory):
+    yaml_loader.store.clear()
+    for filename in os.listdir(directory):
+        if filename.startswith("stage_"):
+            yaml_loader(os.path.join(directory, filename))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--stages", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        generate_suite(directory, args.files, args.stages)
+
+        loaders = [("pure", PureIncludeLoader)]
+        if hasattr(loader, "CIncludeLoader"):
+            loaders.insert(0, ("libyaml", loader.CIncludeLoader))
+
+        for name, loader_class in loaders:
+            with patch("tavern.util.loader.path_loader.IncludeLoader", loader_class):
+                best = min(timeit.repeat(lambda: load_suite(directory), number=1, repeat=args.repeat))
+            print("{:>8}: {:.3f}s to load {} files".format(name, best, args.files))
+
+        yaml_loader.store.clear()
+        start = timeit.default_timer()
+        pytest.main(["--collect-only", "-q", "-p", "no:cacheprovider", directory])
+        print("pytest --collect-only: {:.3f}s".format(timeit.default_timer() - start))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
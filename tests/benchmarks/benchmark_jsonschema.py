@@ -0,0 +1,77 @@
+"""Time validating response bodies against a JSON schema
+
+Usage:
+
+    python tests/benchmarks/benchmark_jsonschema.py [--items N] [--number N]
+
+Prints how many validations per second jsonschema.validate (which is what
+jsonschema_validation used to call) gets through, compared to
+jsonschema_validation with cached validators, and with fastjsonschema if it
+is installed.
+"""
+import argparse
+import copy
+import timeit
+
+import jsonschema
+
+from tavern.util import jsonschema_util
+from tavern.util.built_in import jsonschema_validation
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "count": {"type": "integer", "minimum": 0},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "name": {"type": "string", "maxLength": 64},
+                    "tags": {"type": "array", "items": {"type": "string"}},
+                    "owner": {"type": ["string", "null"]},
+                },
+                "required": ["id", "name"],
+            },
+        },
+    },
+    "required": ["count", "items"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    body = {
+        "count": args.items,
+        "items": [
+            {"id": i, "name": "item {}".format(i), "tags": ["a", "b"], "owner": None}
+            for i in range(args.items)
+        ],
+    }
+
+    def report(name, fn):
+        # A copy of the schema each time, like a schema loaded in each test
+        schemas = [copy.deepcopy(SCHEMA) for _ in range(10)]
+        t = timeit.timeit(lambda: [fn(body, s) for s in schemas], number=args.number // 10)
+        print("{:32s} {:8.0f} validations/s".format(name, len(schemas) * (args.number // 10) / t))
+
+    report("jsonschema.validate:", jsonschema.validate)
+
+    jsonschema_util.jsonschema_settings.backend = "jsonschema"
+    report("jsonschema_validation:", jsonschema_validation)
+
+    if jsonschema_util.fastjsonschema is not None:
+        jsonschema_util.jsonschema_settings.backend = "fastjsonschema"
+        report("jsonschema_validation (fast):", jsonschema_validation)
+    else:
+        print("fastjsonschema is not installed")
+
+
+if __name__ == "__main__":
+    main()
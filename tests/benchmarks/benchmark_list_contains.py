@@ -0,0 +1,65 @@
+"""Time checking membership of a large list with list_contains_with_items
+
+Usage:
+
+    python tests/benchmarks/benchmark_list_contains.py [--items N] [--checks N]
+
+Prints how long it takes to check --checks values are in a list of --items
+objects, with each way of picking what to compare, one value at a time and
+with list_contains_all_items. The old implementation, which went through the
+list for every value, is timed for comparison.
+"""
+import argparse
+import timeit
+
+from tavern.util.built_in import list_contains_with_items, list_contains_all_items, clear_list_indexes
+
+
+def old_list_contains(check_list, check_value, check_key=None, unique_key=None):
+    if unique_key:
+        return any(check_value[unique_key] == i[unique_key] for i in check_list)
+    elif isinstance(check_key, (list, tuple)):
+        return any(check_value == {key: i[key] for key in check_key} for i in check_list)
+    return any(check_value == i[check_key] for i in check_list)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--checks", type=int, default=50)
+    args = parser.parse_args()
+
+    check_list = [{"id": i, "name": "item {}".format(i), "owner": i % 7} for i in range(args.items)]
+    # The worst case for scanning - values near the end of the list
+    wanted = [check_list[-1 - i] for i in range(args.checks)]
+
+    cases = [
+        ("unique_key", [{"id": w["id"]} for w in wanted], {"unique_key": "id"}),
+        ("check_key", [w["name"] for w in wanted], {"check_key": "name"}),
+        ("check_key list", [{"id": w["id"], "owner": w["owner"]} for w in wanted], {"check_key": ["id", "owner"]}),
+    ]
+
+    for name, values, kwargs in cases:
+        def one_by_one():
+            clear_list_indexes()
+            for value in values:
+                list_contains_with_items(check_list, value, **kwargs)
+
+        def batch():
+            clear_list_indexes()
+            list_contains_all_items(check_list, values, **kwargs)
+
+        def old():
+            for value in values:
+                assert old_list_contains(check_list, value, **kwargs)
+
+        print("{:16s} {:8.3f}s one by one {:8.3f}s batch {:8.3f}s before".format(
+            name + ":",
+            timeit.timeit(one_by_one, number=1),
+            timeit.timeit(batch, number=1),
+            timeit.timeit(old, number=1),
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Time running test blocks against a local HTTP server with and without the
+HTTP session pool
+
+Usage:
+
+    python tests/benchmarks/benchmark_session_pool.py [--blocks N] [--stages N]
+
+Each test block is a separate call to tavern.core.run_test, like each test in
+a yaml file. Without the pool every block opens a new connection to the
+server, with the pool they reuse the same connection. The server is on
+localhost so this only shows the cost of setting up a TCP connection - for a
+remote server using TLS the difference is much bigger.
+"""
+import argparse
+import copy
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from tavern.core import run_test
+from tavern.plugins import session_pool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which otherwise makes every
+    # response on a kept-alive connection wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        data = json.dumps({"path": self.path}).encode("utf8")
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_test_spec(port, n_stages):
+    return {
+        "name": "benchmark",
+        "stages": [
+            {
+                "name": "stage {}".format(i),
+                "request": {
+                    "url": "http://127.0.0.1:{}/{}".format(port, i),
+                    "method": "GET",
+                },
+                "response": {
+                    "status_code": 200,
+                    "body": {"path": "/{}".format(i)},
+                },
+            }
+            for i in range(n_stages)
+        ],
+    }
+
+
+def run_blocks(test_spec, n_blocks):
+    global_cfg = {
+        "variables": {},
+        "strict": [],
+        "backends": {"http": "requests", "mqtt": "paho-mqtt"},
+    }
+
+    start = time.time()
+    for _ in range(n_blocks):
+        run_test("benchmark.yaml", copy.deepcopy(test_spec), copy.deepcopy(global_cfg))
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=300)
+    parser.add_argument("--stages", type=int, default=2)
+    args = parser.parse_args()
+
+    server = _Server(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    test_spec = make_test_spec(server.server_address[1], args.stages)
+    n_requests = args.blocks * args.stages
+
+    # Warm up imports, plugin loading etc.
+    run_blocks(test_spec, 5)
+
+    session_pool.enabled = False
+    t_unpooled = run_blocks(test_spec, args.blocks)
+
+    session_pool.enabled = True
+    t_pooled = run_blocks(test_spec, args.blocks)
+    session_pool.close()
+
+    server.shutdown()
+
+    print("without pool: {:.0f} requests/s".format(n_requests / t_unpooled))
+    print("with pool:    {:.0f} requests/s ({} sessions created, {} reused)".format(
+        n_requests / t_pooled, session_pool.created, session_pool.reused))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Time verifying a large response body streamed with 'stream: true'
+
+Usage:
+
+    python tests/benchmarks/benchmark_streaming.py [--items N]
+
+Generates a body with a list of --items objects as it is read, then prints
+the time taken and the peak memory used to get the first id and the length
+of the list by decoding the whole body, and by streaming it and only keeping
+those values. Needs ijson to be installed.
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+
+import requests
+
+from tavern._plugins.rest.streamed import StreamedResponse, get_body_paths
+
+
+class GeneratedBody(object):
+    """File-like body which generates the JSON as it is read"""
+
+    def __init__(self, items):
+        self._chunks = self._generate(items)
+        self._buffer = b""
+
+    @staticmethod
+    def _generate(items):
+        yield b'{"count": %d, "items": [' % items
+        for i in range(items):
+            item = {"id": i, "name": "item {}".format(i), "tags": ["a", "b"], "owner": None}
+            yield (", " if i else "").encode("utf8") + json.dumps(item).encode("utf8")
+        yield b"]}"
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def make_response(items):
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response.raw = GeneratedBody(items)
+    return StreamedResponse(response)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200000)
+    args = parser.parse_args()
+
+    expected = {
+        "save": {"first_id": "{body.items.0.id}"},
+        "validate": [{"len_eq": ["{body.items}", args.items]}],
+    }
+    paths = get_body_paths(expected)
+
+    def decoded():
+        body = make_response(args.items).json()
+        return body["items"][0]["id"], len(body["items"])
+
+    def streamed():
+        body = make_response(args.items).stream_json(paths)
+        return body["items"][0]["id"], len(body["items"])
+
+    for name, fn in [("decoded", decoded), ("streamed", streamed)]:
+        tracemalloc.start()
+        t = timeit.timeit(fn, number=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{:10s} {:8.3f}s  peak memory {:8.1f} MB".format(name + ":", t, peak / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
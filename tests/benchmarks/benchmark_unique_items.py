@@ -0,0 +1,63 @@
+"""Time the unique_item_in_list and unique_item_properties comparators
+
+Usage:
+
+    python tests/benchmarks/benchmark_unique_items.py [--sizes N [N ...]] [--old-max N]
+
+Prints how long each comparator takes on lists of unique scalars, unique
+objects (which need a canonical key) and objects with a unique property. The
+old implementations, which compared each item against a list of the items
+before it, are also timed for lists up to --old-max items since they take
+quadratic time.
+"""
+import argparse
+import timeit
+
+from tavern.util.built_in import unique_item_in_list, unique_item_properties
+
+
+def old_unique_item_in_list(check_list):
+    checked = []
+    for i in check_list:
+        if i in checked:
+            raise AssertionError(i)
+        checked.append(i)
+    return True
+
+
+def old_unique_item_properties(check_value, key):
+    exist = []
+    for item in check_value:
+        value = item[key]
+        assert value not in exist
+        exist.append(value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--old-max", type=int, default=10000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        scalars = list(range(size))
+        objects = [{"id": i, "name": "item {}".format(i), "tags": ["a", str(i)]} for i in range(size)]
+
+        cases = [
+            ("unique_item_in_list (scalars)", unique_item_in_list, old_unique_item_in_list, (scalars,)),
+            ("unique_item_in_list (objects)", unique_item_in_list, old_unique_item_in_list, (objects,)),
+            ("unique_item_properties", unique_item_properties, old_unique_item_properties, (objects, "id")),
+        ]
+
+        print("{} items:".format(size))
+        for name, new, old, fn_args in cases:
+            t_new = timeit.timeit(lambda: new(*fn_args), number=1)
+            line = "  {:32s} {:9.3f}s".format(name, t_new)
+            if size <= args.old_max:
+                t_old = timeit.timeit(lambda: old(*fn_args), number=1)
+                line += "  (was {:.3f}s)".format(t_old)
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
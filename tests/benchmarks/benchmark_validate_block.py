@@ -0,0 +1,69 @@
+"""Time running the 'validate' block of a response
+
+Usage:
+
+    python tests/benchmarks/benchmark_validate_block.py [--validators N] [--number N]
+
+Prints how long it takes to look up a comparator by alias (compared to
+importing it by name with import_ext_function, which is what used to happen on
+every lookup) and how many validators per second RestResponse._validate_block
+gets through.
+"""
+import argparse
+import timeit
+
+from mock import Mock
+
+from tavern._plugins.rest.response import RestResponse
+from tavern.util.comparator_util import comparators, _built_in_aliases
+from tavern.util.import_util import import_ext_function
+
+
+def make_validate_block(n_validators):
+    aliases = ["eq", "ne", "len_eq", "contains", "lt", "str_eq"]
+    args = {
+        "eq": ["{body.items.0.name}", "item 0"],
+        "ne": ["{body.items.0.name}", "item 1"],
+        "len_eq": ["{body.items}", 10],
+        "contains": ["{body.items.0.name}", "item"],
+        "lt": ["{body.count}", 100],
+        "str_eq": ["{body.count}", "10"],
+    }
+
+    return [
+        {aliases[i % len(aliases)]: args[aliases[i % len(aliases)]]}
+        for i in range(n_validators)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--validators", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    all_aliases = [alias for _, aliases in _built_in_aliases for alias in aliases]
+    names = [name for name, aliases in _built_in_aliases for _ in aliases]
+
+    lookups = args.number * len(all_aliases)
+    t_registry = timeit.timeit(lambda: [comparators.get_comparator(a) for a in all_aliases], number=args.number)
+    t_import = timeit.timeit(lambda: [import_ext_function(n) for n in names], number=args.number)
+    print("get_comparator:      {:.3f}us per lookup".format(t_registry / lookups * 1e6))
+    print("import_ext_function: {:.3f}us per lookup".format(t_import / lookups * 1e6))
+
+    variables = {
+        "body": {
+            "items": [{"name": "item {}".format(i)} for i in range(10)],
+            "count": 10,
+        },
+    }
+    response = RestResponse(Mock(), "benchmark", {}, {"variables": variables})
+    validate_block = make_validate_block(args.validators)
+
+    t_block = timeit.timeit(lambda: response._validate_block(validate_block), number=args.number)
+    assert not response.errors, response.errors
+    print("_validate_block:     {:.0f} validators/s".format(args.validators * args.number / t_block))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,15 @@
 import pytest
 
+from tavern.util.import_util import ext_function_cache
+from tavern.schemas.extensions import wrapped_function_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_ext_function_caches():
+    """Some tests patch functions which are loaded with import_ext_function"""
+    ext_function_cache.clear()
+    wrapped_function_cache.clear()
+
 
 @pytest.fixture(name="includes")
 def fix_example_includes():
@@ -1,9 +1,18 @@
+import io
+import json
+
 import pytest
+import requests
 from mock import Mock, patch
 
+from tavern._plugins.rest.decoded import DecodedResponse
+from tavern._plugins.rest import streamed
 from tavern._plugins.rest.response import RestResponse
+from tavern._plugins.rest.streamed import StreamedResponse, get_body_paths
 from tavern.util.loader import ANYTHING
+from tavern.util.log_utils import log_settings
 from tavern.util import exceptions
+from tavern.util.comparator_util import comparators
 
 
 @pytest.fixture(name="example_schema")
@@ -446,10 +455,13 @@ class TestNestedValidate:
 
         r = RestResponse(Mock(), "Test 1", example_schema, includes)
 
-        with patch("tavern.util.built_in.equals", return_value=True) as pmock:
+        pmock = Mock(return_value=True)
+        with patch.object(comparators, "get_comparator", return_value=pmock):
             r._validate_block(validate_block)
 
         pmock.assert_called_with("blabla", ANYTHING, strict=True)
+        # kwargs should still be there if the stage is run again
+        assert validate_block[0]["eq"][-1] == {"strict": True}
         includes["variables"].pop("body")
         assert not r.errors
 
@@ -527,3 +539,269 @@ class TestFull:
             status_code = example_response["status_code"]
 
         r.verify(FakeResponse())
+
+
+class TestDecodedResponse:
+
+    @pytest.fixture(name="fake_response")
+    def fix_fake_response(self, example_response):
+        response = Mock(
+            spec=requests.Response,
+            headers=example_response["headers"],
+            status_code=example_response["status_code"],
+            content=json.dumps(example_response["body"]).encode("utf8"),
+            encoding=None,
+            text="text",
+        )
+        response.json.return_value = example_response["body"]
+        return response
+
+    def test_decoded_once(self, fake_response, example_schema, includes):
+        """The body is only decoded once, even when $ext functions use it"""
+        example_schema["validate"].append({"$ext": {"function": "tavern.testutils.helpers:validate_content",
+                                                    "extra_kwargs": {"comparisons": [
+                                                        {"jmespath": "code", "operator": "eq", "expected": "abc123"},
+                                                        {"jmespath": "a_thing", "operator": "eq", "expected": "authorization_code"},
+                                                    ]}}})
+        example_schema["save"] = {"test_code": "{body.code}"}
+
+        r = RestResponse(Mock(), "Test 1", example_schema, includes)
+
+        with patch("tavern._plugins.rest.decoded.orjson", None):
+            saved = r.verify(fake_response)
+
+        assert saved == {"test_code": "abc123"}
+        assert fake_response.json.call_count == 1
+
+    def test_error_cached(self, fake_response):
+        fake_response.json.side_effect = ValueError("not json")
+
+        with patch("tavern._plugins.rest.decoded.orjson", None):
+            decoded = DecodedResponse(fake_response)
+
+            for _ in range(2):
+                with pytest.raises(ValueError):
+                    decoded.json()
+
+        assert fake_response.json.call_count == 1
+
+    def test_fast_decoder(self, fake_response, example_response):
+        orjson = Mock()
+        orjson.loads.return_value = example_response["body"]
+
+        with patch("tavern._plugins.rest.decoded.orjson", orjson):
+            assert DecodedResponse(fake_response).json() == example_response["body"]
+
+        orjson.loads.assert_called_once_with(fake_response.content)
+        assert not fake_response.json.called
+
+    def test_fast_decoder_falls_back(self, fake_response, example_response):
+        orjson = Mock()
+        orjson.loads.side_effect = ValueError("can't decode")
+
+        with patch("tavern._plugins.rest.decoded.orjson", orjson):
+            assert DecodedResponse(fake_response).json() == example_response["body"]
+
+        assert fake_response.json.call_count == 1
+
+    def test_passes_through(self, fake_response):
+        decoded = DecodedResponse(fake_response)
+
+        assert decoded.status_code == fake_response.status_code
+        assert decoded.headers is fake_response.headers
+        assert decoded.text == "text"
+        assert decoded.response is fake_response
+
+
+class TestVerboseLog:
+
+    @pytest.fixture(name="big_response")
+    def fix_big_response(self, example_response):
+        body = {"items": ["x" * 100] * 100}
+        response = Mock(
+            spec=requests.Response,
+            headers=example_response["headers"],
+            status_code=200,
+            content=json.dumps(body).encode("utf8"),
+            encoding=None,
+        )
+        response.json.return_value = body
+        return response
+
+    def test_nothing_built_if_not_logging(self, big_response, includes):
+        r = RestResponse(Mock(), "Test 1", {}, includes)
+
+        with patch("tavern._plugins.rest.response.logger") as lmock:
+            lmock.isEnabledFor.return_value = False
+            r._verbose_log_response(big_response, {})
+
+        assert not lmock.info.called
+        assert not big_response.json.called
+
+    def test_big_body_truncated(self, big_response, includes):
+        r = RestResponse(Mock(), "Test 1", {}, includes)
+
+        with patch("tavern._plugins.rest.response.logger") as lmock:
+            lmock.isEnabledFor.return_value = True
+            with patch.object(log_settings, "body_limit", 50):
+                r._verbose_log_response(big_response, {})
+
+        logged = str(lmock.info.call_args_list)
+        assert "more bytes" in logged
+        assert "x" * 100 not in logged
+        assert not big_response.json.called
+
+    def test_full_body_on_failure(self, big_response, includes):
+        big_response.status_code = 400
+        big_response.text = big_response.content.decode("utf8")
+        r = RestResponse(Mock(), "Test 1", {}, includes)
+
+        with patch("tavern._plugins.rest.response.logger") as lmock:
+            with patch.object(log_settings, "full_body_on_failure", True):
+                with pytest.raises(exceptions.TestFailError):
+                    r.verify(big_response)
+
+        assert big_response.text in str(lmock.error.call_args_list)
+
+
+requires_ijson = pytest.mark.skipif(streamed.ijson is None, reason="ijson not installed")
+
+
+class TestStreamed:
+
+    @pytest.fixture(name="streamed_body")
+    def fix_streamed_body(self):
+        return {
+            "count": 100,
+            "items": [{"id": i, "name": "item {}".format(i), "tags": ["a", "b"]} for i in range(100)],
+            "meta": {"page": 1, "next": None},
+        }
+
+    @pytest.fixture(name="make_response")
+    def fix_make_response(self, streamed_body):
+        def make_response(body=None, status_code=200):
+            response = requests.Response()
+            response.status_code = status_code
+            response.encoding = "utf-8"
+            if body is None:
+                body = json.dumps(streamed_body).encode("utf8")
+            response.raw = io.BytesIO(body)
+            return StreamedResponse(response)
+
+        return make_response
+
+    @pytest.fixture(name="streamed_schema")
+    def fix_streamed_schema(self):
+        return {
+            "status_code": 200,
+            "save": {
+                "first_id": "{body.items.0.id}",
+                "last_name": "{body.items.-1.name}",
+                "meta": "{body.meta}",
+            },
+            "validate": [
+                {"eq": ["{body.count}", 100]},
+                {"len_eq": ["{body.items}", 100]},
+                {"eq": ["{body.items.5.tags}", ["a", "b"]]},
+            ],
+        }
+
+    @requires_ijson
+    def test_save_and_validate(self, make_response, streamed_schema, includes):
+        response = make_response()
+        r = RestResponse(Mock(), "Test 1", streamed_schema, includes)
+
+        saved = r.verify(response)
+
+        assert saved == {"first_id": 0, "last_name": "item 99", "meta": {"page": 1, "next": None}}
+        assert response.streamed
+
+    @requires_ijson
+    def test_only_used_values_kept(self, make_response, streamed_schema):
+        body = make_response().stream_json(get_body_paths(streamed_schema))
+
+        assert body["count"] == 100
+        assert len(body["items"]) == 100
+        # Any item might be the last one, so the name is kept too
+        assert body["items"][5] == {"name": "item 5", "tags": ["a", "b"]}
+        assert body["items"][-1] == {"name": "item 99"}
+        with pytest.raises(IndexError):
+            body["items"][50]
+        with pytest.raises(IndexError):
+            body["items"][100]
+
+    @requires_ijson
+    def test_body_already_read(self, streamed_body, streamed_schema, includes):
+        """Sessions which don't stream, like the aiohttp one, read the whole
+        body before returning the response"""
+        response = requests.Response()
+        response.status_code = 200
+        response.encoding = "utf-8"
+        response._content = json.dumps(streamed_body).encode("utf8")
+        response._content_consumed = True
+        response = StreamedResponse(response)
+        r = RestResponse(Mock(), "Test 1", streamed_schema, includes)
+
+        with patch("tavern._plugins.rest.streamed.CHUNK_SIZE", 100):
+            saved = r.verify(response)
+
+        assert saved["last_name"] == "item 99"
+        assert response.streamed
+
+    @requires_ijson
+    def test_validate_fails(self, make_response, streamed_schema, includes):
+        streamed_schema["validate"].append({"len_gt": ["{body.items}", 100]})
+        r = RestResponse(Mock(), "Test 1", streamed_schema, includes)
+
+        with pytest.raises(exceptions.TestFailError):
+            r.verify(make_response())
+
+        assert len(r.errors) == 1
+
+    @pytest.mark.parametrize("uses_body", (
+        {"save": {"all": "{body}"}},
+        {"validate": [{"eq": ["{jmes:length(body.items)}", 100]}]},
+        {"validate": [{"$ext": {"function": "tavern.testutils.helpers:validate_content",
+                                "extra_kwargs": {"comparisons": [
+                                    {"jmespath": "count", "operator": "eq", "expected": 100}]}}}]},
+    ))
+    def test_whole_body_decoded(self, make_response, streamed_body, includes, uses_body):
+        """Anything which could look at the whole body means it isn't streamed"""
+        schema = dict(uses_body, status_code=200)
+        response = make_response()
+        r = RestResponse(Mock(), "Test 1", schema, includes)
+
+        saved = r.verify(response)
+
+        assert not response.streamed
+        assert saved == ({"all": streamed_body} if "save" in uses_body else {})
+
+    def test_unexpected_status_code(self, make_response, streamed_schema, includes):
+        """The body of an error response is decoded so it can be shown"""
+        response = make_response(b'{"error": "not found"}', status_code=404)
+        r = RestResponse(Mock(), "Test 1", streamed_schema, includes)
+
+        with pytest.raises(exceptions.TestFailError):
+            r.verify(response)
+
+        assert not response.streamed
+        assert "not found" in str(r.errors)
+
+    def test_ijson_not_installed(self, make_response, streamed_schema, includes):
+        response = make_response()
+        r = RestResponse(Mock(), "Test 1", streamed_schema, includes)
+
+        with patch("tavern._plugins.rest.streamed.ijson", None):
+            saved = r.verify(response)
+
+        assert not response.streamed
+        assert saved["last_name"] == "item 99"
+
+    @requires_ijson
+    def test_invalid_body(self, make_response, streamed_schema):
+        response = make_response(b'{"items": [1, 2')
+
+        with pytest.raises(ValueError):
+            response.stream_json(get_body_paths(streamed_schema))
+
+        assert response.text == "<streamed body, not kept>"
@@ -0,0 +1,278 @@
+from mock import patch
+import pytest
+
+pytest.importorskip("aiohttp")
+
+# pylint: disable=wrong-import-position
+import json
+import subprocess
+import sys
+import textwrap
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from tavern._plugins.async_http.aio_session import AsyncHttpSession
+from tavern._plugins.async_http.tavernhook import TavernAsyncHttpPlugin
+from tavern._plugins.rest.request import RestRequest
+from tavern._plugins.rest.streamed import StreamedResponse, get_body_paths
+from tavern.core import run_test
+from tavern.plugins import load_plugins
+from tavern.util import exceptions
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Requests to /barrier only get a reply once this many are waiting
+    barrier = None
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self, status, body, extra_headers=()):
+        data = json.dumps(body).encode("utf8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in extra_headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        if self.path == "/cookie":
+            self._reply(200, {}, [("set-cookie", "session=abc; Path=/")])
+        elif self.path == "/redirect":
+            self._reply(302, {}, [("location", "/elsewhere")])
+        elif self.path == "/barrier":
+            try:
+                self.barrier.wait()
+            except threading.BrokenBarrierError:
+                self._reply(500, {})
+            else:
+                self._reply(200, {})
+        else:
+            self._reply(200, {
+                "path": self.path,
+                "cookie": self.headers.get("cookie"),
+                "authorization": self.headers.get("authorization"),
+            })
+
+    def do_POST(self):
+        # pylint: disable=invalid-name
+        length = int(self.headers["content-length"])
+        self._reply(201, json.loads(self.rfile.read(length).decode("utf8")))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture(name="server_url", scope="module")
+def fix_server_url():
+    server = _Server(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+
+    server.shutdown()
+
+
+class TestAsyncHttpSession:
+
+    def test_get(self, server_url):
+        with AsyncHttpSession() as session:
+            response = session.request("GET", server_url + "/a", params={"b": 1, "c": [True, "d"]},
+                                       auth=("user", "pass"))
+
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/json"
+        assert response.json()["path"] == "/a?b=1&c=True&c=d"
+        assert response.json()["authorization"].startswith("Basic ")
+
+    def test_post_json(self, server_url):
+        with AsyncHttpSession() as session:
+            response = session.request("POST", server_url, json={"a": [1, 2]})
+
+        assert response.status_code == 201
+        assert response.json() == {"a": [1, 2]}
+
+    def test_no_redirect(self, server_url):
+        with AsyncHttpSession() as session:
+            response = session.request("GET", server_url + "/redirect", allow_redirects=False)
+
+        assert response.status_code == 302
+        assert response.headers["location"] == "/elsewhere"
+
+    def test_cookies(self, server_url):
+        with AsyncHttpSession() as session:
+            response = session.request("GET", server_url + "/cookie")
+            assert "session" in response.cookies
+
+            response = session.request("GET", server_url)
+            assert response.json()["cookie"] == "session=abc"
+
+            session.cookies.clear_session_cookies()
+
+            response = session.request("GET", server_url)
+            assert response.json()["cookie"] is None
+
+    def test_stream(self, server_url):
+        with AsyncHttpSession() as session:
+            response = session.request("GET", server_url + "/a", stream=True)
+
+            assert response.status_code == 200
+            assert not response.raw.closed
+
+            body = b"".join(response.iter_content(8))
+            assert json.loads(body.decode("utf8"))["path"] == "/a"
+            assert response.raw.closed
+
+            # Connection can be used again
+            response = session.request("GET", server_url + "/b")
+            assert response.json()["path"] == "/b"
+
+    def test_stream_read_body(self, server_url):
+        """A response whose body was read without streaming can still be
+        passed to StreamedResponse"""
+        pytest.importorskip("ijson")
+
+        with AsyncHttpSession() as session:
+            response = StreamedResponse(session.request("GET", server_url + "/a"))
+
+        body = response.stream_json(get_body_paths({"save": {"path": "{body.path}"}}))
+        assert body == {"path": "/a"}
+
+    def test_connection_error(self, includes):
+        rspec = {
+            "url": "http://127.0.0.1:1/",
+            "method": "GET",
+        }
+
+        with AsyncHttpSession() as session:
+            with pytest.raises(exceptions.RestRequestException):
+                RestRequest(session, rspec, includes).run()
+
+
+class TestAsyncHttpPlugin:
+
+    def test_run_test(self, server_url):
+        test_spec = {
+            "name": "aiohttp backend",
+            "stages": [
+                {
+                    "name": "get",
+                    "request": {
+                        "url": server_url + "/a",
+                        "method": "GET",
+                    },
+                    "response": {
+                        "status_code": 200,
+                        "save": {
+                            "saved_path": "{body.path}",
+                        },
+                    },
+                },
+                {
+                    "name": "post",
+                    "request": {
+                        "url": server_url,
+                        "method": "POST",
+                        "json": {"path": "{saved_path}"},
+                    },
+                    "response": {
+                        "status_code": 201,
+                        "validate": [
+                            {"eq": ["{body.path}", "/a"]},
+                        ],
+                    },
+                },
+            ],
+        }
+
+        global_cfg = {
+            "variables": {},
+            "strict": [],
+            "backends": {"http": "aiohttp", "mqtt": "paho-mqtt"},
+        }
+
+        # Don't leave the aiohttp plugin loaded for other tests
+        with patch.object(load_plugins, "plugins", {}):
+            run_test("aiohttp.yaml", test_spec, global_cfg)
+
+    def test_run_streamed_test(self, server_url):
+        pytest.importorskip("ijson")
+
+        test_spec = {
+            "name": "aiohttp backend streaming",
+            "stages": [
+                {
+                    "name": "get",
+                    "request": {
+                        "url": server_url + "/a",
+                        "method": "GET",
+                        "stream": True,
+                    },
+                    "response": {
+                        "status_code": 200,
+                        "validate": [
+                            {"eq": ["{body.path}", "/a"]},
+                        ],
+                    },
+                },
+            ],
+        }
+
+        global_cfg = {
+            "variables": {},
+            "strict": [],
+            "backends": {"http": "aiohttp", "mqtt": "paho-mqtt"},
+        }
+
+        with patch.object(load_plugins, "plugins", {}):
+            run_test("aiohttp.yaml", test_spec, global_cfg)
+
+    def test_session_type(self):
+        session = TavernAsyncHttpPlugin.session_type()
+        try:
+            assert isinstance(session, AsyncHttpSession)
+        finally:
+            session.close()
+
+
+class TestConcurrentRunner:
+
+    def test_blocks_run_at_same_time(self, server_url, tmpdir):
+        """The requests in all three tests are only answered once they have
+        all been sent"""
+        _Handler.barrier = threading.Barrier(3, timeout=10)
+
+        for name in ("a", "b", "c"):
+            tmpdir.join("stage_{}.yaml".format(name)).write(textwrap.dedent("""
+                ---
+                name: {name}
+                stages:
+                  - name: wait for the others
+                    request:
+                      url: {url}/barrier
+                      method: GET
+                    response:
+                      status_code: 200
+                """).format(name=name, url=server_url))
+
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "pytest", "-p", "no:cacheprovider", "-v",
+             "--tavern-http-backend", "aiohttp", "--tavern-aiohttp-concurrency", "3"],
+            cwd=str(tmpdir),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        output = proc.communicate()[0].decode("utf8")
+
+        assert proc.returncode == 0, output
+        assert "3 passed" in output
@@ -0,0 +1,264 @@
+"""Check that the compiled schema validator accepts and rejects exactly the
+same tests as pykwalify"""
+
+import copy
+import glob
+import os
+
+import pytest
+import yaml
+
+from tavern.util.exceptions import BadSchemaError, UnsupportedSchemaError
+from tavern.util.loader import IncludeLoader
+from tavern.schemas.compiled import CompiledSchema
+from tavern.schemas.files import load_schema_file, verify_generic
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.join(here, "..", "..")
+schema_filename = os.path.join(repo_root, "tavern", "schemas", "tests.schema.yaml")
+
+
+def _outcome(validate, spec):
+    try:
+        validate(copy.deepcopy(spec))
+    except BadSchemaError:
+        return "reject"
+    except Exception as e:  # pylint: disable=broad-except
+        return type(e).__name__
+    else:
+        return "accept"
+
+
+def _base_spec():
+    return {
+        "name": "base test",
+        "description": "used to generate variations",
+        "marks": [
+            "slow",
+            {"usefixtures": ["a_fixture"]},
+            {"parametrize": {"key": "fruit", "vals": ["apple", "pear"]}},
+        ],
+        "strict": ["body"],
+        "setup": ["/login.yaml", {"path": "/other.yaml", "saved": True}],
+        "variables": {"a": 1},
+        "includes": [{
+            "name": "included",
+            "variables": {"b": 2},
+        }],
+        "stages": [
+            {
+                "id": "first",
+                "name": "first stage",
+                "max_retries": 1,
+                "times": 2,
+                "delay_before": 0.5,
+                "request": {
+                    "url": "http://localhost/",
+                    "method": "POST",
+                    "headers": {"content-type": "application/json"},
+                    "json": {"number": 5},
+                    "timeout": [1, 2.5],
+                    "meta": ["clear_session_cookies"],
+                },
+                "response": {
+                    "status_code": [200, 201],
+                    "cookies": ["session"],
+                    "validate": [
+                        {"eq": ["{body.double}", 10]},
+                    ],
+                    "save": {"body": {"double": "double"}},
+                },
+            },
+            {
+                "ref": "first",
+                "request": {"method": "GET"},
+                "skip": False,
+            },
+        ],
+    }
+
+
+_substitutes = [None, 1, -1, "x", True, 1.5, "1.5", [], {}, ["x"], [1, 1], {"x": 1}]
+
+
+def _paths(value, path=()):
+    """All paths to values in a nested structure"""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield path + (k,)
+            for p in _paths(v, path + (k,)):
+                yield p
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            yield path + (i,)
+            for p in _paths(v, path + (i,)):
+                yield p
+
+
+def _variations():
+    """Variations of a valid test, changing one value at a time"""
+    base = _base_spec()
+
+    yield "base", base
+
+    for path in _paths(base):
+        name = "/".join(str(p) for p in path)
+
+        for i, sub in enumerate(_substitutes):
+            spec = copy.deepcopy(base)
+            parent = spec
+            for p in path[:-1]:
+                parent = parent[p]
+            parent[path[-1]] = sub
+            yield "{}={}".format(name, i), spec
+
+        spec = copy.deepcopy(base)
+        parent = spec
+        for p in path[:-1]:
+            parent = parent[p]
+        if isinstance(parent, dict):
+            parent.pop(path[-1])
+            yield "{}-deleted".format(name), spec
+            parent["unexpected_" + str(path[-1])] = 1
+            yield "{}-renamed".format(name), spec
+
+
+def _handwritten():
+    """Specs that hit particular parts of the schema"""
+    base = _base_spec()
+
+    def with_request(**kwargs):
+        spec = copy.deepcopy(base)
+        spec["stages"][0]["request"].update(kwargs)
+        return spec
+
+    def with_stage(**kwargs):
+        spec = copy.deepcopy(base)
+        spec["stages"][0].update(kwargs)
+        return spec
+
+    yield "params-regex-key", with_request(query_params={"a": "b"})
+    yield "request-ext", with_request(json={"$ext": {"function": "tavern.testutils.helpers:validate_jwt"}})
+    yield "request-bad-ext", with_request(json={"$ext": {"function": "not.a.module:func"}})
+    yield "request-ext-extra-keys", with_request(json={"$ext": {"function": "tavern.testutils.helpers:validate_jwt", "extra": 1}})
+    yield "data-list", with_request(data=[1, 2])
+    yield "data-string", with_request(data="abc")
+    yield "auth", with_request(auth=["user", "pass"])
+    yield "auth-short", with_request(auth=["user"])
+    yield "files", with_request(files={"a": "file.txt"})
+    yield "files-bad", with_request(files={"a": 1})
+    yield "method-bad", with_request(method="FETCH")
+    yield "timeout-bad", with_request(timeout=[1, 2, 3])
+    yield "meta-duplicate", with_request(meta=["a", "a"])
+    yield "cookies-duplicate", with_stage(response={"cookies": ["a", "a"]})
+    yield "times-zero", with_stage(times=0)
+    yield "times-string", with_stage(times="2")
+    yield "retries-negative", with_stage(max_retries=-1)
+    yield "delay-string", with_stage(delay_after="1.5")
+    yield "delay-bool", with_stage(delay_after=True)
+    yield "mqtt-publish", with_stage(mqtt_publish={"topic": "/a", "json": {"a": 1}, "qos": 1})
+    yield "mqtt-response", with_stage(mqtt_response={"topic": "/a", "payload": None, "timeout": 1, "qos": 3})
+    yield "strict-bad", dict(base, strict=["body", "nothing"])
+    yield "xfail", dict(base, _xfail="run")
+    yield "xfail-bad", dict(base, _xfail="sometimes")
+    yield "usefixtures-str", dict(base, marks=[{"usefixtures": "a_fixture"}])
+    yield "usefixtures-empty", dict(base, marks=[{"usefixtures": []}])
+    yield "parametrize-list", dict(base, marks=[{"parametrize": {"key": ["a", "b"], "vals": [[1, 2], [3, 4]]}}])
+    yield "parametrize-mismatch", dict(base, marks=[{"parametrize": {"key": ["a", "b"], "vals": [[1, 2], [3]]}}])
+    yield "skipif", dict(base, marks=[{"skipif": "{a} > 1"}])
+    yield "nested-includes", dict(base, includes=[{"name": "a", "includes": [{"name": "b", "stages": []}]}])
+    yield "mqtt-plugin", dict(base, **{"paho-mqtt": {"connect": {"host": "localhost", "port": 1883}}})
+    yield "mqtt-plugin-no-connect", dict(base, **{"paho-mqtt": {"client": {"transport": "tcp"}}})
+    yield "stage-ref-extra", dict(base, stages=[{"ref": "first", "name": "not allowed"}])
+    yield "parallel", dict(base, stages=[{"name": "group", "max_workers": 2, "parallel": base["stages"] + [{"ref": "first"}]}])
+    yield "parallel-nested", dict(base, stages=[{"name": "group", "parallel": [{"name": "inner", "parallel": base["stages"]}]}])
+    yield "parallel-no-name", dict(base, stages=[{"parallel": base["stages"]}])
+    yield "parallel-workers-zero", dict(base, stages=[{"name": "group", "max_workers": 0, "parallel": base["stages"]}])
+    yield "load", with_stage(load={"concurrency": 4, "rate": 2.5, "duration": 10, "warmup": 1,
+                                   "slo": {"p95": 0.5, "mean": 0.2, "error_rate": 0.01}})
+    yield "load-rate-zero", with_stage(load={"rate": 0})
+    yield "load-error-rate-bad", with_stage(load={"slo": {"error_rate": 2}})
+    yield "load-bad-slo-key", with_stage(load={"slo": {"p42": 1}})
+    yield "empty", {}
+
+
+@pytest.fixture(name="schema", scope="module")
+def fix_schema():
+    """Test schema with the mqtt plugin schema added, like what
+    load_schema_file returns once plugins are loaded"""
+    schema = copy.deepcopy(load_schema_file(schema_filename, False))
+
+    mqtt_schema_filename = os.path.join(repo_root, "tavern", "_plugins", "mqtt", "schema.yaml")
+    with open(mqtt_schema_filename, "r") as mfile:
+        schema["mapping"].update(yaml.safe_load(mfile)["initialisation"])
+
+    return schema
+
+
+@pytest.fixture(name="compiled", scope="module")
+def fix_compiled(schema):
+    return CompiledSchema(schema)
+
+
+def _test_files():
+    patterns = [
+        os.path.join(repo_root, "example", "*", "*.tavern.yaml"),
+        os.path.join(repo_root, "tests", "integration", "*.tavern.yaml"),
+    ]
+
+    for pattern in patterns:
+        for filename in sorted(glob.glob(pattern)):
+            yield filename
+
+
+class TestDifferential:
+
+    def _check_same(self, compiled, schema, spec):
+        expected = _outcome(lambda s: verify_generic(s, schema), spec)
+        actual = _outcome(compiled.validate, spec)
+
+        assert actual == expected
+
+    @pytest.mark.parametrize("spec", [s for _, s in _variations()], ids=[n for n, _ in _variations()])
+    def test_variations(self, compiled, schema, spec):
+        self._check_same(compiled, schema, spec)
+
+    @pytest.mark.parametrize("spec", [s for _, s in _handwritten()], ids=[n for n, _ in _handwritten()])
+    def test_handwritten(self, compiled, schema, spec):
+        self._check_same(compiled, schema, spec)
+
+    @pytest.mark.parametrize("filename", list(_test_files()), ids=os.path.basename)
+    def test_test_files(self, compiled, schema, filename):
+        with open(filename, "r") as infile:
+            try:
+                specs = list(yaml.load_all(infile, Loader=IncludeLoader))
+            except Exception:  # pylint: disable=broad-except
+                pytest.skip("Can't load {}".format(filename))
+
+        for spec in specs:
+            self._check_same(compiled, schema, spec)
+
+
+class TestCompiledSchema:
+
+    def test_base_is_valid(self, compiled):
+        compiled.validate(_base_spec())
+
+    def test_error_message(self, compiled):
+        spec = _base_spec()
+        spec["stages"][0]["times"] = 0
+
+        with pytest.raises(BadSchemaError) as excinfo:
+            compiled.validate(spec)
+
+        assert "/stages/0/times" in str(excinfo.value)
+
+    def test_unsupported(self):
+        with pytest.raises(UnsupportedSchemaError):
+            CompiledSchema({
+                "type": "map",
+                "mapping": {
+                    "a": {"type": "str", "pattern": "abc"},
+                },
+            })
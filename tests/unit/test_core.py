@@ -1,4 +1,6 @@
 import json
+import threading
+import time
 import uuid
 import os
 from mock import patch, Mock, MagicMock
@@ -10,8 +12,11 @@ import requests
 import paho.mqtt.client as paho
 
 from tavern._plugins.mqtt.client import MQTTClient
+from tavern._plugins.rest.session import PooledSession
 from tavern.core import run_test, resolve_spec
+from tavern.plugins import SessionPool
 from tavern.util import exceptions
+from tavern.util.timing import stage_timings
 
 
 @pytest.fixture(name="fulltest")
@@ -169,6 +174,195 @@ class TestRunStages:
         assert kwargs["url"] == "http://www.google.com"
 
 
+class TestParallelGroup:
+
+    @pytest.fixture(name="grouptest")
+    def fix_grouptest(self):
+        def stage(n, expected=200):
+            return {
+                "name": "stage {}".format(n),
+                "request": {
+                    "url": "http://www.google.com/{}".format(n),
+                    "method": "GET",
+                },
+                "response": {
+                    "status_code": expected,
+                    "save": {
+                        "which": "{body.n}",
+                        "from_{}".format(n): "{body.n}",
+                    },
+                },
+            }
+
+        return {
+            "name": "A test with a parallel group",
+            "stages": [
+                {
+                    "name": "group",
+                    "parallel": [stage(1), stage(2), stage(3)],
+                },
+                {
+                    "name": "after",
+                    "request": {
+                        "url": "http://www.google.com/{which}/{from_1}",
+                        "method": "GET",
+                    },
+                    "response": {
+                        "status_code": 200,
+                    },
+                },
+            ],
+        }
+
+    def run(self, grouptest, includes):
+        third_started = threading.Event()
+        waited = []
+        urls = []
+
+        def request(**kwargs):
+            n = kwargs["url"].split("/")[3]
+            urls.append(kwargs["url"])
+
+            if n == "1":
+                # Stage 1 finishes after stage 3
+                waited.append(third_started.wait(5))
+            elif n == "3":
+                third_started.set()
+
+            content = {"n": n}
+            return Mock(
+                spec=requests.Response,
+                content=json.dumps(content).encode("utf8"),
+                status_code=200,
+                json=lambda: content,
+                headers={"content-type": "application/json"},
+            )
+
+        with patch("tavern._plugins.rest.request.requests.Session.request", side_effect=request):
+            run_test("heif", grouptest, includes)
+
+        return waited, urls
+
+    def test_run_concurrently(self, grouptest, includes):
+        waited, urls = self.run(grouptest, includes)
+
+        assert waited == [True]
+        # Saved variables are merged in the order the stages are listed, not
+        # the order they finished in
+        assert urls[-1] == "http://www.google.com/3/1"
+
+    def test_one_fails(self, grouptest, includes):
+        grouptest["stages"][0]["parallel"][1]["response"]["status_code"] = 400
+
+        with pytest.raises(exceptions.TestFailError) as excinfo:
+            self.run(grouptest, includes)
+
+        assert excinfo.value.stage["name"] == "stage 2"
+
+    def test_several_fail(self, grouptest, includes):
+        for stage in grouptest["stages"][0]["parallel"][1:]:
+            stage["response"]["status_code"] = 400
+
+        with pytest.raises(exceptions.TestFailError) as excinfo:
+            self.run(grouptest, includes)
+
+        assert "2 stages in 'group' failed" in str(excinfo.value)
+        assert "'stage 2'" in str(excinfo.value)
+        assert "'stage 3'" in str(excinfo.value)
+        assert excinfo.value.stage["name"] == "stage 2"
+
+    def test_skip(self, grouptest, includes):
+        grouptest["stages"][0]["parallel"][0]["skip"] = True
+        grouptest["stages"][1]["request"]["url"] = "http://www.google.com/{which}"
+
+        _, urls = self.run(grouptest, includes)
+
+        assert len(urls) == 3
+        assert urls[-1] == "http://www.google.com/3"
+
+    def test_no_mqtt(self, grouptest, includes):
+        grouptest["stages"][0]["parallel"][0]["mqtt_publish"] = {"topic": "/a"}
+
+        with pytest.raises(exceptions.BadSchemaError):
+            with patch("tavern.core.get_extra_sessions", return_value={}):
+                run_test("heif", grouptest, includes)
+
+
+class TestSessionPool:
+
+    @pytest.fixture(name="pool")
+    def fix_pool(self):
+        pool = SessionPool()
+        pool.enabled = True
+        pool.session_options = {"pool_maxsize": 3}
+
+        with patch("tavern.plugins.session_pool", pool):
+            yield pool
+
+        pool.close()
+
+    def run_blocks(self, fulltest, mockargs, includes, n_blocks):
+        cookies = []
+
+        def request(session, **kwargs):
+            # pylint: disable=unused-argument
+            cookies.append(dict(session.cookies))
+            session.cookies.set("block", str(len(cookies)))
+            return Mock(**mockargs)
+
+        with patch("tavern._plugins.rest.request.requests.Session.request", autospec=True,
+                   side_effect=request) as pmock:
+            for _ in range(n_blocks):
+                run_test("heif", deepcopy(fulltest), deepcopy(includes))
+
+        return [c[0][0] for c in pmock.call_args_list], cookies
+
+    def test_session_reused(self, pool, fulltest, mockargs, includes):
+        sessions, cookies = self.run_blocks(fulltest, mockargs, includes, 3)
+
+        assert isinstance(sessions[0], PooledSession)
+        assert all(session is sessions[0] for session in sessions)
+        assert sessions[0].get_adapter("http://a")._pool_maxsize == 3
+        assert (pool.created, pool.reused) == (1, 2)
+
+        # Cookies from one block aren't sent by the next
+        assert cookies == [{}, {}, {}]
+
+    def test_disabled(self, pool, fulltest, mockargs, includes):
+        pool.enabled = False
+
+        sessions, _ = self.run_blocks(fulltest, mockargs, includes, 2)
+
+        assert not isinstance(sessions[0], PooledSession)
+        assert sessions[0] is not sessions[1]
+        assert pool.created == 0
+
+    def test_only_one_user_at_a_time(self, pool):
+        ext = Mock()
+        ext.name = "requests"
+        ext.plugin.pooled_session_type = PooledSession
+
+        first = pool.acquire(ext, {})
+        second = pool.acquire(ext, {})
+        assert first is not second
+
+        with first:
+            pass
+        assert pool.acquire(ext, {}) is first
+
+    def test_close(self, pool):
+        ext = Mock()
+        ext.name = "requests"
+        ext.plugin.pooled_session_type = Mock
+
+        session = pool.acquire(ext, {})
+        pool.release(session)
+        pool.close()
+
+        assert session.close.called
+        assert pool.acquire(ext, {}) is not session
+
+
 class TestRetry:
 
     def test_repeats_twice_and_succeeds(self, fulltest, mockargs, includes):
@@ -206,6 +400,143 @@ class TestRetry:
         assert pmock.call_count == 1
 
 
+class TestLoad:
+
+    def run(self, fulltest, mockargs, includes, fail_every=0, sleep=0):
+        lock = threading.Lock()
+        in_flight = [0]
+        most_in_flight = [0]
+        calls = []
+        failed_mockargs = dict(mockargs, status_code=400)
+
+        def request(**kwargs):
+            # pylint: disable=unused-argument
+            with lock:
+                calls.append(1)
+                n = len(calls)
+                in_flight[0] += 1
+                most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+
+            time.sleep(sleep)
+
+            with lock:
+                in_flight[0] -= 1
+
+            if fail_every and n % fail_every == 0:
+                return Mock(**failed_mockargs)
+            return Mock(**mockargs)
+
+        with patch("tavern._plugins.rest.request.requests.Session.request", side_effect=request):
+            run_test("heif", fulltest, includes)
+
+        return len(calls), most_in_flight[0]
+
+    def test_times(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["times"] = 20
+        fulltest["stages"][0]["load"] = {"concurrency": 4}
+
+        n_calls, most_in_flight = self.run(fulltest, mockargs, includes, sleep=0.01)
+
+        assert n_calls == 20
+        assert most_in_flight > 1
+
+    def test_warmup_not_counted(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["times"] = 5
+        fulltest["stages"][0]["load"] = {"rate": 50, "warmup": 0.1}
+
+        n_calls, _ = self.run(fulltest, mockargs, includes)
+
+        # 5 during the warmup, then 5 measured
+        assert n_calls == 10
+
+    def test_duration_and_rate(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["load"] = {"rate": 20, "duration": 0.5, "concurrency": 2}
+
+        n_calls, _ = self.run(fulltest, mockargs, includes)
+
+        assert n_calls == 10
+
+    def test_fails_on_error(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["times"] = 10
+        fulltest["stages"][0]["load"] = {"concurrency": 2}
+
+        with pytest.raises(exceptions.TestFailError) as excinfo:
+            self.run(fulltest, mockargs, includes, fail_every=5)
+
+        assert "2 of 10 iterations failed" in str(excinfo.value)
+
+    def test_error_rate_within_slo(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["times"] = 10
+        fulltest["stages"][0]["load"] = {"concurrency": 2, "slo": {"error_rate": 0.2}}
+
+        n_calls, _ = self.run(fulltest, mockargs, includes, fail_every=5)
+
+        assert n_calls == 10
+
+    def test_latency_slo(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["times"] = 4
+        fulltest["stages"][0]["load"] = {"slo": {"p95": 0.001}}
+
+        with pytest.raises(exceptions.TestFailError) as excinfo:
+            self.run(fulltest, mockargs, includes, sleep=0.01)
+
+        assert "p95 latency" in str(excinfo.value)
+
+    def test_needs_end(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["load"] = {"concurrency": 2}
+
+        with pytest.raises(exceptions.BadSchemaError):
+            self.run(fulltest, mockargs, includes)
+
+
+class TestTimings:
+
+    @pytest.fixture(autouse=True)
+    def enable_timings(self):
+        with patch.object(stage_timings, "enabled", True):
+            yield
+        stage_timings.pop_records()
+
+    def test_stage_recorded(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["delay_after"] = 0.01
+        fulltest["stages"][0]["response"]["save"] = {"saved": "{body.key}"}
+
+        with patch("tavern._plugins.rest.request.requests.Session.request", return_value=Mock(**mockargs)):
+            run_test("heif", fulltest, includes)
+
+        records = stage_timings.pop_records()
+
+        assert len(records) == 1
+        record = records[0]
+        assert record["test"] == "A test with a single stage"
+        assert record["stage"] == "test"
+        assert record["endpoint"] == "GET http://www.google.com"
+        assert record["status"] == "passed"
+        assert set(record["phases"]) == {"format", "request", "decode", "verify", "save", "delay"}
+        assert record["phases"]["delay"] >= 0.01
+        assert sum(record["phases"].values()) <= record["total"]
+
+    def test_each_retry_recorded(self, fulltest, mockargs, includes):
+        fulltest["stages"][0]["max_retries"] = 1
+        failed_mockargs = dict(mockargs, status_code=400)
+
+        with patch("tavern._plugins.rest.request.requests.Session.request",
+                   side_effect=[Mock(**failed_mockargs), Mock(**mockargs)]):
+            run_test("heif", fulltest, includes)
+
+        records = stage_timings.pop_records()
+
+        assert [r["status"] for r in records] == ["failed", "passed"]
+
+    def test_disabled(self, fulltest, mockargs, includes):
+        stage_timings.enabled = False
+
+        with patch("tavern._plugins.rest.request.requests.Session.request", return_value=Mock(**mockargs)):
+            run_test("heif", fulltest, includes)
+
+        assert stage_timings.pop_records() == []
+
+
 class TestDelay:
 
     def test_sleep_before(self, fulltest, mockargs, includes):
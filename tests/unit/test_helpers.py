@@ -5,7 +5,7 @@ import pytest
 import _pytest
 from textwrap import dedent
 
-from tavern.util import exceptions
+from tavern.util import exceptions, jmes_util
 from tavern.testutils.helpers import validate_pykwalify
 from tavern.core import run
 from tavern.testutils.helpers import validate_regex, validate_content
@@ -198,6 +198,25 @@ class TestContent:
         with pytest.raises(exceptions.JMESError):
             validate_content(nested_response, comparisons)
 
+    def test_invalid_jmes_path(self, nested_response):
+        comparisons = [
+            {'jmespath': "top.[", 'operator': "eq", 'expected': 1}
+        ]
+        with pytest.raises(exceptions.JMESError):
+            validate_content(nested_response, comparisons)
+
+    def test_expressions_parsed_once(self, nested_response):
+        comparisons = [
+            {'jmespath': "top.nested.doubly.inner_value", 'operator': "eq", 'expected': "value"},
+        ]
+        jmes_util.expression_cache.clear()
+
+        for _ in range(3):
+            validate_content(nested_response, comparisons)
+
+        assert jmes_util.expression_cache.stats()["misses"] == 1
+        assert jmes_util.expression_cache.stats()["hits"] == 2
+
 
 class TestPykwalifyExtension:
     def test_validate_schema_correct(self, nested_response):
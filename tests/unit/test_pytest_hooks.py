@@ -1,11 +1,24 @@
 import base64
 import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
 
 import pytest
+import yaml
 from mock import Mock, patch
 
-from tavern.testutils.pytesthook import YamlFile
+from tavern.testutils.parallel import get_n_workers
+from tavern.testutils.concurrency import can_run_ahead, get_aiohttp_concurrency
+from tavern.testutils.global_config import GlobalConfigCache
+from tavern.testutils.pytesthook import YamlFile, YamlItem, pytest_terminal_summary
+from tavern.testutils.timing_report import summarise
+from tavern.testutils.setup_graph import SetupGraph, YamlItemContext, get_setup_refs, run_saved_setups
 from tavern.util import exceptions
+from tavern.schemas.files import validated_specs
+from tavern.util.loader import spec_cache
 
 
 def mock_args():
@@ -222,3 +235,458 @@ class TestSetup(object):
                         item.runtest()
 
         assert pmock.called == False
+
+
+class TestSetupTime(object):
+
+    def run_item(self, run_saved_setups):
+        item = get_yaml_item_test()
+        item.global_cfg = {}
+
+        # start, start of setup, end of setup, end of test
+        timer = Mock(side_effect=[0.0, 10.0, 15.0, 20.0])
+        timings = Mock(enabled=True)
+
+        with patch.multiple("tavern.testutils.pytesthook",
+                            default_timer=timer,
+                            stage_timings=timings,
+                            load_plugins=Mock(),
+                            verify_tests=Mock(),
+                            run_saved_setups=run_saved_setups,
+                            run_test=Mock()):
+            with patch.object(item, "_load_setup_varialbes", return_value={}):
+                with patch.object(item, "_load_fixture_values", return_value={}):
+                    try:
+                        item.runtest()
+                    finally:
+                        timings.add_test.assert_called_once_with(item.name, "abc", 20.0, 5.0)
+
+    def test_only_setup_timed(self):
+        self.run_item(Mock())
+
+    def test_timed_when_setup_fails(self):
+        with pytest.raises(exceptions.TestFailError):
+            self.run_item(Mock(side_effect=exceptions.TestFailError("setup failed")))
+
+
+class TestCacheSummary(object):
+
+    @pytest.fixture(name="terminalreporter")
+    def fix_terminalreporter(self):
+        return Mock(verbosity=0)
+
+    @pytest.fixture(autouse=True)
+    def counts(self):
+        with patch.multiple(spec_cache, hits=3, misses=2, invalidations=1):
+            with patch.multiple(validated_specs, hits=10, misses=1):
+                yield
+
+    def test_spec_cache(self, terminalreporter):
+        with patch.object(spec_cache, "cache_dir", ".tavern_cache"):
+            pytest_terminal_summary(terminalreporter)
+
+        terminalreporter.write_line.assert_called_once_with(
+            "spec cache: 3 files loaded from the cache, 2 loaded from disk (1 because a file had changed)")
+
+    def test_nothing_shown(self, terminalreporter):
+        with patch.object(spec_cache, "cache_dir", None):
+            pytest_terminal_summary(terminalreporter)
+
+        assert not terminalreporter.write_sep.called
+
+    def test_validation_when_verbose(self, terminalreporter):
+        terminalreporter.verbosity = 1
+
+        with patch.object(spec_cache, "cache_dir", None):
+            pytest_terminal_summary(terminalreporter)
+
+        terminalreporter.write_line.assert_called_once_with(
+            "validation: 1 tests validated, 10 skipped because a test with the same structure "
+            "was already validated")
+
+
+class TestGlobalConfigCache(object):
+
+    @pytest.fixture(name="cfg_item")
+    def fix_cfg_item(self, tmpdir):
+        global_cfg_file = tmpdir.join("global.yaml")
+        global_cfg_file.write("variables: {}")
+
+        options = {"tavern_global_cfg": [str(global_cfg_file)]}
+
+        config = Mock()
+        config.getini.return_value = []
+        config.getoption.side_effect = lambda name: options.get(name)
+
+        item = Mock(config=config)
+        item._load_global_cfg.side_effect = lambda: {
+            "variables": {"a": {"b": "c"}},
+            "strict": [],
+        }
+
+        return item
+
+    def test_loaded_once(self, cfg_item):
+        cache = GlobalConfigCache()
+
+        first = cache(cfg_item)
+        second = cache(cfg_item)
+
+        assert cfg_item._load_global_cfg.call_count == 1
+        assert first == second
+
+        # Items can replace values without affecting each other
+        assert first is not second
+        assert first["variables"] is not second["variables"]
+        first["variables"]["x"] = "y"
+        assert "x" not in second["variables"]
+
+    def test_reloaded_when_file_changes(self, cfg_item):
+        cache = GlobalConfigCache()
+
+        cache(cfg_item)
+
+        global_cfg_file = cfg_item.config.getoption("tavern_global_cfg")[0]
+        mtime = os.path.getmtime(global_cfg_file)
+        os.utime(global_cfg_file, (mtime + 10, mtime + 10))
+
+        cache(cfg_item)
+
+        assert cfg_item._load_global_cfg.call_count == 2
+
+    def test_reloaded_when_environment_changes(self, cfg_item):
+        cache = GlobalConfigCache()
+
+        cache(cfg_item)
+        with patch.dict(os.environ, {"TAVERN_TEST_ENV_CHANGED": "1"}):
+            cache(cfg_item)
+
+        assert cfg_item._load_global_cfg.call_count == 2
+
+
+class TestSharedSetup(object):
+
+    def run_in_workers(self, context, n_workers, run_setup):
+        """Call context.get_or_run in forked processes, like workers do"""
+        pids = []
+        for _ in range(n_workers):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    if context.get_or_run("path_to_setup", run_setup) != {"token": "abc"}:
+                        code = 1
+                except Exception:  # pylint: disable=broad-except
+                    code = 2
+                finally:
+                    os._exit(code)  # pylint: disable=protected-access
+            pids.append(pid)
+
+        return [os.waitpid(pid, 0)[1] for pid in pids]
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+    def test_setup_run_once(self, tmpdir):
+        context = YamlItemContext()
+        context.store_dir = str(tmpdir)
+
+        calls = tmpdir.join("calls")
+
+        def run_setup():
+            calls.write("x", mode="a")
+            return {"token": "abc"}
+
+        assert self.run_in_workers(context, 4, run_setup) == [0] * 4
+        assert calls.read() == "x"
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+    def test_unpicklable_run_in_each_worker(self, tmpdir):
+        context = YamlItemContext()
+        context.store_dir = str(tmpdir)
+
+        calls = tmpdir.join("calls")
+
+        class Unpicklable(dict):
+            def __reduce__(self):
+                raise TypeError("can't pickle")
+
+        def run_setup():
+            calls.write("x", mode="a")
+            return Unpicklable(token="abc")
+
+        assert self.run_in_workers(context, 3, run_setup) == [0] * 3
+        assert calls.read() == "xxx"
+
+    def test_not_shared(self):
+        context = YamlItemContext()
+        run_setup = Mock(return_value={"token": "abc"})
+
+        assert context.get_or_run("path_to_setup", run_setup) == {"token": "abc"}
+        assert context.get_or_run("path_to_setup", run_setup) == {"token": "abc"}
+
+        assert run_setup.call_count == 1
+
+
+class TestGetNWorkers(object):
+
+    def get_config(self, option=None, ini=None):
+        config = Mock()
+        config.getoption.return_value = option
+        config.getini.return_value = ini
+        return config
+
+    @pytest.mark.parametrize("option, ini, expected", (
+        (None, None, 0),
+        (None, "", 0),
+        ("3", None, 3),
+        (None, "2", 2),
+        ("4", "2", 4),
+        ("0", "2", 0),
+    ))
+    def test_workers(self, option, ini, expected):
+        assert get_n_workers(self.get_config(option, ini)) == expected
+
+    def test_auto(self):
+        with patch("tavern.testutils.parallel.multiprocessing.cpu_count", return_value=7):
+            assert get_n_workers(self.get_config("auto")) == 7
+
+    @pytest.mark.parametrize("value", ("two", "-1", "1.5"))
+    def test_invalid(self, value):
+        with pytest.raises(pytest.UsageError):
+            get_n_workers(self.get_config(value))
+
+
+class TestGetAiohttpConcurrency(object):
+
+    def get_config(self, option=None, ini=None):
+        config = Mock()
+        config.getoption.return_value = option
+        config.getini.return_value = ini
+        return config
+
+    @pytest.mark.parametrize("option, ini, expected", (
+        (None, None, 1),
+        (None, "", 1),
+        ("3", None, 3),
+        (None, "2", 2),
+        ("4", "2", 4),
+    ))
+    def test_concurrency(self, option, ini, expected):
+        assert get_aiohttp_concurrency(self.get_config(option, ini)) == expected
+
+    @pytest.mark.parametrize("value", ("two", "0", "1.5"))
+    def test_invalid(self, value):
+        with pytest.raises(pytest.UsageError):
+            get_aiohttp_concurrency(self.get_config(value))
+
+
+class TestCanRunAhead(object):
+
+    @pytest.fixture(name="item")
+    def fix_item(self):
+        item = Mock(global_cfg={"backends": {"http": "aiohttp"}}, fixturenames=[])
+        item.get_closest_marker.return_value = None
+        return item
+
+    def test_can_run_ahead(self, item):
+        assert can_run_ahead(item)
+
+    def test_requests_backend(self, item):
+        item.global_cfg["backends"]["http"] = "requests"
+        assert not can_run_ahead(item)
+
+    def test_fixtures(self, item):
+        item.fixturenames = ["a"]
+        assert not can_run_ahead(item)
+
+    def test_marked(self, item):
+        item.get_closest_marker.side_effect = lambda name: Mock() if name == "skipif" else None
+        assert not can_run_ahead(item)
+
+    def test_not_tavern_test(self, item):
+        del item.run_in
+        assert not can_run_ahead(item)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+class TestParallelRunner(object):
+
+    def test_results_reported(self, tmpdir):
+        tmpdir.join("test_parallel.py").write(textwrap.dedent("""
+            import os
+            import pytest
+
+            @pytest.mark.parametrize("n", range(6))
+            def test_pass(n):
+                pass
+
+            def test_fail():
+                assert False
+
+            def test_crash():
+                os._exit(3)
+            """))
+
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "pytest", "-p", "no:cacheprovider", "-v", "--tavern-workers", "3", "test_parallel.py"],
+            cwd=str(tmpdir),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        output = proc.communicate()[0].decode("utf8")
+
+        assert proc.returncode == 1, output
+        assert "test_pass[5] PASSED" in output
+        assert "exited with code 3 while running test" in output
+        assert "2 failed, 6 passed" in output
+
+
+class TestTimingSummary(object):
+
+    def test_summarise(self):
+        def stage(total, endpoint="GET http://a/b", status="passed"):
+            return {
+                "kind": "stage",
+                "test": "test",
+                "stage": "stage",
+                "endpoint": endpoint,
+                "status": status,
+                "total": total,
+                "phases": {"request": total / 2},
+            }
+
+        records = [
+            stage(1.0),
+            stage(3.0, status="failed"),
+            stage(2.0, endpoint=None),
+            {"kind": "test", "test": "test", "path": "stage_a.yaml", "total": 7.0, "setup": 1.0},
+        ]
+
+        rows = {(r["kind"], r["name"]): r for r in summarise(records)}
+
+        assert set(rows) == {
+            ("stage", "test::stage"),
+            ("endpoint", "GET http://a/b"),
+            ("test", "stage_a.yaml::test"),
+        }
+
+        stage_row = rows[("stage", "test::stage")]
+        assert stage_row["count"] == 3
+        assert stage_row["failed"] == 1
+        assert stage_row["p50"] == 2.0
+        assert stage_row["max"] == 3.0
+        assert stage_row["mean_request"] == 1.0
+
+        assert rows[("endpoint", "GET http://a/b")]["count"] == 2
+        assert rows[("test", "stage_a.yaml::test")]["mean_setup"] == 1.0
+
+
+class TestSetupGraph(object):
+
+    @pytest.fixture(name="config")
+    def fix_config(self, tmpdir):
+        config = Mock(rootdir=str(tmpdir))
+        config.getoption.return_value = None
+        config.getini.return_value = None
+        return config
+
+    @pytest.fixture(name="setup_files")
+    def fix_setup_files(self, tmpdir):
+        def write(name, setup):
+            tmpdir.join(name).write(yaml.dump({
+                "name": name,
+                "setup": setup,
+                "stages": [],
+            }))
+
+        write("a.yaml", [])
+        write("b.yaml", [])
+        write("c.yaml", ["/a.yaml", {"path": "/b.yaml"}])
+        write("d.yaml", [{"path": "/a.yaml", "saved": False}])
+        write("loop_1.yaml", ["/loop_2.yaml"])
+        write("loop_2.yaml", ["/loop_1.yaml"])
+
+    @pytest.mark.usefixtures("setup_files")
+    def test_layers(self, config):
+        graph = SetupGraph()
+        spec = {"setup": ["/c.yaml", "/a.yaml"]}
+
+        graph.add_test(config, spec)
+
+        assert graph.saved_layers(get_setup_refs(spec)) == [["/a.yaml", "/b.yaml"], ["/c.yaml"]]
+
+    @pytest.mark.usefixtures("setup_files")
+    def test_layers_not_saved(self, config):
+        graph = SetupGraph()
+        spec = {"setup": [{"path": "/c.yaml", "saved": False}, "/d.yaml"]}
+
+        graph.add_test(config, spec)
+
+        # c has to be run every time so its setups aren't run in advance
+        # either, and d doesn't save a
+        assert graph.saved_layers(get_setup_refs(spec)) == [["/d.yaml"]]
+
+    @pytest.mark.usefixtures("setup_files")
+    def test_loop(self, config):
+        graph = SetupGraph()
+
+        with pytest.raises(exceptions.SetupCycleError) as excinfo:
+            graph.add_test(config, {"setup": ["/a.yaml", "/loop_1.yaml"]})
+
+        assert "/loop_1.yaml -> /loop_2.yaml -> /loop_1.yaml" in str(excinfo.value)
+
+    def test_missing_file(self, config):
+        graph = SetupGraph()
+
+        graph.add_test(config, {"setup": ["/missing.yaml"]})
+
+        assert "/missing.yaml" in graph
+
+    @pytest.mark.usefixtures("setup_files")
+    def test_run_concurrently(self, config):
+        context = YamlItemContext()
+        spec = {"setup": ["/c.yaml"]}
+        b_started = threading.Event()
+        waited = []
+
+        def run_setup(path):
+            if path == "/a.yaml":
+                # Only finishes straight away if b is run at the same time
+                waited.append(b_started.wait(5))
+            elif path == "/b.yaml":
+                b_started.set()
+            return {path: "ran"}
+
+        with patch("tavern.testutils.setup_graph.setup_graph", SetupGraph()) as graph:
+            graph.add_test(config, spec)
+            run_saved_setups(get_setup_refs(spec), context, run_setup, 2)
+
+        assert waited == [True]
+        assert context.context == {
+            "/a.yaml": {"/a.yaml": "ran"},
+            "/b.yaml": {"/b.yaml": "ran"},
+            "/c.yaml": {"/c.yaml": "ran"},
+        }
+
+
+class TestContextThreads(object):
+
+    def test_run_once(self):
+        context = YamlItemContext()
+        calls = []
+
+        def run_setup():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"token": "abc"}
+
+        threads = [
+            threading.Thread(target=context.get_or_run, args=("path_to_setup", run_setup))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert context.get_context("path_to_setup") == {"token": "abc"}
@@ -9,6 +9,7 @@ except ImportError:
 import pytest
 
 from tavern._plugins.rest.request import RestRequest, get_request_args
+from tavern._plugins.rest.streamed import StreamedResponse
 from tavern.util import exceptions
 
 
@@ -70,6 +71,19 @@ class TestRequests(object):
         assert rmock.request.called
         assert rmock.request.call_args[1]["allow_redirects"] == False
 
+    @pytest.mark.parametrize("stream", (True, False))
+    def test_streamed_response(self, req, includes, stream):
+        """Responses to requests with 'stream: true' can be streamed when
+        they are verified
+        """
+        req["stream"] = stream
+
+        rmock = Mock(spec=requests.Session)
+        response = RestRequest(rmock, req, includes).run()
+
+        assert rmock.request.call_args[1]["stream"] == stream
+        assert isinstance(response, StreamedResponse) == stream
+
 
 class TestRequestArgs(object):
 
@@ -135,6 +149,8 @@ class TestRequestArgs(object):
         args = get_request_args(req, includes)
 
         assert args["params"]["a"] == "%7B%22b%22%3A+%7B%22c%22%3A+%22d%22%7D%7D"
+        # Original spec should not be modified
+        assert req["params"]["a"] == {"b": {"c": "d"}}
 
     def test_array_substitution(self, req, includes):
         args = get_request_args(req, includes)
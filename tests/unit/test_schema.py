@@ -4,7 +4,7 @@ import pytest
 import yaml
 
 from tavern.util.exceptions import BadSchemaError
-from tavern.schemas.files import verify_tests
+from tavern.schemas.files import verify_tests, validated_specs
 
 
 @pytest.fixture(name="test_dict")
@@ -117,3 +117,67 @@ class TestTimeout:
 
         with pytest.raises(BadSchemaError):
             verify_tests(test_dict)
+
+
+class TestValidationCache:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        validated_specs.clear()
+        yield
+        validated_specs.clear()
+
+    def test_same_spec_not_revalidated(self, test_dict):
+        verify_tests(test_dict)
+        verify_tests(test_dict)
+
+        assert validated_specs.misses == 1
+        assert validated_specs.hits == 1
+
+    def test_parametrized_spec_not_revalidated(self, test_dict):
+        """Only the name and variable values differ"""
+        test_dict["includes"] = [{
+            "name": "parametrized",
+            "variables": {"number": 5},
+        }]
+        verify_tests(test_dict)
+
+        test_dict["name"] = "Another name"
+        test_dict["includes"][0]["variables"]["number"] = "something else"
+        verify_tests(test_dict)
+
+        assert validated_specs.hits == 1
+
+    def test_name_type_revalidated(self, test_dict):
+        """Names have to be strings, so one that isn't is still checked"""
+        test_dict["includes"] = [{"name": "included", "variables": {}}]
+        verify_tests(test_dict)
+
+        test_dict["name"] = 123
+        with pytest.raises(BadSchemaError):
+            verify_tests(test_dict)
+
+        test_dict["name"] = "Another name"
+        test_dict["includes"][0]["name"] = ["not", "a", "string"]
+        with pytest.raises(BadSchemaError):
+            verify_tests(test_dict)
+
+        assert validated_specs.hits == 0
+
+    def test_different_spec_revalidated(self, test_dict):
+        verify_tests(test_dict)
+
+        test_dict["stages"][0]["request"]["json"] = {"number": 6}
+        verify_tests(test_dict)
+
+        assert validated_specs.misses == 2
+        assert validated_specs.hits == 0
+
+    def test_invalid_spec_always_raises(self, test_dict):
+        test_dict["stages"][0]["request"]["json"] = "Hello"
+
+        for _ in range(2):
+            with pytest.raises(BadSchemaError):
+                verify_tests(test_dict)
+
+        assert validated_specs.hits == 0
@@ -2,15 +2,31 @@ import os
 from textwrap import dedent
 from collections import OrderedDict
 import copy
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 import jsonschema
-from mock import patch
+from mock import patch, Mock
 import pytest
 import yaml
 from tavern.schemas.extensions import validate_extensions, validate_block
 from tavern.util import exceptions
-from tavern.util.loader import IncludeLoader, schema_loader, yaml_loader, ANYTHING
-from tavern.util.dict_util import deep_dict_merge, check_keys_match_recursive, format_keys
+from tavern.util import loader
+from tavern.util.loader import IncludeLoader, schema_loader, yaml_loader, ANYTHING, SpecCache, \
+    IntToken, PureIncludeLoader
+from box import Box, BoxList
+from tavern.util.dict_util import deep_dict_merge, check_keys_match_recursive, format_keys, \
+    format_string, compile_template, copy_variables
 from tavern.util.built_in import unique_item_properties, jsonschema_validation
+from tavern.util import built_in
+from tavern.util import dict_util
+from tavern.util.comparator_util import ComparatorManager, _built_in_aliases
+from tavern.util.cache import LRUCache
+from tavern.util.load import percentile, LoadResult
+from tavern.util.log_utils import truncate, preview_bytes, Truncated
+from tavern.util.import_util import import_ext_function, ext_function_cache
+from tavern.util import jsonschema_util
+from tavern.schemas.extensions import get_wrapped_create_function, wrapped_function_cache
 
 
 class TestValidateFunctions:
@@ -281,6 +297,498 @@ class TestComparator:
         with pytest.raises(AssertionError):
             unique_item_properties(bad_value2, "a")
 
+    def test_unique_item_properties_reports_first_duplicate(self):
+        check_value = [
+            {"a": {"x": [1]}, "b": 1},
+            {"a": {"x": [2]}, "b": 2},
+            {"a": {"x": [1.0]}, "b": 3},
+            {"a": {"x": [1]}, "b": 4},
+        ]
+        unique_item_properties(check_value, "b")
+
+        with pytest.raises(AssertionError) as e:
+            unique_item_properties(check_value, ["b", "a"])
+
+        assert "index is 0 - 2" in str(e.value)
+
+    @pytest.mark.parametrize("check_list", (
+        [],
+        [1, 2, 3],
+        [1, "1", [1], (1,), {"1": 1}, None],
+        [{"a": [1, 2]}, {"a": [2, 1]}, {"a": (1, 2)}, {"b": [1, 2]}],
+        [[{"a": 1}], [{"a": 1}, {"a": 1}]],
+        [{1, 2}, {1, 3}],
+        [bytearray(b"a"), bytearray(b"b"), "a"],
+    ))
+    def test_unique_item_in_list(self, check_list):
+        assert built_in.unique_item_in_list(check_list)
+
+    @pytest.mark.parametrize("check_list, indexes", (
+        ([1, 2, 1], (0, 2)),
+        ([1, 2, True, 1], (0, 2)),
+        (["a", {"x": {"y": [1, {"z": None}]}}, "b", {"x": {"y": [1, {"z": None}]}}], (1, 3)),
+        ([[1, 2], (1, 2), [1, 2.0]], (0, 2)),
+        ([{1, 2}, {2, 1}], (0, 1)),
+        ([bytearray(b"a"), 1, bytearray(b"a")], (0, 2)),
+    ))
+    def test_unique_item_in_list_duplicate(self, check_list, indexes):
+        with pytest.raises(AssertionError) as e:
+            built_in.unique_item_in_list(check_list)
+
+        assert "index is {} - {}".format(*indexes) in str(e.value)
+
+    @pytest.mark.parametrize("check_list, expect_list, kwargs", (
+        ([], [], {}),
+        ([1, 2, 2, "a"], ["a", 2, 1, 2], {}),
+        ([{"a": [1, 2]}, None, {"b": 1}], [{"b": 1.0}, {"a": [1, 2]}, None], {}),
+        ([[1, 2], [3, [4, 5]]], [[[5, 4], 3], [2, 1]], {}),
+        ([{"id": 1, "x": 1}, {"id": 2, "x": 2}], [{"id": 2}, {"id": 1}], {"check_key": "id"}),
+        ([{"id": 1, "n": "a"}, {"id": 2, "n": "b"}], [{"id": 2, "n": "b"}, {"id": 1, "n": "a", "x": 0}],
+         {"check_key": ["id", "n"]}),
+        ([[0, "a"], [1, "b"]], [[1, "c"], [0, "d"]], {"check_key": 0}),
+    ))
+    def test_equals_ignore_order(self, check_list, expect_list, kwargs):
+        built_in.equals_ignore_order(check_list, expect_list, **kwargs)
+
+    @pytest.mark.parametrize("check_list, expect_list, kwargs, missing, extra", (
+        ([1, 2, 2], [1, 1, 2], {}, "[1]", "[2]"),
+        ([1, 2], [1, 2, 3], {}, "[3]", "[]"),
+        ([{"a": [1, 2]}], [{"a": [2, 1]}], {}, "[{'a': [2, 1]}]", "[{'a': [1, 2]}]"),
+        ([{"id": 1, "n": "a"}], [{"id": 1, "n": "b"}], {"check_key": ["id", "n"]}, "[(1, 'b')]", "[(1, 'a')]"),
+        ([{"id": 1, "n": "a"}], [{"id": 2, "n": "a"}], {"check_key": "id"}, "[2]", "[1]"),
+    ))
+    def test_equals_ignore_order_differences(self, check_list, expect_list, kwargs, missing, extra):
+        with pytest.raises(AssertionError) as e:
+            built_in.equals_ignore_order(check_list, expect_list, **kwargs)
+
+        assert "Missing from check list: {}, extra in check list: {}".format(missing, extra) in str(e.value)
+
+    def test_equals_ignore_order_missing_check_key(self):
+        with pytest.raises(AssertionError) as e:
+            built_in.equals_ignore_order([{"id": 1}], [{"x": 1}], check_key="id")
+
+        assert "not found id in {'x': 1} in expect list" in str(e.value)
+
+    @pytest.fixture(name="items")
+    def fix_items(self):
+        return [{"id": i, "name": "item {}".format(i), "tags": [i]} for i in range(10)] + [{"other": 1}]
+
+    @pytest.mark.parametrize("check_value, kwargs", (
+        ({"id": 3, "name": "wrong"}, {"unique_key": "id"}),
+        (3, {"check_key": "id"}),
+        ([3], {"check_key": "tags"}),
+        ({"id": 3, "name": "item 3"}, {"check_key": ["id", "name"]}),
+        ({"id": 3, "name": "item 3", "tags": [3]}, {}),
+        ({"other": 1}, {}),
+    ))
+    def test_list_contains(self, items, check_value, kwargs):
+        built_in.list_contains_with_items(items, check_value, **kwargs)
+
+        with pytest.raises(AssertionError):
+            built_in.list_not_contains_with_items(items, check_value, **kwargs)
+
+    @pytest.mark.parametrize("check_value, kwargs", (
+        ({"id": 30}, {"unique_key": "id"}),
+        (30, {"check_key": "id"}),
+        ("3", {"check_key": "id"}),
+        ({"id": 3}, {"check_key": ["id", "name"]}),
+        ({"id": 3, "name": "item 3", "tags": [4]}, {}),
+    ))
+    def test_list_not_contains(self, items, check_value, kwargs):
+        built_in.list_not_contains_with_items(items, check_value, **kwargs)
+
+        with pytest.raises(AssertionError):
+            built_in.list_contains_with_items(items, check_value, **kwargs)
+
+    def test_list_contains_index_reused(self, items):
+        built_in.clear_list_indexes()
+
+        for i in range(10):
+            built_in.list_contains_with_items(items, i, check_key="id")
+        built_in.list_contains_with_items(items, "item 1", check_key="name")
+
+        assert built_in.get_list_index_cache().stats()["misses"] == 2
+        assert built_in.get_list_index_cache().stats()["hits"] == 9
+
+        items.append({"id": 10})
+        built_in.list_contains_with_items(items, 10, check_key="id")
+
+    def test_list_indexes_per_thread(self, items):
+        """Verifying a response in another thread doesn't clear the indexes
+        for this one"""
+        built_in.clear_list_indexes()
+        built_in.list_contains_with_items(items, 1, check_key="id")
+
+        thread = threading.Thread(target=built_in.clear_list_indexes)
+        thread.start()
+        thread.join()
+
+        built_in.list_contains_with_items(items, 2, check_key="id")
+
+        assert built_in.get_list_index_cache().stats()["misses"] == 1
+        assert built_in.get_list_index_cache().stats()["hits"] == 1
+
+    def test_list_contains_batch(self, items):
+        built_in.list_contains_all_items(items, [1, 2, 3], check_key="id")
+        built_in.list_not_contains_any_items(items, [10, 11], check_key="id")
+
+        with pytest.raises(AssertionError) as e:
+            built_in.list_contains_all_items(items, [1, 20, 3, 30], check_key="id")
+        assert str(e.value).startswith("[20, 30] not found in")
+
+        with pytest.raises(AssertionError) as e:
+            built_in.list_not_contains_any_items(items, [20, 3, 30, 4], check_key="id")
+        assert str(e.value).startswith("[3, 4] found in")
+
+    def test_list_contains_unhashable(self):
+        check_list = [bytearray(b"a"), {"a": bytearray(b"b")}]
+
+        built_in.list_contains_with_items(check_list, bytearray(b"a"))
+        built_in.list_contains_with_items(check_list, bytearray(b"b"), check_key="a")
+        built_in.list_not_contains_with_items(check_list, bytearray(b"c"))
+
+    def test_equals_ignore_order_unhashable(self):
+        built_in.equals_ignore_order([bytearray(b"a"), 1, bytearray(b"a")], [bytearray(b"a"), bytearray(b"a"), 1])
+
+        with pytest.raises(AssertionError):
+            built_in.equals_ignore_order([bytearray(b"a"), 1], [bytearray(b"a"), bytearray(b"a")])
+
+
+class TestComparatorManager:
+
+    @pytest.fixture(name="manager")
+    def fix_manager(self):
+        with patch("tavern.util.comparator_util.stevedore.ExtensionManager", return_value=Mock(extensions=[])):
+            yield ComparatorManager()
+
+    def test_built_in_aliases(self, manager):
+        for name, aliases in _built_in_aliases:
+            for alias in aliases:
+                assert manager.get_comparator(alias) is getattr(built_in, name)
+
+    def test_unknown_alias(self, manager):
+        with pytest.raises(exceptions.InvalidBuildInComparatorError):
+            manager.get_comparator("sort_of_equals")
+
+    def test_add_comparator(self, manager):
+        def comparator(check_value, expect_value):
+            pass
+
+        manager.add_comparator(["abc", "def"], comparator)
+
+        assert manager.get_comparator("abc") is comparator
+        assert manager.get_comparator("def") is comparator
+
+    def test_add_duplicate(self, manager):
+        manager.add_comparator("abc", Mock())
+
+        with pytest.raises(exceptions.DuplicateAliasError):
+            manager.add_comparator("abc", Mock())
+
+    def test_add_built_in_alias(self, manager):
+        with pytest.raises(exceptions.DuplicateAliasError):
+            manager.add_comparator("eq", Mock())
+
+    def test_bad_alias_type(self, manager):
+        with pytest.raises(exceptions.InvalidAliasTypeError):
+            manager.add_comparator(1, Mock())
+
+    def test_entry_point(self):
+        comparator = Mock()
+        ext = Mock(plugin=comparator, entry_point="approx = mypackage:approx")
+        ext.name = "approx"
+
+        with patch("tavern.util.comparator_util.stevedore.ExtensionManager",
+                   return_value=Mock(extensions=[ext])) as pmock:
+            manager = ComparatorManager()
+            assert manager.get_comparator("approx") is comparator
+            assert manager.get_comparator("eq") is built_in.equals
+
+        assert pmock.call_args[1]["namespace"] == "tavern_comparators"
+
+
+class TestLRUCache:
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+
+        cache.get_or_create("a", lambda: 1)
+        cache.get_or_create("b", lambda: 2)
+        # Use a again so b is evicted instead
+        assert cache.get_or_create("a", lambda: None) == 1
+        cache.get_or_create("c", lambda: 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats() == {
+            "hits": 1,
+            "misses": 3,
+            "evictions": 1,
+            "size": 2,
+            "maxsize": 2,
+        }
+
+    def test_error_not_cached(self):
+        cache = LRUCache(2)
+
+        def create():
+            raise ValueError
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                cache.get_or_create("a", create)
+
+        assert not cache
+        assert cache.misses == 2
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.get_or_create("a", lambda: 1)
+        cache.clear()
+
+        assert not cache
+        assert cache.stats()["misses"] == 0
+
+    def test_shared_between_threads(self):
+        cache = LRUCache(8)
+        keys = [i % 20 for i in range(2000)]
+
+        pool = ThreadPool(8)
+        try:
+            values = pool.map(lambda key: cache.get_or_create(key, lambda: key * 2), keys)
+        finally:
+            pool.close()
+            pool.join()
+
+        assert values == [key * 2 for key in keys]
+        stats = cache.stats()
+        assert stats["hits"] + stats["misses"] == len(keys)
+        assert stats["size"] == 8
+
+    def test_same_value_created_at_once(self):
+        """If two threads create the same value, both get the one cached
+        first"""
+        cache = LRUCache(2)
+        creating = threading.Event()
+        cached = threading.Event()
+        results = []
+
+        def slow_create():
+            creating.set()
+            cached.wait(5)
+            return "slow"
+
+        thread = threading.Thread(target=lambda: results.append(cache.get_or_create("a", slow_create)))
+        thread.start()
+        creating.wait(5)
+        results.append(cache.get_or_create("a", lambda: "fast"))
+        cached.set()
+        thread.join()
+
+        assert results == ["fast", "fast"]
+        assert len(cache) == 1
+
+
+class TestLoadResult:
+
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5]
+
+        assert percentile(values, 0) == 1
+        assert percentile(values, 50) == 3
+        assert percentile(values, 90) == pytest.approx(4.6)
+        assert percentile(values, 100) == 5
+        assert percentile([], 50) is None
+
+    def test_stats(self):
+        result = LoadResult([0.3, 0.1, 0.2], [Mock()], 2.0)
+        stats = result.stats()
+
+        assert stats["count"] == 3
+        assert stats["errors"] == 1
+        assert stats["throughput"] == 1.5
+        assert stats["mean"] == pytest.approx(0.2)
+        assert stats["p50"] == 0.2
+        assert stats["max"] == 0.3
+
+    def test_check_slo(self):
+        result = LoadResult([0.1] * 9 + [1.0], [], 1.0)
+
+        assert result.check_slo({"p50": 0.5}) == []
+        assert len(result.check_slo({"p99": 0.5, "max": 0.5})) == 2
+
+    def test_any_error_fails_by_default(self):
+        result = LoadResult([0.1] * 100, [Mock()], 1.0)
+
+        assert len(result.check_slo({})) == 1
+        assert result.check_slo({"error_rate": 0.01}) == []
+
+
+class TestLogUtils:
+
+    def test_truncate(self):
+        assert truncate("abcdef", 10) == "abcdef"
+        assert truncate("abcdef", 4) == "abcd... (2 more characters)"
+        assert truncate("abcdef", 0) == "abcdef"
+
+    def test_preview_bytes(self):
+        assert preview_bytes(b"abcdef", limit=10) == "abcdef"
+        assert preview_bytes(b"abcdef", limit=4) == "abcd... (2 more bytes)"
+
+    def test_truncated_is_lazy(self):
+        value = Mock()
+        value.__str__ = Mock(return_value="abc")
+
+        truncated = Truncated(value)
+        assert not value.__str__.called
+
+        assert str(truncated) == "abc"
+
+
+class TestExtFunctionCache:
+
+    def test_import_cached(self):
+        first = import_ext_function("tavern.util.built_in:equals")
+        assert import_ext_function("tavern.util.built_in:equals") is first
+        assert ext_function_cache.hits == 1
+
+    def test_import_error_not_cached(self):
+        for _ in range(2):
+            with pytest.raises(exceptions.InvalidExtFunctionError):
+                import_ext_function("tavern.util.built_in:not_a_function")
+
+        assert ext_function_cache.misses == 2
+        assert not ext_function_cache
+
+    def test_wrapped_cached(self):
+        ext = {
+            "function": "random_string",
+            "extra_args": [4],
+            "extra_kwargs": {"prefix": "abc"},
+        }
+
+        first = get_wrapped_create_function(ext)
+        assert get_wrapped_create_function(copy.deepcopy(ext)) is first
+
+        ext["extra_args"] = [True]
+        assert get_wrapped_create_function(ext) is not first
+
+    def test_wrapped_keeps_own_args(self):
+        ext = {
+            "function": "random_string",
+            "extra_kwargs": {"prefix": "abc"},
+        }
+
+        fn = get_wrapped_create_function(ext)
+        ext["extra_kwargs"]["prefix"] = "def"
+
+        assert fn().startswith("abc")
+
+    def test_wrapped_unhashable_args(self):
+        ext = {
+            "function": "random_string",
+            "extra_args": [4, {1, 2}],
+        }
+
+        assert get_wrapped_create_function(ext) is not get_wrapped_create_function(ext)
+        assert not wrapped_function_cache
+
+
+class TestJsonSchemaValidators:
+
+    @pytest.fixture(autouse=True)
+    def clear_validators(self):
+        jsonschema_util.validator_cache.clear()
+        yield
+        jsonschema_util.jsonschema_settings.backend = "jsonschema"
+
+    @pytest.fixture(name="schema")
+    def fix_schema(self):
+        return {
+            "type": "object",
+            "properties": {
+                "a": {"type": "integer"},
+                "b": {"type": "string", "format": "ipv4"},
+            },
+            "required": ["a"],
+        }
+
+    def test_validator_reused(self, schema):
+        for _ in range(3):
+            jsonschema_validation({"a": 1}, schema)
+
+        with pytest.raises(jsonschema.exceptions.ValidationError):
+            jsonschema_validation({"a": "1"}, schema)
+
+        assert jsonschema_util.validator_cache.by_identity.stats()["hits"] == 3
+        assert jsonschema_util.validator_cache.by_content.stats()["misses"] == 1
+
+    def test_same_contents_reused(self, schema):
+        jsonschema_validation({"a": 1}, schema)
+        jsonschema_validation({"a": 1}, copy.deepcopy(schema))
+
+        assert jsonschema_util.validator_cache.by_identity.stats()["misses"] == 2
+        assert jsonschema_util.validator_cache.by_content.stats()["hits"] == 1
+
+    def test_different_types_not_reused(self):
+        jsonschema_validation(1, {"enum": [1]})
+
+        with pytest.raises(jsonschema.exceptions.ValidationError):
+            jsonschema_validation(1, {"enum": [True]})
+
+    def test_invalid_schema_not_cached(self):
+        for _ in range(2):
+            with pytest.raises(jsonschema.exceptions.SchemaError):
+                jsonschema_validation(1, {"type": "not a type"})
+
+        assert not jsonschema_util.validator_cache.by_identity
+
+    def test_check_formats(self, schema):
+        jsonschema_validation({"a": 1, "b": "abc"}, schema)
+
+        with pytest.raises(jsonschema.exceptions.ValidationError):
+            jsonschema_validation({"a": 1, "b": "abc"}, schema, check_formats=True)
+
+    def test_resolved_refs(self):
+        from jsonref import JsonRef
+
+        def load():
+            return JsonRef.replace_refs({
+                "definitions": {
+                    "id": {"type": "integer"},
+                },
+                "properties": {
+                    "a": {"$ref": "#/definitions/id"},
+                    "b": {"type": "array", "items": {"$ref": "#/definitions/id"}},
+                },
+            })
+
+        jsonschema_validation({"a": 1, "b": [2]}, load())
+        jsonschema_validation({"a": 1}, load())
+
+        with pytest.raises(jsonschema.exceptions.ValidationError):
+            jsonschema_validation({"b": ["2"]}, load())
+
+        assert jsonschema_util.validator_cache.by_content.stats()["hits"] == 2
+
+    @pytest.mark.skipif(jsonschema_util.fastjsonschema is None, reason="fastjsonschema not installed")
+    def test_fastjsonschema(self, schema):
+        jsonschema_util.jsonschema_settings.backend = "fastjsonschema"
+
+        jsonschema_validation({"a": 1}, schema)
+
+        with pytest.raises(jsonschema.exceptions.ValidationError) as e:
+            jsonschema_validation({"a": "1"}, schema)
+
+        assert isinstance(e.value.__cause__, jsonschema_util.fastjsonschema.JsonSchemaValueException)
+
+    def test_fastjsonschema_not_installed(self, schema):
+        jsonschema_util.jsonschema_settings.backend = "fastjsonschema"
+
+        with patch.object(jsonschema_util, "fastjsonschema", None):
+            with pytest.raises(jsonschema.exceptions.ValidationError):
+                jsonschema_validation({"a": "1"}, schema)
+
 
 class TestDictMerge:
 
@@ -351,6 +859,53 @@ class TestDictMerge:
         }
 
 
+class TestCopyVariables:
+
+    def test_copy_nested(self):
+        original = {
+            "a": [{"b": 1, "c": [1.5, None, True]}],
+            "d": ("e", {"f": "g"}),
+        }
+
+        copied = copy_variables(original)
+
+        assert copied == original
+        assert copied is not original
+        assert copied["a"] is not original["a"]
+        assert copied["a"][0] is not original["a"][0]
+        assert copied["a"][0]["c"] is not original["a"][0]["c"]
+        assert copied["d"][1] is not original["d"][1]
+
+        copied["a"][0]["c"].append(2)
+        copied["d"][1]["f"] = "h"
+        assert original["a"][0]["c"] == [1.5, None, True]
+        assert original["d"][1]["f"] == "g"
+
+    def test_copy_loaded_yaml(self):
+        original = yaml.load(dedent("""
+            a:
+              b: [1, 2]
+            """), Loader=IncludeLoader)
+
+        copied = copy_variables(original)
+
+        assert copied == original
+        assert type(copied) is type(original)
+        assert type(copied["a"]["b"]) is type(original["a"]["b"])
+        assert copied.start_mark is original.start_mark
+        assert copied["a"]["b"] is not original["a"]["b"]
+
+    def test_other_types_deep_copied(self):
+        original = {"tavern": Box({"env_vars": {"a": "b"}})}
+
+        copied = copy_variables(original)
+
+        assert isinstance(copied["tavern"], Box)
+        assert copied["tavern"] == original["tavern"]
+        assert copied["tavern"] is not original["tavern"]
+        assert copied["tavern"].env_vars is not original["tavern"].env_vars
+
+
 class TestMatchRecursive:
 
     def test_match_dict(self):
@@ -478,6 +1033,62 @@ class TestMatchRecursive:
         with pytest.raises(exceptions.KeyMismatchError):
             check_keys_match_recursive(a, b, [])
 
+    def test_collect_all(self):
+        a = {
+            "a": [{"b": 1}, {"b": 2}, {"b": ANYTHING}],
+            "c": "val",
+            "d": {"e": [1, 2]},
+        }
+        b = copy.deepcopy(a)
+        b["a"][0]["b"] = 10
+        b["a"][2]["b"] = "anything"
+        b["c"] = "wrong"
+        b["d"]["e"].append(3)
+
+        with pytest.raises(exceptions.KeyMismatchError) as e:
+            check_keys_match_recursive(a, b, ["body"], collect_all=True)
+
+        msg = str(e.value)
+        assert msg.startswith("3 mismatches:")
+        assert msg.index('actual["body"]["a"]["0"]["b"] = \'10\'') < \
+            msg.index('actual["body"]["c"] = \'wrong\'') < \
+            msg.index('actual["body"]["d"]["e"]')
+
+        with pytest.raises(exceptions.KeyMismatchError) as e:
+            check_keys_match_recursive(a, b, ["body"])
+        assert str(e.value).startswith("Key mismatch: (expected[\"body\"][\"a\"][\"0\"][\"b\"]")
+
+    def test_not_strict(self):
+        a = {"a": {"b": 1}}
+        b = {"a": {"b": 1, "c": 2}, "d": 3}
+
+        check_keys_match_recursive(a, b, [], strict=False)
+
+        with pytest.raises(exceptions.KeyMismatchError):
+            check_keys_match_recursive(a, b, [])
+
+        with pytest.raises(exceptions.KeyMismatchError):
+            check_keys_match_recursive(b, a, [], strict=False)
+
+    def test_type_sentinels(self):
+        a = {"a": loader.IntSentinel(), "b": [loader.StrSentinel()]}
+
+        check_keys_match_recursive(a, {"a": 1, "b": ["x"]}, [])
+
+        with pytest.raises(exceptions.KeyMismatchError):
+            check_keys_match_recursive(a, {"a": "1", "b": ["x"]}, [])
+
+    def test_equal_values_of_different_types(self):
+        check_keys_match_recursive({"a": [1, 2.0], "b": pytest.approx(0.3)}, {"a": [1.0, 2], "b": 0.1 + 0.2}, [])
+
+    def test_deep_nesting(self):
+        a = b = "val"
+        for i in range(5000):
+            a = {"a": [a, i]}
+            b = {"a": [b, i]}
+
+        check_keys_match_recursive(a, b, [])
+
 
 @pytest.fixture(name="test_yaml")
 def fix_test_yaml():
@@ -592,6 +1203,206 @@ class TestIncludeLoader:
         yaml.load(text, Loader=IncludeLoader)
 
 
+CIncludeLoader = getattr(loader, "CIncludeLoader", None)
+
+
+@pytest.mark.skipif(CIncludeLoader is None, reason="libyaml not available")
+class TestCIncludeLoader:
+
+    def test_used_if_available(self):
+        assert IncludeLoader is CIncludeLoader
+
+    def test_same_as_pure_loader(self):
+        init_path_loader()
+        text = dedent("""
+        a: &anchor
+            b: !int "{c}"
+            d: !anything
+            e: !approx 1.5
+            f: !bool "true"
+            g: !raw "{h}"
+            i: !anyint
+            j: [1, "k", null]
+        l: !include /aschema.yaml
+        m: !resolve_reflink /aschema.json
+        """)
+
+        pure = yaml.load(text, Loader=PureIncludeLoader)
+        fast = yaml.load(text, Loader=CIncludeLoader)
+
+        assert pure["a"]["b"].value == fast["a"]["b"].value
+        assert fast["a"]["d"] is ANYTHING
+        assert fast["a"]["e"] == pure["a"]["e"] == 1.5
+        assert fast["a"]["f"] is True
+        assert fast["a"]["g"] == pure["a"]["g"]
+        assert isinstance(fast["a"]["i"], type(pure["a"]["i"]))
+        assert fast["a"]["j"] == pure["a"]["j"]
+        assert fast["l"] == pure["l"]
+        assert fast["m"] == pure["m"]
+
+        # Source marks used for error reporting
+        for key in ["a", "l"]:
+            assert fast[key].start_mark.line == pure[key].start_mark.line
+            assert fast[key].end_mark.line == pure[key].end_mark.line
+
+    def test_anchors_across_documents(self):
+        text = dedent("""
+        ---
+        a: &anchor
+            b: c
+        ---
+        d: *anchor
+        """)
+
+        loaded = list(yaml.load_all(text, Loader=CIncludeLoader))
+
+        assert loaded[1]["d"] == {"b": "c"}
+
+    def test_constructors_shared(self):
+        assert CIncludeLoader.yaml_constructors is PureIncludeLoader.yaml_constructors
+        assert "!include" in CIncludeLoader.yaml_constructors
+
+
+class TestSpecCache:
+
+    @pytest.fixture(name="spec_files")
+    def fix_spec_files(self, tmpdir):
+        tmpdir.join("included.yaml").write(dedent("""
+        variables:
+            a: b
+        """))
+        tmpdir.join("stage_test.yaml").write(dedent("""
+        name: test
+        includes:
+          - !include included.yaml
+        stages:
+          - name: stage
+            request:
+                json:
+                    a: !int "{a}"
+            response:
+                validate:
+                  - eq: ["{body}", !anything ]
+        """))
+
+        return tmpdir
+
+    def _load(self, spec_files):
+        cache = SpecCache(yaml_loader)
+        cache.cache_dir = str(spec_files.join(".tavern_cache"))
+
+        # Files loaded with yaml_loader are kept in memory as well
+        with patch.object(yaml_loader, "store", {}):
+            spec = cache(str(spec_files.join("stage_test.yaml")))
+
+        return cache, spec
+
+    def test_disabled_by_default(self, spec_files):
+        cache = SpecCache(yaml_loader)
+
+        with patch.object(yaml_loader, "store", {}):
+            cache(str(spec_files.join("stage_test.yaml")))
+
+        assert not spec_files.join(".tavern_cache").exists()
+        assert cache.misses == 0
+
+    def test_cache_hit(self, spec_files):
+        cache, spec = self._load(spec_files)
+        assert (cache.hits, cache.misses) == (0, 1)
+
+        with patch.object(yaml_loader, "load_yaml_file") as pmock:
+            cache, cached_spec = self._load(spec_files)
+
+        assert not pmock.called
+        assert (cache.hits, cache.misses) == (1, 0)
+
+        assert cached_spec["includes"] == spec["includes"]
+        stage = cached_spec["stages"][0]
+        assert isinstance(stage["request"]["json"]["a"], IntToken)
+        assert stage["request"]["json"]["a"].value == "{a}"
+        assert stage["response"]["validate"][0]["eq"][1] is ANYTHING
+        # Source marks are still available for error reporting
+        assert stage.start_mark.line == spec["stages"][0].start_mark.line
+
+    def test_invalidated_by_include(self, spec_files):
+        self._load(spec_files)
+
+        spec_files.join("included.yaml").write(dedent("""
+        variables:
+            a: changed
+        """))
+
+        cache, spec = self._load(spec_files)
+
+        assert cache.invalidations == 1
+        assert spec["includes"][0]["variables"]["a"] == "changed"
+
+    def test_stats(self, spec_files):
+        self._load(spec_files)
+        cache, _ = self._load(spec_files)
+
+        # Counts from a worker process
+        cache.add_stats({"hits": 2, "misses": 1, "invalidations": 1})
+
+        assert cache.stats() == {"hits": 3, "misses": 1, "invalidations": 1}
+
+        cache.reset_stats()
+        assert cache.stats() == {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def test_uuid_not_cached(self, spec_files):
+        spec_files.join("included.yaml").write(dedent("""
+        variables:
+            a: !uuid
+        """))
+
+        _, first = self._load(spec_files)
+        cache, second = self._load(spec_files)
+
+        assert cache.hits == 0
+        assert first["includes"][0]["variables"]["a"] != second["includes"][0]["variables"]["a"]
+
+    def test_concurrent_loads(self, tmpdir):
+        """Setups loaded at the same time each get their own includes as
+        dependencies"""
+        tmpdir.join("shared.yaml").write("shared: 1\n")
+        for i in range(6):
+            tmpdir.join("own_{}.yaml".format(i)).write("own: {}\n".format(i))
+            tmpdir.join("stage_setup_{}.yaml".format(i)).write(dedent("""
+            name: setup {0}
+            includes:
+              - !include shared.yaml
+              - !include own_{0}.yaml
+            """.format(i)))
+
+        # !include uses yaml_loader, so use it with nothing loaded yet
+        loader = yaml_loader
+        cache = SpecCache(loader)
+        cache.cache_dir = str(tmpdir.join(".tavern_cache"))
+        load_yaml_file = loader.load_yaml_file
+
+        def slow_load_yaml_file(stream, **kwargs):
+            # Give other threads a chance to start loading in the middle
+            time.sleep(0.01)
+            return load_yaml_file(stream, **kwargs)
+
+        paths = [str(tmpdir.join("stage_setup_{}.yaml".format(i))) for i in range(6)]
+
+        pool = ThreadPool(6)
+        try:
+            with patch.multiple(loader, store={}, _dependencies={}, _uncacheable=set(),
+                                load_yaml_file=slow_load_yaml_file):
+                specs = pool.map(cache, paths)
+                dependencies = [loader.get_dependencies(path) for path in paths]
+        finally:
+            pool.close()
+            pool.join()
+
+        for i, (path, spec) in enumerate(zip(paths, specs)):
+            assert spec["includes"] == [{"shared": 1}, {"own": i}]
+            assert dependencies[i] == ({path, str(tmpdir.join("shared.yaml")),
+                                        str(tmpdir.join("own_{}.yaml".format(i)))}, True)
+
+
 class TestFormatKeys:
     def test_format_with_extention(self):
         to_format = {
@@ -694,3 +1505,197 @@ class TestFormatKeys:
         assert formatted_value["a7"] == 1
         assert formatted_value["a8"]
         assert formatted_value["a9"] == "this is {'formatted': 1, 'formatted_bool': True}"
+
+
+@pytest.fixture(name="parity_variables")
+def fix_parity_variables():
+    return {
+        "a": "abc",
+        "b": {
+            "formatted": 1,
+            "formatted_bool": True,
+            "nested": {"0": "zero", "list": [1, {"x": "y"}]},
+        },
+        "c": [1, True, {"d": "e"}],
+        "n": None,
+        "i": 123,
+    }
+
+
+class TestCompiledTemplates:
+
+    @pytest.mark.parametrize("to_format", (
+        "",
+        "plain string",
+        "{a}",
+        "{b}",
+        "{c}",
+        "{n}",
+        "{i}",
+        "{b.formatted}",
+        "{b.nested.list.1.x}",
+        "{c.-1}",
+        "{c.2.d}",
+        "this is {a}",
+        "{a} and {i}",
+        "{a}{i}{b.formatted_bool}",
+        "this is {b}",
+        "this is {c}",
+        "{n} is none",
+        "{{a}}",
+        "{{a}} but {a}",
+        "{} empty",
+        "{a} {}",
+        "}{ odd braces",
+        "{a",
+        "multi\nline {a}\n{i}",
+    ))
+    def test_string_parity(self, to_format, parity_variables):
+        """Compiled strings format the same way as format_string"""
+        expected = format_string(to_format, Box(parity_variables))
+        actual = compile_template(to_format).render(parity_variables)
+
+        assert actual == expected
+        # Not formatted into Box objects any more, but should compare equal
+        if not isinstance(expected, (Box, BoxList)):
+            assert type(actual) == type(expected)  # pylint: disable=unidiomatic-typecheck
+
+    @pytest.mark.parametrize("to_format", (
+        "{missing}",
+        "this is {missing}",
+        "{b.missing}",
+        "{b.nested.0}",
+        "{ a}",
+        "{c.10}",
+    ))
+    def test_missing_parity(self, to_format, parity_variables):
+        with pytest.raises((KeyError, IndexError)):
+            format_string(to_format, Box(parity_variables))
+
+        with pytest.raises(exceptions.MissingFormatError):
+            compile_template(to_format).render(parity_variables)
+
+    def test_nested_structures(self, parity_variables):
+        to_format = {
+            "{a}": ["{i}", ("x {a}", 4), None],
+            "k": {"k2": "{b.nested.list.0}", 5: 5.5},
+        }
+
+        formatted = compile_template(to_format).render(parity_variables)
+
+        assert formatted == {
+            "abc": [123, ["x abc", 4], None],
+            "k": {"k2": 1, 5: 5.5},
+        }
+
+    def test_type_convert_token(self, parity_variables):
+        to_format = yaml.load("""
+        a: !int "{i}"
+        b: !float "{b.formatted}"
+        c: !bool "{b.nested.list.1.x}"
+        """, Loader=IncludeLoader)
+
+        formatted = compile_template(to_format).render(parity_variables)
+
+        assert formatted == {"a": 123, "b": 1.0, "c": True}
+
+    @pytest.mark.parametrize("to_format, expected", (
+        ("{jmes:b.nested.list[1].x}", "y"),
+        ("{jmes:length(b.nested.list)}", 2),
+        ("{jmes:b.nested.list[?x].x | [0]}", "y"),
+        ("n={jmes:b.nested.list[0]} {a}", "n=1 abc"),
+        ("{jmes:b.missing}", None),
+        ("{{jmes:b.missing}}", "{jmes:b.missing}"),
+    ))
+    def test_jmes_placeholder(self, to_format, expected, parity_variables):
+        assert format_keys(to_format, parity_variables) == expected
+
+    def test_invalid_jmes_placeholder(self, parity_variables):
+        with pytest.raises(exceptions.JMESError):
+            format_keys("{jmes:b.[}", parity_variables)
+
+    def test_string_templates_reused(self):
+        assert compile_template("abc {def}") is compile_template("abc {def}")
+
+    def test_spec_templates_reused(self):
+        """The template for a part of a spec is cached on the spec object"""
+        spec = {"a": "{b}", "c": ["{d}"]}
+
+        with patch("tavern.util.dict_util._compile_value", wraps=dict_util._compile_value) as cmock:
+            assert format_keys(spec, {"b": 1, "d": 2}) == {"a": 1, "c": [2]}
+            compiled = cmock.call_count
+            assert format_keys(spec, {"b": 3, "d": 4}) == {"a": 3, "c": [4]}
+
+        assert cmock.call_count == compiled
+        assert compile_template(spec) is compile_template(spec)
+        assert compile_template(spec) is not compile_template(dict(spec))
+
+    def test_spec_template_compiled_again_if_resized(self):
+        spec = {"a": "{b}"}
+        assert format_keys(spec, {"b": 1, "d": 2}) == {"a": 1}
+
+        spec["c"] = "{d}"
+        assert format_keys(spec, {"b": 1, "d": 2}) == {"a": 1, "c": 2}
+
+    @pytest.mark.parametrize("change, expected", (
+        (lambda spec: spec.update(a="{d}"), {"a": 2, "n": 1, "c": [{"e": 1}]}),
+        (lambda spec: spec["c"][0].update(f="{d}"), {"a": 1, "n": 1, "c": [{"e": 1, "f": 2}]}),
+        (lambda spec: spec.update(n=True), {"a": 1, "n": True, "c": [{"e": 1}]}),
+    ))
+    def test_spec_template_compiled_again_if_changed(self, change, expected):
+        """Changes which don't alter the size of the spec are noticed too"""
+        spec = {"a": "{b}", "n": 1, "c": [{"e": 1}]}
+        assert format_keys(spec, {"b": 1, "d": 2}) == {"a": 1, "n": 1, "c": [{"e": 1}]}
+
+        change(spec)
+        formatted = format_keys(spec, {"b": 1, "d": 2})
+        assert formatted == expected
+        assert type(formatted["n"]) is type(expected["n"])
+
+    def test_empty_spec_templates_not_cached(self):
+        dict_util.spec_templates.clear()
+        format_keys([], {})
+        format_keys({}, {})
+        assert not dict_util.spec_templates
+
+    def test_render_different_variables(self):
+        template = compile_template({"a": "{b}"})
+
+        assert template.render({"b": 1}) == {"a": 1}
+        assert template.render({"b": 2}) == {"a": 2}
+
+    def test_literal_subtrees_shared(self):
+        """Anything which doesn't need formatting is reused, not copied"""
+        literal_dict = {"x": [1, 2, {"y": "z"}]}
+        literal_list = ["a", {"b": None}]
+        to_format = {
+            "literal_dict": literal_dict,
+            "literal_list": literal_list,
+            "formatted": {"c": "{c}", "d": literal_dict},
+        }
+
+        formatted = format_keys(to_format, {"c": 1})
+
+        assert formatted is not to_format
+        assert formatted["literal_dict"] is literal_dict
+        assert formatted["literal_list"] is literal_list
+        assert formatted["formatted"] is not to_format["formatted"]
+        assert formatted["formatted"]["d"] is literal_dict
+        assert formatted["formatted"]["c"] == 1
+
+    def test_nothing_to_format_returns_input(self):
+        to_format = {"a": ["b", 1, None, {"c": True}]}
+
+        assert format_keys(to_format, {}) is to_format
+
+    @pytest.mark.parametrize("to_format", (
+        {"a": {"$ext": {"function": "random_string"}}},
+        {"a": [{"b": "{b}"}]},
+        {"a": ("b",)},
+    ))
+    def test_not_shared_if_formatted(self, to_format):
+        with patch("tavern.util.built_in.random_string", return_value="abc"):
+            formatted = format_keys(to_format, {"b": "abc"})
+
+        assert formatted is not to_format
+        assert formatted["a"] is not to_format["a"]